@@ -0,0 +1,199 @@
+# Admission control
+# Every request is put in a cost class by endpoint. Each class has token buckets per
+# logged-in user and per client IP, and a share of the process's in-flight request
+# slots: when the process is busy, low-priority classes (expensive reads, demo
+# creation) are shed first so mood saves keep getting through. Rejections are 429
+# (a bucket is empty) or 503 (shed under load), both with Retry-After.
+#
+# Buckets live in process memory, or in a SQLite file (ADMISSION_STORE_DB) shared by
+# every worker on the machine.
+
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Flask endpoint -> cost class; anything unlisted is 'cheap'
+ENDPOINT_CLASSES = {
+    'save_mood': 'write',
+    'dashboard': 'read',
+    'mood_analytics': 'read',
+    'export_entries': 'expensive',
+    'import_entries': 'expensive',
+    'create_demo': 'expensive',
+    'login': 'auth',
+    'register': 'auth',
+}
+
+# Per class: share of in-flight slots it may use, and (tokens per second, burst)
+# buckets per user and per IP (None = no bucket of that kind)
+CLASS_LIMITS = {
+    'write': {'share': 1.0, 'user': (1.0, 20), 'ip': (5.0, 60)},
+    'cheap': {'share': 1.0, 'user': None, 'ip': (20.0, 100)},
+    'auth': {'share': 0.8, 'user': None, 'ip': (0.2, 10)},
+    'read': {'share': 0.6, 'user': (2.0, 10), 'ip': (10.0, 50)},
+    'expensive': {'share': 0.3, 'user': (0.05, 3), 'ip': (0.02, 3)},
+}
+
+
+class MemoryStore:
+    def __init__(self, max_keys=100000, clock=time.time):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost=1.0):
+        """Spend `cost` tokens; returns 0 if admitted, else seconds until there are enough"""
+        now = self.clock()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+class SQLiteStore:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        with self._connect() as shared:
+            shared.execute("""
+            CREATE TABLE IF NOT EXISTS admission_buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+            """)
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+
+    def take(self, key, rate, burst, cost=1.0):
+        now = time.time()
+        shared = self._connect()
+        try:
+            # IMMEDIATE takes the write lock up front so workers can't both spend the same tokens
+            shared.execute("BEGIN IMMEDIATE")
+            row = shared.execute("SELECT tokens, updated FROM admission_buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (burst, now)
+            tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / rate
+            shared.execute("INSERT OR REPLACE INTO admission_buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                           (key, tokens, now))
+            shared.execute("COMMIT")
+            return wait
+        finally:
+            shared.close()
+
+
+class Rejected(Exception):
+    def __init__(self, status, message, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, store, max_inflight=64, limits=CLASS_LIMITS, classes=ENDPOINT_CLASSES):
+        self.store = store
+        self.max_inflight = max_inflight
+        self.limits = limits
+        self.classes = classes
+        self._inflight = 0
+        self._lock = threading.Lock()
+        self.stats = {'admitted': 0, 'throttled': 0, 'shed': 0, 'store_errors': 0}
+
+    def cost_class(self, endpoint):
+        return self.classes.get(endpoint, 'cheap')
+
+    def admit(self, endpoint, user_id=None, ip=None):
+        """Take a slot and tokens for a request, or raise Rejected; pair with release()"""
+        cost_class = self.cost_class(endpoint)
+        limits = self.limits[cost_class]
+
+        # Shed by priority before touching the buckets
+        with self._lock:
+            if self._inflight >= self.max_inflight * limits['share']:
+                self.stats['shed'] += 1
+                raise Rejected(503, 'Server is busy, please try again', 1)
+            self._inflight += 1
+
+        try:
+            for kind, subject in (('user', user_id), ('ip', ip)):
+                if subject is None or not limits[kind]:
+                    continue
+                rate, burst = limits[kind]
+                try:
+                    wait = self.store.take(f'{cost_class}:{kind}:{subject}', rate, burst)
+                except sqlite3.Error:
+                    # A broken shared store shouldn't take the API down with it
+                    with self._lock:
+                        self.stats['store_errors'] += 1
+                    continue
+                if wait:
+                    with self._lock:
+                        self.stats['throttled'] += 1
+                    raise Rejected(429, 'Too many requests, please slow down', math.ceil(wait))
+        except Rejected:
+            self.release()
+            raise
+
+        with self._lock:
+            self.stats['admitted'] += 1
+        return cost_class
+
+    def release(self):
+        with self._lock:
+            self._inflight -= 1
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['inflight'] = self._inflight
+        stats['max_inflight'] = self.max_inflight
+        stats['shared_store'] = isinstance(self.store, SQLiteStore)
+        return stats
+
+
+def rejection_response(rejected):
+    from flask import jsonify
+    response = jsonify({'error': rejected.message})
+    response.status_code = rejected.status
+    response.headers['Retry-After'] = str(rejected.retry_after)
+    return response
+
+
+def init_app(app, controller):
+    """Check every request against the controller before its view runs"""
+    from flask import g, request, session
+
+    @app.before_request
+    def admit_request():
+        # CORS preflights are free
+        if request.method == 'OPTIONS':
+            return None
+        try:
+            controller.admit(request.endpoint, session.get('user_id'), request.remote_addr)
+        except Rejected as rejected:
+            return rejection_response(rejected)
+        g.admitted = True
+        return None
+
+    @app.teardown_request
+    def release_request(error=None):
+        if g.pop('admitted', False):
+            controller.release()
@@ -0,0 +1,113 @@
+# Long-range mood analytics
+# Rows from one range query are turned into column arrays once, then every
+# statistic is computed with whole-array NumPy operations (no per-row Python loops).
+
+import numpy as np
+
+ACTIVITY_COLUMNS = ['sleep_hours', 'exercise_minutes', 'social_interaction', 'caffeine_intake', 'work_stress_level']
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+def build_columns(rows):
+    """(entry_date, mood_value, *ACTIVITY_COLUMNS) rows -> dict of arrays; missing values become NaN"""
+    count = len(rows)
+    columns = {
+        'entry_date': np.array([row[0] for row in rows], dtype='datetime64[D]').reshape(count),
+        'mood_value': np.array([row[1] for row in rows], dtype=float).reshape(count)
+    }
+    for index, name in enumerate(ACTIVITY_COLUMNS, start=2):
+        columns[name] = np.array([np.nan if row[index] is None else float(row[index]) for row in rows],
+                                 dtype=float).reshape(count)
+    return columns
+
+
+def group_means(keys, values):
+    """Mean of values per distinct key, keys returned in sorted order"""
+    unique, inverse = np.unique(keys, return_inverse=True)
+    sums = np.bincount(inverse, weights=values)
+    counts = np.bincount(inverse)
+    return unique, sums / counts, counts
+
+
+def period_averages(dates, moods, unit):
+    if unit == 'week':
+        # Monday of each ISO week (1970-01-01 was a Thursday)
+        days = dates.astype('int64')
+        keys = (days - (days + 3) % 7).astype('datetime64[D]')
+    else:
+        keys = dates.astype('datetime64[M]')
+
+    periods, means, counts = group_means(keys, moods)
+    return [{'period': str(period), 'average_mood': round(float(mean), 2), 'entries': int(count)}
+            for period, mean, count in zip(periods, means, counts)]
+
+
+def rolling_means(dates, moods, window):
+    """Mean mood over the trailing `window` calendar days, evaluated on each entry date"""
+    days = dates.astype('int64')
+    first = days[0]
+    span = days[-1] - first + 1
+
+    # Dense per-day arrays so the window is in calendar days, not entries
+    daily_sum = np.zeros(span)
+    daily_count = np.zeros(span)
+    np.add.at(daily_sum, days - first, moods)
+    np.add.at(daily_count, days - first, 1)
+
+    cum_sum = np.concatenate(([0.0], np.cumsum(daily_sum)))
+    cum_count = np.concatenate(([0.0], np.cumsum(daily_count)))
+    end = days - first + 1
+    start = np.maximum(end - window, 0)
+    means = (cum_sum[end] - cum_sum[start]) / (cum_count[end] - cum_count[start])
+
+    return [{'date': str(day), 'rolling_mean': round(float(mean), 2)} for day, mean in zip(dates, means)]
+
+
+def weekday_profile(dates, moods):
+    weekdays = (dates.astype('int64') + 3) % 7
+    sums = np.bincount(weekdays, weights=moods, minlength=7)
+    counts = np.bincount(weekdays, minlength=7)
+    profile = []
+    for day in range(7):
+        average = round(float(sums[day] / counts[day]), 2) if counts[day] else None
+        profile.append({'day_name': DAY_NAMES[day], 'average_mood': average, 'entries': int(counts[day])})
+    return profile
+
+
+def correlations(columns):
+    """Pearson r between mood and each activity, over days where both are recorded"""
+    moods = columns['mood_value']
+    results = []
+    for name in ACTIVITY_COLUMNS:
+        values = columns[name]
+        mask = ~np.isnan(values)
+        n = int(mask.sum())
+        r = None
+        if n >= 3:
+            x = values[mask] - values[mask].mean()
+            y = moods[mask] - moods[mask].mean()
+            denominator = np.sqrt((x * x).sum() * (y * y).sum())
+            if denominator > 0:
+                r = round(float((x * y).sum() / denominator), 3)
+        results.append({'activity': name, 'correlation': r, 'days': n})
+    return sorted(results, key=lambda item: -abs(item['correlation'] or 0))
+
+
+def summarize(rows, window=7):
+    """Everything the analytics endpoint returns, from rows ordered by entry_date"""
+    if not rows:
+        return {'entries': 0, 'average_mood': None, 'weekly': [], 'monthly': [], 'rolling': [],
+                'day_of_week': weekday_profile(np.array([], dtype='datetime64[D]'), np.array([])),
+                'correlations': []}
+
+    columns = build_columns(rows)
+    dates, moods = columns['entry_date'], columns['mood_value']
+    return {
+        'entries': int(moods.size),
+        'average_mood': round(float(moods.mean()), 2),
+        'weekly': period_averages(dates, moods, 'week'),
+        'monthly': period_averages(dates, moods, 'month'),
+        'rolling': rolling_means(dates, moods, window),
+        'day_of_week': weekday_profile(dates, moods),
+        'correlations': correlations(columns)
+    }
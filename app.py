@@ -1,22 +1,55 @@
-from flask import Flask, request, jsonify, session
+from flask import Flask, request, jsonify, session, Response, stream_with_context, has_request_context
 from flask_cors import CORS
 import mysql.connector
-from datetime import datetime, date, timedelta
+from datetime import datetime, date, timedelta, time as time_of_day
 import requests
 import json
 import os
+import sys
 from functools import wraps
 import statistics
 import bcrypt
+import queue
+import random
+import threading
+import time
+import uuid
+import csv
+import io
+import hashlib
+import re
+import sqlite3
+from bisect import bisect_right
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from decimal import Decimal
 from dotenv import load_dotenv
+import local_sentiment
+import analytics
+import insights
+import migrations
+import instrumentation
+import admission
+
+# Optional: Arrow IPC export
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
 
 # Load settings from .env file
 load_dotenv()
 
+# Helper scripts (migrations, batch jobs) do `import app`; when this file is run
+# directly, make that import return this module instead of loading a second copy
+sys.modules.setdefault('app', sys.modules[__name__])
+
 # Create Flask app
 app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY', 'fallback-secret-key')
-CORS(app, supports_credentials=True, origins=['http://127.0.0.1:5500', 'http://localhost:5500', 'file://*'])
+CORS_ORIGINS = ['http://127.0.0.1:5500', 'http://localhost:5500', 'file://*']
+CORS(app, supports_credentials=True, origins=CORS_ORIGINS)
 
 # Database configuration
 DB_CONFIG = {
@@ -27,17 +60,734 @@ DB_CONFIG = {
     'autocommit': True
 }
 
+# Read replicas: comma-separated host[:port] list with the same credentials as DB_CONFIG.
+# Reads go to a replica that is within REPLICA_MAX_LAG seconds and has already applied
+# the user's last write; otherwise they go to the primary. To try it locally, start a
+# second mysqld on port 3307 replicating from the first (CHANGE REPLICATION SOURCE TO
+# ...; START REPLICA) and set DB_REPLICAS=127.0.0.1:3307.
+DB_REPLICAS = [host.strip() for host in os.getenv('DB_REPLICAS', '').split(',') if host.strip()]
+REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', '5'))
+REPLICA_CHECK_INTERVAL = float(os.getenv('REPLICA_CHECK_INTERVAL', '1'))
+
+# Sharding: comma-separated name=host[:port][/database] list, same credentials as DB_CONFIG.
+# A user's rows all live on one shard. The user_directory table on the main database
+# (DB_CONFIG) allocates user IDs for every shard and records where each user lives; new
+# users are placed on a consistent-hash ring of the shard names, and rebalance_shards.py
+# moves users to match the ring after shards are added. Users without a directory row
+# are on DB_SHARD_DEFAULT (the first shard unless set), so list the existing database
+# first, and run `python rebalance_shards.py --adopt` before turning sharding on.
+DB_SHARDS = [part.strip().partition('=')[::2] for part in os.getenv('DB_SHARDS', '').split(',') if part.strip()]
+DB_SHARD_DEFAULT = os.getenv('DB_SHARD_DEFAULT')
+SHARD_RING_POINTS = int(os.getenv('SHARD_RING_POINTS', '64'))
+SHARD_CACHE_TTL = float(os.getenv('SHARD_CACHE_TTL', '5'))
+
+# Cold archive: archive_entries.py moves months older than ARCHIVE_AFTER_DAYS out of the
+# monthly entry partitions into mood_archive; analytics, export and streaks read both
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '365'))
+
+# Connection pool settings
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '5'))
+DB_POOL_MAX_LIFETIME = float(os.getenv('DB_POOL_MAX_LIFETIME', '1800'))
+
+# Password hashing: BCRYPT_ROUNDS is a cost factor or 'auto' to calibrate to BCRYPT_TARGET_MS.
+# The calibrated cost is stored in the app_settings table the first time and reused by
+# every process after that; delete the 'bcrypt_rounds' row to measure again.
+BCRYPT_ROUNDS = os.getenv('BCRYPT_ROUNDS', 'auto')
+BCRYPT_TARGET_MS = float(os.getenv('BCRYPT_TARGET_MS', '250'))
+BCRYPT_WORKERS = int(os.getenv('BCRYPT_WORKERS', str(os.cpu_count() or 2)))
+BCRYPT_MAX_QUEUE = int(os.getenv('BCRYPT_MAX_QUEUE', str(BCRYPT_WORKERS * 4)))
+
 # AI API configuration
 HUGGING_FACE_API_KEY = os.getenv('HUGGING_FACE_API_KEY')
-AI_URL = "https://api-inference.huggingface.co/models/cardiffnlp/twitter-roberta-base-sentiment-latest"
+AI_URL = os.getenv('AI_URL', "https://api-inference.huggingface.co/models/cardiffnlp/twitter-roberta-base-sentiment-latest")
+AI_TIMEOUT = float(os.getenv('AI_TIMEOUT', '10'))
+
+# Sentiment engines: 'remote' (Hugging Face) or 'local' (lexicon scorer).
+# The fallback engine answers when the primary one fails; set it to 'none' to disable.
+SENTIMENT_BACKEND = os.getenv('SENTIMENT_BACKEND', 'remote')
+SENTIMENT_FALLBACK = os.getenv('SENTIMENT_FALLBACK', 'local')
+
+# Dashboard cache (set DASHBOARD_CACHE_DB to a file path to share built payloads between
+# the workers on one host). Staleness is decided by users.data_version in MySQL, unless
+# DASHBOARD_STAMPS=shared: then writes bump a per-user stamp in DASHBOARD_CACHE_DB and a
+# cached dashboard or 304 is answered without touching MySQL. Only use that when every
+# process that writes entries shares the file, i.e. a single host.
+DASHBOARD_CACHE_SIZE = int(os.getenv('DASHBOARD_CACHE_SIZE', '10000'))
+DASHBOARD_CACHE_DB = os.getenv('DASHBOARD_CACHE_DB')
+DASHBOARD_STAMPS = os.getenv('DASHBOARD_STAMPS', 'mysql')
+
+# Micro-batching of notes sent to the model
+SENTIMENT_BATCH_SIZE = int(os.getenv('SENTIMENT_BATCH_SIZE', '16'))
+SENTIMENT_BATCH_WINDOW_MS = float(os.getenv('SENTIMENT_BATCH_WINDOW_MS', '50'))
+SENTIMENT_BATCH_CONCURRENCY = int(os.getenv('SENTIMENT_BATCH_CONCURRENCY', '2'))
+
+# Sentiment latency budget and circuit breaker: a note gets SENTIMENT_BUDGET_MS in
+# total (queueing, retries and hedges included) before the fallback engine answers.
+# The breaker opens when too many recent calls fail or are slow, and while open no
+# requests go to the model at all; after BREAKER_COOLDOWN it lets a probe through.
+SENTIMENT_BUDGET_MS = float(os.getenv('SENTIMENT_BUDGET_MS', '3000'))
+SENTIMENT_RETRIES = int(os.getenv('SENTIMENT_RETRIES', '1'))
+SENTIMENT_HEDGE_MS = float(os.getenv('SENTIMENT_HEDGE_MS', '1000'))
+BREAKER_WINDOW = float(os.getenv('BREAKER_WINDOW', '30'))
+BREAKER_MIN_CALLS = int(os.getenv('BREAKER_MIN_CALLS', '10'))
+BREAKER_FAILURE_RATE = float(os.getenv('BREAKER_FAILURE_RATE', '0.5'))
+BREAKER_SLOW_MS = float(os.getenv('BREAKER_SLOW_MS', '2000'))
+BREAKER_SLOW_RATE = float(os.getenv('BREAKER_SLOW_RATE', '0.5'))
+BREAKER_COOLDOWN = float(os.getenv('BREAKER_COOLDOWN', '15'))
+
+# Background sentiment workers: they write finished scores back (notes wait for the
+# model on the batcher without holding one). Finished jobs are kept SENTIMENT_JOB_TTL seconds.
+SENTIMENT_WORKERS = int(os.getenv('SENTIMENT_WORKERS', '4'))
+SENTIMENT_JOB_TTL = float(os.getenv('SENTIMENT_JOB_TTL', '3600'))
+
+# Sentiment result cache (set SENTIMENT_CACHE_DB to a file path for a persistent tier)
+SENTIMENT_CACHE_SIZE = int(os.getenv('SENTIMENT_CACHE_SIZE', '5000'))
+SENTIMENT_CACHE_TTL = float(os.getenv('SENTIMENT_CACHE_TTL', str(30 * 24 * 3600)))
+SENTIMENT_CACHE_DB = os.getenv('SENTIMENT_CACHE_DB')
+
+# Opt-in sampling profiler: requests slower than PROFILE_SLOW_MS get their sampled
+# stacks written to PROFILE_DIR as folded stacks (feed them to flamegraph.pl or speedscope)
+PROFILE_SLOW_MS = os.getenv('PROFILE_SLOW_MS')
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+
+# Admission control: token buckets per user and IP for each cost class, and priority
+# shedding once ADMISSION_MAX_INFLIGHT requests are running (see admission.py).
+# Set ADMISSION_STORE_DB to a file path to share the buckets between workers.
+ADMISSION_CONTROL = os.getenv('ADMISSION_CONTROL', '1') == '1'
+ADMISSION_MAX_INFLIGHT = int(os.getenv('ADMISSION_MAX_INFLIGHT', '64'))
+ADMISSION_STORE_DB = os.getenv('ADMISSION_STORE_DB')
+
+# Pooled database connection - close() hands it back to the pool
+class PooledConnection:
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+        self.role = pool.role
+        self.created_at = time.monotonic()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return instrumentation.TimedCursor(self._conn.cursor(*args, **kwargs))
+
+    def close(self):
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            pool.release(self)
+
+
+# Bounded pool of warm MySQL connections
+class ConnectionPool:
+    def __init__(self, config, size=10, timeout=5.0, max_lifetime=1800.0, role='primary'):
+        self.config = config
+        self.role = role
+        self.size = size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self.stats = {
+            'checkouts': 0,
+            'timeouts': 0,
+            'created': 0,
+            'recycled': 0,
+            'dead_on_borrow': 0,
+            'in_use': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0
+        }
+
+    def _connect(self):
+        conn = mysql.connector.connect(**self.config)
+        with self._lock:
+            self.stats['created'] += 1
+        return conn
+
+    def _expired(self, pooled):
+        return self.max_lifetime and time.monotonic() - pooled.created_at > self.max_lifetime
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        """Borrow a connection, waiting up to `timeout` seconds for a free slot"""
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self.stats['timeouts'] += 1
+            raise mysql.connector.errors.PoolError(
+                f"No connection available within {self.timeout}s (pool size {self.size})")
+
+        try:
+            conn = None
+            while conn is None:
+                try:
+                    pooled = self._idle.get_nowait()
+                except queue.Empty:
+                    pooled = None
+
+                if pooled is None:
+                    conn = PooledConnection(self, self._connect())
+                elif self._expired(pooled):
+                    with self._lock:
+                        self.stats['recycled'] += 1
+                    self._discard(pooled._conn)
+                elif not pooled._conn.is_connected():
+                    with self._lock:
+                        self.stats['dead_on_borrow'] += 1
+                    self._discard(pooled._conn)
+                else:
+                    conn = PooledConnection(self, pooled._conn)
+                    conn.created_at = pooled.created_at
+        except Exception:
+            self._slots.release()
+            raise
+
+        waited = time.monotonic() - started
+        with self._lock:
+            self.stats['checkouts'] += 1
+            self.stats['in_use'] += 1
+            self.stats['wait_time_total'] += waited
+            self.stats['wait_time_max'] = max(self.stats['wait_time_max'], waited)
+        return conn
+
+    def release(self, pooled):
+        """Return a connection to the pool (or drop it if it is broken or too old)"""
+        conn = pooled._conn
+        try:
+            if self._expired(pooled):
+                with self._lock:
+                    self.stats['recycled'] += 1
+                self._discard(conn)
+            else:
+                try:
+                    if conn.in_transaction:
+                        conn.rollback()
+                    self._idle.put(pooled)
+                except Exception:
+                    self._discard(conn)
+        finally:
+            with self._lock:
+                self.stats['in_use'] -= 1
+            self._slots.release()
+
+    def warm(self, count):
+        """Open up to `count` idle connections ahead of the first requests"""
+        opened = []
+        try:
+            for _ in range(min(count, self.size)):
+                opened.append(self.acquire())
+        finally:
+            for conn in opened:
+                conn.close()
+        return len(opened)
+
+    def close_all(self):
+        """Close idle connections (e.g. before forking workers, or on shutdown)"""
+        while True:
+            try:
+                pooled = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(pooled._conn)
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats['size'] = self.size
+        stats['idle'] = self._idle.qsize()
+        stats['wait_time_avg'] = stats['wait_time_total'] / stats['checkouts'] if stats['checkouts'] else 0.0
+        return stats
+
+
+db_pool = ConnectionPool(DB_CONFIG, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT,
+                         max_lifetime=DB_POOL_MAX_LIFETIME)
+
+# Schema changes are a deploy step: run `python migrations.py` before starting the
+# new code. Some migrations rebuild whole tables (partitioning, the archive), which
+# must not happen inside a request, so AUTO_MIGRATE=1 (migrate each pool on first
+# use) is only for local development against a throwaway database.
+AUTO_MIGRATE = os.getenv('AUTO_MIGRATE', '0') == '1'
+migrated_pools = set()
+schema_lock = threading.Lock()
+
+def ensure_schema(pool, conn):
+    with schema_lock:
+        if not AUTO_MIGRATE or pool in migrated_pools:
+            return
+        cursor = conn.cursor()
+        try:
+            migrations.migrate(cursor)
+        finally:
+            cursor.close()
+        migrated_pools.add(pool)
+
+def pending_migrations():
+    """[(database, pending versions)] for the main database and each shard whose schema is behind"""
+    pools = [db_pool]
+    if shard_router:
+        pools += [pool for pool in shard_router.shards.values() if pool not in pools]
+    
+    behind = []
+    for pool in pools:
+        conn = pool.acquire()
+        cursor = conn.cursor()
+        try:
+            pending = migrations.pending_versions(cursor)
+        finally:
+            cursor.close()
+            conn.close()
+        if pending:
+            behind.append((f"{pool.config['host']}/{pool.config['database']}", pending))
+    return behind
+
+# Replica selection, lag monitoring and read-your-writes bookkeeping.
+# A background thread stamps a heartbeat row on the primary every interval and reads
+# it back from each replica: the newest stamp a replica has applied says both how far
+# behind it is and which writes it is guaranteed to have.
+class ReplicaRouter:
+    def __init__(self, primary, replicas, max_lag=5.0, interval=1.0, max_users=100000, clock=time.time):
+        self.primary = primary
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.interval = interval
+        self.max_users = max_users
+        self.clock = clock
+        self._state = {pool.config['host'] + f":{pool.config.get('port', 3306)}":
+                       {'pool': pool, 'applied': 0.0, 'lag': None, 'error': None} for pool in replicas}
+        self._writes = OrderedDict()
+        self._next = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self.stats = {'replica_reads': 0, 'primary_fallbacks': 0, 'read_your_writes': 0}
+
+    def note_write(self, user_id):
+        """Remember when a user last wrote; returns the timestamp"""
+        now = self.clock()
+        with self._lock:
+            self._writes[user_id] = now
+            self._writes.move_to_end(user_id)
+            while len(self._writes) > self.max_users:
+                self._writes.popitem(last=False)
+        return now
+
+    def last_write(self, user_id):
+        with self._lock:
+            return self._writes.get(user_id, 0.0)
+
+    def choose(self, since=0.0):
+        """A replica pool that is fresh enough and has applied writes up to `since`, or None"""
+        self._start()
+        with self._lock:
+            usable = [state for state in self._state.values()
+                      if state['error'] is None and state['lag'] is not None and state['lag'] <= self.max_lag]
+            fresh = [state for state in usable if state['applied'] >= since]
+            if not fresh:
+                self.stats['primary_fallbacks'] += 1
+                if usable:
+                    self.stats['read_your_writes'] += 1
+                return None
+            self._next += 1
+            self.stats['replica_reads'] += 1
+            return fresh[self._next % len(fresh)]['pool']
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._monitor, name='replica-monitor', daemon=True)
+                self._thread.start()
+
+    def _monitor(self):
+        while True:
+            self.check()
+            time.sleep(self.interval)
+
+    def check(self):
+        """One heartbeat round: stamp the primary, then read back how far each replica has got"""
+        stamp = None
+        try:
+            conn = self.primary.acquire()
+            try:
+                cursor = conn.cursor()
+                stamp = self.clock()
+                cursor.execute("""
+                INSERT INTO replication_heartbeat (id, ts) VALUES (1, %s)
+                ON DUPLICATE KEY UPDATE ts = GREATEST(ts, VALUES(ts))
+                """, (stamp,))
+                cursor.close()
+            finally:
+                conn.close()
+        except Exception as e:
+            instrumentation.report_error('Replica heartbeat', e)
+
+        for name, state in self._state.items():
+            try:
+                conn = state['pool'].acquire()
+                try:
+                    cursor = conn.cursor()
+                    cursor.execute("SELECT ts FROM replication_heartbeat WHERE id = 1")
+                    row = cursor.fetchone()
+                    cursor.close()
+                finally:
+                    conn.close()
+                applied = float(row[0]) if row else 0.0
+                with self._lock:
+                    state['applied'] = applied
+                    state['lag'] = max(0.0, (stamp or self.clock()) - applied)
+                    state['error'] = None
+            except Exception as e:
+                with self._lock:
+                    state['error'] = str(e)
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['replicas'] = {name: {'lag': None if state['lag'] is None else round(state['lag'], 3),
+                                        'healthy': state['error'] is None and state['lag'] is not None
+                                                   and state['lag'] <= self.max_lag,
+                                        'error': state['error']}
+                                 for name, state in self._state.items()}
+        stats['max_lag'] = self.max_lag
+        return stats
+
+
+def replica_config(host):
+    config = dict(DB_CONFIG)
+    host, _, port = host.partition(':')
+    config['host'] = host
+    if port:
+        config['port'] = int(port)
+    return config
+
+replica_router = None
+if DB_REPLICAS:
+    replica_router = ReplicaRouter(
+        db_pool,
+        [ConnectionPool(replica_config(host), size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT,
+                        max_lifetime=DB_POOL_MAX_LIFETIME, role='replica') for host in DB_REPLICAS],
+        max_lag=REPLICA_MAX_LAG, interval=REPLICA_CHECK_INTERVAL)
+
+# When the current user (or this process, for any session) last wrote
+def read_since(user_id):
+    stamp = session.get('last_write', 0.0) if has_request_context() else 0.0
+    if replica_router:
+        stamp = max(stamp, replica_router.last_write(user_id))
+    return stamp
+
+# Consistent-hash ring: each shard name owns `points` pseudo-random positions, and a
+# key belongs to the first position at or after its own hash. Adding a shard only
+# takes over the keys that now land on its positions.
+class HashRing:
+    def __init__(self, names, points=64):
+        self.names = sorted(names)
+        self._ring = sorted((self._hash(f'{name}#{i}'), name) for name in self.names for i in range(points))
+        self._keys = [point for point, _ in self._ring]
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.md5(str(key).encode('utf-8')).digest()[:8], 'big')
+
+    def lookup(self, key):
+        index = bisect_right(self._keys, self._hash(key)) % len(self._ring)
+        return self._ring[index][1]
+
+
+# user_id -> shard, from the user_directory table with a short-lived cache.
+# Writes always re-read the directory, so they see a move as soon as it starts
+# (rebalance_shards.py freezes a user's writes while it copies their rows).
+class ShardRouter:
+    def __init__(self, shards, default, connect, points=64, cache_ttl=5.0, max_users=100000):
+        self.shards = shards
+        self.default = default
+        self.connect = connect
+        self.ring = HashRing(shards, points)
+        self.cache_ttl = cache_ttl
+        self.max_users = max_users
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'lookups': 0, 'cache_hits': 0, 'directory_reads': 0, 'writes_paused': 0}
+
+    def place(self, user_id):
+        """The shard a user belongs on according to the ring"""
+        return self.ring.lookup(user_id)
+
+    def lookup(self, user_id, fresh=False):
+        """(shard name, state) for a user, or None if the directory can't be reached"""
+        now = time.monotonic()
+        with self._lock:
+            self.stats['lookups'] += 1
+            cached = self._cache.get(user_id)
+            if cached and not fresh and now - cached[2] < self.cache_ttl:
+                self.stats['cache_hits'] += 1
+                return cached[:2]
+
+        conn = self.connect()
+        if not conn:
+            return None
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT shard, state FROM user_directory WHERE user_id = %s", (user_id,))
+            row = cursor.fetchone()
+        finally:
+            cursor.close()
+            conn.close()
+
+        # Users from before sharding have no row and are still where they were
+        located = (row[0] or self.default, row[1]) if row else (self.default, 'active')
+        with self._lock:
+            self.stats['directory_reads'] += 1
+            self._cache[user_id] = located + (now,)
+            self._cache.move_to_end(user_id)
+            while len(self._cache) > self.max_users:
+                self._cache.popitem(last=False)
+        return located
+
+    def pool_for(self, user_id, write=False):
+        """Pool holding a user's rows (None if unknown); writes to a user being moved raise Rejected"""
+        located = self.lookup(user_id, fresh=write)
+        if located is None:
+            return None
+        shard, state = located
+        if write and state == 'frozen':
+            with self._lock:
+                self.stats['writes_paused'] += 1
+            raise admission.Rejected(503, 'Your journal is being moved, please try again in a moment', 2)
+        return self.shards.get(shard)
+
+    def forget(self, user_id):
+        with self._lock:
+            self._cache.pop(user_id, None)
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['cached_users'] = len(self._cache)
+        stats['shards'] = sorted(self.shards)
+        stats['default'] = self.default
+        return stats
+
+
+def shard_config(spec):
+    host, _, database = spec.partition('/')
+    config = replica_config(host)
+    if database:
+        config['database'] = database
+    return config
 
-# Connect to database
-def get_db():
+def same_database(config, other):
+    return all(config.get(key) == other.get(key) for key in ('host', 'database')) \
+        and config.get('port', 3306) == other.get('port', 3306)
+
+shard_router = None
+if DB_SHARDS:
+    # A shard that is the main database shares its pool
+    shard_pools = {}
+    for name, spec in DB_SHARDS:
+        config = shard_config(spec)
+        shard_pools[name] = db_pool if same_database(config, DB_CONFIG) else ConnectionPool(
+            config, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT, max_lifetime=DB_POOL_MAX_LIFETIME)
+    shard_router = ShardRouter(shard_pools, DB_SHARD_DEFAULT or DB_SHARDS[0][0], lambda: get_db(),
+                               points=SHARD_RING_POINTS, cache_ttl=SHARD_CACHE_TTL)
+
+# Shard names for jobs that walk every user's data ([None] = just the main database)
+def shard_names():
+    return sorted(shard_router.shards) if shard_router else [None]
+
+# Every pool this process has, main database first
+def all_pools():
+    pools = [db_pool]
+    if replica_router:
+        pools += replica_router.replicas
+    if shard_router:
+        pools += [pool for pool in shard_router.shards.values() if pool not in pools]
+    return pools
+
+# Connect to database: user_id= routes to that user's shard and shard= picks one by
+# name, otherwise the main database. read_only=True may hand back a replica of the main one.
+def get_db(read_only=False, since=0.0, user_id=None, shard=None):
+    pool = db_pool
+    if shard_router and (user_id is not None or shard is not None):
+        try:
+            pool = shard_router.shards.get(shard) if shard is not None \
+                else shard_router.pool_for(user_id, write=not read_only)
+        except mysql.connector.Error as e:
+            instrumentation.report_error('Shard directory', e)
+            return None
+        if pool is None:
+            instrumentation.report_error('Shard', LookupError(f'no shard for user {user_id} / {shard}'))
+            return None
+    
+    if read_only and replica_router and pool is db_pool:
+        replica = replica_router.choose(since)
+        if replica:
+            try:
+                return replica.acquire()
+            except mysql.connector.Error as e:
+                instrumentation.report_error('Replica', e)
+    
     try:
-        return mysql.connector.connect(**DB_CONFIG)
+        conn = pool.acquire()
     except mysql.connector.Error as e:
-        print(f"Database error: {e}")
+        instrumentation.report_error('Database', e)
         return None
+    
+    if AUTO_MIGRATE and pool not in migrated_pools:
+        try:
+            ensure_schema(pool, conn)
+        except Exception as e:
+            instrumentation.report_error('Migration', e)
+            conn.close()
+            return None
+    return conn
+
+# bcrypt work runs in these top-level functions so worker processes can import them
+def hash_password_sync(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+def check_password_sync(password, password_hash):
+    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+def calibrate_rounds(target_ms, floor=10, ceiling=16):
+    """Highest bcrypt cost that stays under target_ms on this machine"""
+    started = time.perf_counter()
+    hash_password_sync('calibration', floor)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    
+    # Each extra round doubles the work
+    rounds = floor
+    while rounds < ceiling and elapsed_ms * 2 <= target_ms:
+        elapsed_ms *= 2
+        rounds += 1
+    return rounds
+
+
+def stored_rounds(target_ms):
+    """The calibrated cost from app_settings, calibrating (once, for every process) if there is none"""
+    db = get_db()
+    if not db:
+        return calibrate_rounds(target_ms)
+    
+    cursor = db.cursor()
+    try:
+        cursor.execute("SELECT value FROM app_settings WHERE name = 'bcrypt_rounds'")
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute("INSERT IGNORE INTO app_settings (name, value) VALUES ('bcrypt_rounds', %s)",
+                           (str(calibrate_rounds(target_ms)),))
+            # Another process may have stored its measurement first; that one wins
+            cursor.execute("SELECT value FROM app_settings WHERE name = 'bcrypt_rounds'")
+            row = cursor.fetchone()
+        return int(row[0])
+    except mysql.connector.Error as e:
+        instrumentation.report_error('bcrypt calibration', e)
+        return calibrate_rounds(target_ms)
+    finally:
+        cursor.close()
+        db.close()
+
+
+class HasherBusy(Exception):
+    pass
+
+
+# Password hashing on a process pool, with a cap on queued work
+class PasswordHasher:
+    def __init__(self, rounds='auto', target_ms=250, workers=2, max_queue=8, calibrate=calibrate_rounds):
+        self.target_ms = target_ms
+        self.calibrate = calibrate
+        self.workers = workers
+        self.max_queue = max_queue
+        self._rounds = None if rounds == 'auto' else int(rounds)
+        self._slots = threading.BoundedSemaphore(max_queue)
+        self._executor = None
+        self._lock = threading.Lock()
+        self.stats = {'hashes': 0, 'checks': 0, 'rehashes': 0, 'rejected': 0, 'queued': 0}
+
+    @property
+    def rounds(self):
+        if self._rounds is None:
+            with self._lock:
+                if self._rounds is None:
+                    self._rounds = self.calibrate(self.target_ms)
+                    app.logger.info('bcrypt cost calibrated to %d rounds (target %.0fms)', self._rounds, self.target_ms)
+        return self._rounds
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.stats['rejected'] += 1
+            raise HasherBusy('Password hashing queue is full')
+        try:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                self.stats['queued'] += 1
+            return self._executor.submit(fn, *args).result()
+        finally:
+            with self._lock:
+                self.stats['queued'] -= 1
+            self._slots.release()
+
+    def hash(self, password):
+        with self._lock:
+            self.stats['hashes'] += 1
+        with instrumentation.timed('bcrypt', 'hash'):
+            return self._run(hash_password_sync, password, self.rounds)
+
+    def check(self, password, password_hash):
+        with self._lock:
+            self.stats['checks'] += 1
+        with instrumentation.timed('bcrypt', 'check'):
+            return self._run(check_password_sync, password, password_hash)
+
+    def needs_rehash(self, password_hash):
+        """Only ever upgrades: a hash made at a higher cost than today's is kept"""
+        try:
+            return int(password_hash.split('$')[2]) < self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def count_rehash(self):
+        with self._lock:
+            self.stats['rehashes'] += 1
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats['rounds'] = self._rounds
+        stats['workers'] = self.workers
+        stats['max_queue'] = self.max_queue
+        return stats
+
+    def shutdown(self):
+        if self._executor:
+            self._executor.shutdown()
+
+
+password_hasher = PasswordHasher(rounds=BCRYPT_ROUNDS, target_ms=BCRYPT_TARGET_MS,
+                                 workers=BCRYPT_WORKERS, max_queue=BCRYPT_MAX_QUEUE, calibrate=stored_rounds)
+
+# Response when the hashing pool is saturated
+def busy_response():
+    response = jsonify({'error': 'Server is busy, please try again'})
+    response.status_code = 429
+    response.headers['Retry-After'] = '1'
+    return response
+
+# Run a CALL and return the rows of each result set it produced
+def call_procedure(cursor, sql, args):
+    results = []
+    for result in cursor.execute(sql, args, multi=True):
+        if result.with_rows:
+            results.append(result.fetchall())
+    return results
 
 # Check if user is logged in
 def login_required(f):
@@ -48,121 +798,1121 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-# AI sentiment analysis
-def analyze_sentiment(text):
-    if not HUGGING_FACE_API_KEY or HUGGING_FACE_API_KEY == 'hf_your_token_here':
+# Cache of sentiment results keyed on a hash of the normalized note
+class SentimentCache:
+    def __init__(self, max_size=5000, ttl=30 * 24 * 3600.0, db_path=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.db_path = db_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+
+        if db_path:
+            with self._connect() as disk:
+                disk.execute("""
+                CREATE TABLE IF NOT EXISTS sentiment_cache (
+                    text_hash TEXT PRIMARY KEY,
+                    result TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+                """)
+
+    @staticmethod
+    def normalize(text):
+        """Lowercase, drop punctuation and collapse whitespace so near-identical notes share a key"""
+        text = re.sub(r"[^\w\s']", ' ', text.lower())
+        return ' '.join(text.split())
+
+    def key(self, text):
+        return hashlib.sha256(self.normalize(text).encode('utf-8')).hexdigest()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=5)
+
+    def get(self, text):
+        key = self.key(text)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[1] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return dict(entry[0])
+            if entry:
+                del self._entries[key]
+
+        if self.db_path:
+            try:
+                with self._connect() as disk:
+                    row = disk.execute(
+                        "SELECT result, created_at FROM sentiment_cache WHERE text_hash = ?", (key,)
+                    ).fetchone()
+                    if row and now - row[1] > self.ttl:
+                        disk.execute("DELETE FROM sentiment_cache WHERE text_hash = ?", (key,))
+                        row = None
+                if row:
+                    result = json.loads(row[0])
+                    self._remember(key, result, row[1])
+                    with self._lock:
+                        self.stats['disk_hits'] += 1
+                    return dict(result)
+            except sqlite3.Error as e:
+                instrumentation.report_error('Sentiment cache', e)
+
+        with self._lock:
+            self.stats['misses'] += 1
+        return None
+
+    def _remember(self, key, result, created_at):
+        with self._lock:
+            self._entries[key] = (dict(result), created_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def put(self, text, result):
+        key = self.key(text)
+        now = time.time()
+        self._remember(key, result, now)
+
+        if self.db_path:
+            try:
+                with self._connect() as disk:
+                    disk.execute(
+                        "INSERT OR REPLACE INTO sentiment_cache (text_hash, result, created_at) VALUES (?, ?, ?)",
+                        (key, json.dumps(result), now))
+                    disk.execute("DELETE FROM sentiment_cache WHERE created_at < ?", (now - self.ttl,))
+            except sqlite3.Error as e:
+                instrumentation.report_error('Sentiment cache', e)
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['size'] = len(self._entries)
+        stats['max_size'] = self.max_size
+        lookups = stats['hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['hits'] + stats['disk_hits']) / lookups, 3) if lookups else 0.0
+        return stats
+
+
+sentiment_cache = SentimentCache(max_size=SENTIMENT_CACHE_SIZE, ttl=SENTIMENT_CACHE_TTL,
+                                 db_path=SENTIMENT_CACHE_DB)
+
+class CircuitOpen(Exception):
+    pass
+
+
+# Closed -> open on a high failure or slow-call rate over the last `window` seconds;
+# open -> half-open after `cooldown`, where one probe decides whether to close again
+class CircuitBreaker:
+    def __init__(self, window=30.0, min_calls=10, failure_rate=0.5, slow_ms=2000.0, slow_rate=0.5,
+                 cooldown=15.0, clock=time.monotonic):
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow = slow_ms / 1000.0
+        self.slow_rate = slow_rate
+        self.cooldown = cooldown
+        self.clock = clock
+        self.state = 'closed'
+        self._calls = deque()
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self.stats = {'opened': 0, 'rejected': 0, 'probes': 0}
+
+    def allow(self):
+        """Whether a call may go out now (in half-open, only one probe at a time)"""
+        with self._lock:
+            if self.state == 'open' and self.clock() - self._opened_at >= self.cooldown:
+                self.state = 'half_open'
+            if self.state == 'closed':
+                return True
+            if self.state == 'half_open' and not self._probing:
+                self._probing = True
+                self.stats['probes'] += 1
+                return True
+            self.stats['rejected'] += 1
+            return False
+
+    def is_open(self):
+        """Open and still cooling down - callers shouldn't even queue work (counted as a rejection)"""
+        with self._lock:
+            if self.state == 'open' and self.clock() - self._opened_at < self.cooldown:
+                self.stats['rejected'] += 1
+                return True
+            return False
+
+    def record(self, ok, seconds):
+        now = self.clock()
+        with self._lock:
+            if self.state == 'half_open':
+                self._probing = False
+                if ok and seconds < self.slow:
+                    self.state = 'closed'
+                    self._calls.clear()
+                else:
+                    self._open(now)
+                return
+            if self.state == 'open':
+                return
+
+            self._calls.append((now, ok, seconds >= self.slow))
+            while self._calls and self._calls[0][0] < now - self.window:
+                self._calls.popleft()
+            calls = len(self._calls)
+            if calls >= self.min_calls:
+                failures = sum(1 for _, ok, _ in self._calls if not ok)
+                slow = sum(1 for _, _, slow in self._calls if slow)
+                if failures / calls >= self.failure_rate or slow / calls >= self.slow_rate:
+                    self._open(now)
+
+    def _open(self, now):
+        self.state = 'open'
+        self._opened_at = now
+        self._calls.clear()
+        self.stats['opened'] += 1
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['state'] = self.state
+            calls = len(self._calls)
+            stats['recent_calls'] = calls
+            stats['recent_failure_rate'] = round(sum(1 for c in self._calls if not c[1]) / calls, 3) if calls else 0.0
+            stats['recent_slow_rate'] = round(sum(1 for c in self._calls if c[2]) / calls, 3) if calls else 0.0
+        return stats
+
+
+sentiment_breaker = CircuitBreaker(window=BREAKER_WINDOW, min_calls=BREAKER_MIN_CALLS,
+                                   failure_rate=BREAKER_FAILURE_RATE, slow_ms=BREAKER_SLOW_MS,
+                                   slow_rate=BREAKER_SLOW_RATE, cooldown=BREAKER_COOLDOWN)
+
+# Collects notes from concurrent callers and sends them to the model in one request
+class SentimentBatcher:
+    def __init__(self, url, api_key, max_batch=16, window=0.05, concurrency=2, timeout=10.0,
+                 breaker=None, retries=1, hedge_ms=0):
+        self.url = url
+        self.api_key = api_key
+        self.max_batch = max_batch
+        self.window = window
+        self.timeout = timeout
+        self.breaker = breaker
+        self.retries = retries
+        self.hedge_after = hedge_ms / 1000.0
+        self._pending = []
+        self._cond = threading.Condition()
+        self._senders = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='sentiment-batch')
+        self._attempts = ThreadPoolExecutor(max_workers=concurrency * 2, thread_name_prefix='sentiment-http')
+        self._http = requests.Session()
+        self._thread = None
+        self.stats = {'notes': 0, 'requests': 0, 'coalesced': 0, 'failed_requests': 0, 'largest_batch': 0,
+                      'retries': 0, 'hedges': 0, 'hedge_wins': 0, 'short_circuited': 0, 'expired': 0}
+
+    def submit(self, text, deadline=None):
+        """Queue a note and return a Future for its raw model scores (deadline is a time.monotonic() value)"""
+        future = Future()
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._collect, name='sentiment-batcher', daemon=True)
+                self._thread.start()
+            self._pending.append((text, future, deadline))
+            self.stats['notes'] += 1
+            self._cond.notify()
+        return future
+
+    def analyze(self, text):
+        return self.submit(text).result(timeout=self.timeout + self.window + 1)
+
+    def _collect(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+
+                # Hold the batch open until it fills up or the window closes
+                deadline = time.monotonic() + self.window
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+
+            self._senders.submit(self._send, batch)
+
+    def _count(self, name, amount=1):
+        with self._cond:
+            self.stats[name] += amount
+
+    def _post(self, texts, timeout):
+        """One HTTP attempt, reported to the breaker"""
+        started = time.monotonic()
+        try:
+            headers = {"Authorization": f"Bearer {self.api_key}"}
+            response = self._http.post(self.url, headers=headers, json={"inputs": texts}, timeout=timeout)
+            if response.status_code != 200:
+                raise RuntimeError(f"Model returned HTTP {response.status_code}")
+
+            result = response.json()
+            if not isinstance(result, list) or len(result) != len(texts):
+                raise RuntimeError("Unexpected model response")
+        except Exception:
+            if self.breaker:
+                self.breaker.record(False, time.monotonic() - started)
+            raise
+        if self.breaker:
+            self.breaker.record(True, time.monotonic() - started)
+        return result
+
+    def _attempt(self, texts, deadline):
+        """An attempt, plus a hedged duplicate if the first is still out after hedge_after"""
+        first = self._attempts.submit(self._post, texts, deadline - time.monotonic())
+        attempts = [first]
+        if self.hedge_after and deadline - time.monotonic() > self.hedge_after:
+            done, _ = wait(attempts, timeout=self.hedge_after)
+            if not done and self.breaker_closed():
+                self._count('hedges')
+                attempts.append(self._attempts.submit(self._post, texts, deadline - time.monotonic()))
+
+        error = None
+        pending = set(attempts)
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if future is not first:
+                    self._count('hedge_wins')
+                return result
+        raise error or TimeoutError('Sentiment budget exhausted')
+
+    def breaker_closed(self):
+        return self.breaker is None or self.breaker.state == 'closed'
+
+    def _request(self, texts, deadline):
+        """Attempts with jittered backoff between them, all inside the batch deadline"""
+        for attempt in range(self.retries + 1):
+            if self.breaker and not self.breaker.allow():
+                self._count('short_circuited')
+                raise CircuitOpen('Sentiment circuit is open')
+            try:
+                return self._attempt(texts, deadline)
+            except Exception:
+                backoff = min(2.0, 0.1 * 2 ** attempt) * random.uniform(0.5, 1.5)
+                if attempt == self.retries or not self.breaker_closed() or \
+                        time.monotonic() + backoff >= deadline:
+                    raise
+            self._count('retries')
+            time.sleep(backoff)
+
+    def _send(self, batch):
+        # Notes already past their deadline are answered by the fallback instead
+        now = time.monotonic()
+        live = []
+        for text, future, deadline in batch:
+            if deadline is not None and deadline <= now:
+                self._count('expired')
+                future.set_exception(TimeoutError('Sentiment budget exhausted'))
+            else:
+                live.append((text, future, deadline))
+        if not live:
+            return
+
+        # Identical notes in one window share a single model input
+        waiters = OrderedDict()
+        for text, future, _ in live:
+            waiters.setdefault(text, []).append(future)
+        texts = list(waiters)
+        # The request may run as long as its most patient note allows
+        deadline = min(now + self.timeout, max(d if d is not None else now + self.timeout for _, _, d in live))
+
+        with self._cond:
+            self.stats['requests'] += 1
+            self.stats['coalesced'] += len(live) - len(texts)
+            self.stats['largest_batch'] = max(self.stats['largest_batch'], len(live))
+
+        try:
+            result = self._request(texts, deadline)
+
+            for text, scores in zip(texts, result):
+                for future in waiters[text]:
+                    future.set_result(scores)
+        except Exception as e:
+            with self._cond:
+                self.stats['failed_requests'] += 1
+            for futures in waiters.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def metrics(self):
+        with self._cond:
+            stats = dict(self.stats)
+            stats['pending'] = len(self._pending)
+        stats['notes_per_request'] = round(stats['notes'] / stats['requests'], 2) if stats['requests'] else 0.0
+        return stats
+
+    def shutdown(self):
+        self._senders.shutdown(wait=True)
+        self._attempts.shutdown(wait=True)
+        self._http.close()
+
+
+sentiment_batcher = SentimentBatcher(AI_URL, HUGGING_FACE_API_KEY, max_batch=SENTIMENT_BATCH_SIZE,
+                                     window=SENTIMENT_BATCH_WINDOW_MS / 1000,
+                                     concurrency=SENTIMENT_BATCH_CONCURRENCY, timeout=AI_TIMEOUT,
+                                     breaker=sentiment_breaker, retries=SENTIMENT_RETRIES,
+                                     hedge_ms=SENTIMENT_HEDGE_MS)
+
+# Friendly message for a sentiment label (each engine decides the label from its own scale)
+def sentiment_message(label):
+    if label == 'positive':
+        return "Your writing shows positive vibes!"
+    elif label == 'negative':
+        return "Some tough emotions there - you're not alone"
+    else:
+        return "Neutral feelings - totally normal"
+
+# Turn raw model scores into the app's sentiment result
+def format_sentiment(scores):
+    best = max(scores, key=lambda x: x['score'])
+    
+    # Convert to readable format
+    sentiment_map = {
+        'LABEL_0': {'score': -0.7, 'label': 'negative'},
+        'LABEL_1': {'score': 0.0, 'label': 'neutral'},
+        'LABEL_2': {'score': 0.7, 'label': 'positive'}
+    }
+    
+    mapped = sentiment_map.get(best['label'], {'score': 0.0, 'label': 'neutral'})
+    
+    return {
+        'score': mapped['score'],
+        'label': mapped['label'],
+        'confidence': best['score'],
+        'message': sentiment_message(mapped['label'])
+    }
+
+# Sentiment backends share one interface: submit(text, deadline) -> Future for one
+# note's result, and analyze_batch(texts, deadline) -> list of results
+class RemoteSentimentBackend:
+    name = 'remote'
+    cacheable = True
+
+    def __init__(self, batcher, api_key):
+        self.batcher = batcher
+        self.api_key = api_key
+
+    def available(self):
+        return bool(self.api_key) and self.api_key != 'hf_your_token_here'
+
+    def submit(self, text, deadline=None):
+        """Queue a note on the batcher; the Future resolves when its batch comes back"""
+        # Fail fast while the model is known to be down, rather than queueing
+        if self.batcher.breaker and self.batcher.breaker.is_open():
+            raise CircuitOpen('Sentiment circuit is open')
+        result = Future()
+
+        def scored(future):
+            try:
+                result.set_result(format_sentiment(future.result()))
+            except Exception as e:
+                result.set_exception(e)
+
+        self.batcher.submit(text, deadline).add_done_callback(scored)
+        return result
+
+    def analyze_batch(self, texts, deadline=None):
+        futures = [self.submit(text, deadline) for text in texts]
+        if deadline is None:
+            deadline = time.monotonic() + self.batcher.timeout + self.batcher.window + 1
+        return [future.result(timeout=max(0.0, deadline - time.monotonic()) + self.batcher.window)
+                for future in futures]
+
+
+class LocalSentimentBackend:
+    name = 'local'
+    cacheable = False  # cheaper to recompute than to cache
+
+    def available(self):
+        return True
+
+    def submit(self, text, deadline=None):
+        result = Future()
+        result.set_result(self.analyze_batch([text])[0])
+        return result
+
+    def analyze_batch(self, texts, deadline=None):
+        return [{
+            'score': score,
+            'label': label,
+            'confidence': confidence,
+            'message': sentiment_message(label)
+        } for score, label, confidence in local_sentiment.score_batch(texts)]
+
+
+SENTIMENT_BACKENDS = {
+    'remote': RemoteSentimentBackend(sentiment_batcher, HUGGING_FACE_API_KEY),
+    'local': LocalSentimentBackend()
+}
+
+sentiment_engines = [SENTIMENT_BACKENDS[name] for name in (SENTIMENT_BACKEND, SENTIMENT_FALLBACK)
+                     if name in SENTIMENT_BACKENDS]
+
+# AI sentiment analysis - tries the primary engine, then the fallback. Returns a Future
+# that resolves once an engine answers, so callers don't hold a thread while their note
+# waits for its batch.
+def submit_sentiment(text, budget=None):
+    """budget: seconds the whole analysis may take before only the fallback is left"""
+    result = Future()
+    cached = sentiment_cache.get(text)
+    if cached:
+        result.set_result(cached)
+        return result
+    
+    deadline = time.monotonic() + budget if budget else None
+    engines = iter([engine for engine in sentiment_engines if engine.available()])
+    
+    def attempt():
+        for engine in engines:
+            started = time.perf_counter()
+            try:
+                pending = engine.submit(text, deadline)
+            except Exception as e:
+                instrumentation.report_error(f"AI ({engine.name})", e)
+                continue
+            pending.add_done_callback(lambda future, engine=engine, started=started: answered(engine, started, future))
+            return
+        result.set_result(sentiment_unavailable())
+    
+    def answered(engine, started, future):
+        try:
+            analysis = future.result()
+        except Exception as e:
+            instrumentation.report_error(f"AI ({engine.name})", e)
+            attempt()
+            return
+        instrumentation.record('sentiment', engine.name, time.perf_counter() - started)
+        analysis['engine'] = engine.name
+        if engine.cacheable:
+            sentiment_cache.put(text, analysis)
+        result.set_result(analysis)
+    
+    attempt()
+    return result
+
+# Result when no engine could score a note
+def sentiment_unavailable():
+    if not any(engine.available() for engine in sentiment_engines):
         return {
             'score': 0.0,
             'label': 'neutral',
             'message': 'Add Hugging Face API key for AI analysis'
         }
     
-    headers = {"Authorization": f"Bearer {HUGGING_FACE_API_KEY}"}
-    
-    try:
-        response = requests.post(AI_URL, headers=headers, json={"inputs": text}, timeout=10)
-        
-        if response.status_code == 200:
-            result = response.json()
-            if isinstance(result, list) and result:
-                best = max(result[0], key=lambda x: x['score'])
-                
-                # Convert to readable format
-                sentiment_map = {
-                    'LABEL_0': {'score': -0.7, 'label': 'negative'},
-                    'LABEL_1': {'score': 0.0, 'label': 'neutral'},
-                    'LABEL_2': {'score': 0.7, 'label': 'positive'}
-                }
-                
-                mapped = sentiment_map.get(best['label'], {'score': 0.0, 'label': 'neutral'})
-                
-                # Create friendly message
-                if mapped['score'] >= 0.5:
-                    message = "Your writing shows positive vibes!"
-                elif mapped['score'] >= -0.1:
-                    message = "Neutral feelings - totally normal"
-                else:
-                    message = "Some tough emotions there - you're not alone"
-                
-                return {
-                    'score': mapped['score'],
-                    'label': mapped['label'],
-                    'confidence': best['score'],
-                    'message': message
-                }
-    except Exception as e:
-        print(f"AI error: {e}")
-    
     return {'score': 0.0, 'label': 'neutral', 'message': 'AI temporarily unavailable'}
 
-# Generate insights from user data
-def generate_insights(user_id, cursor):
+# Background sentiment jobs - notes are saved first, scored later. A note waits for its
+# batch without holding a thread; the workers only write finished scores back. Job state
+# lives in the sentiment_jobs table on the user's shard, so a poll can land on any worker.
+class SentimentJobs:
+    def __init__(self, workers=4, ttl=3600.0, prune_interval=60.0):
+        self.ttl = ttl
+        self.prune_interval = prune_interval
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sentiment')
+        self._futures = set()
+        self._lock = threading.Lock()
+        self._pruned_at = 0.0
+
+    def submit(self, cursor, user_id, entry_date, text):
+        """Record a pending job with the caller's cursor, queue the note and return the job id"""
+        job_id, statements = self.new_job(user_id, entry_date)
+        for sql, params in statements:
+            cursor.execute(sql, params)
+        self.start(job_id, user_id, entry_date, text)
+        return job_id
+
+    def new_job(self, user_id, entry_date):
+        """A job id and the statements recording it as pending (async_app runs them on its own cursor)"""
+        job_id = uuid.uuid4().hex
+        statements = []
+        if self._due_for_prune():
+            statements.append(("DELETE FROM sentiment_jobs WHERE created_at < NOW() - INTERVAL %s SECOND",
+                               (int(self.ttl),)))
+        statements.append(("INSERT INTO sentiment_jobs (job_id, user_id, entry_date, status) VALUES (%s, %s, %s, 'pending')",
+                           (job_id, user_id, entry_date)))
+        return job_id, statements
+
+    def start(self, job_id, user_id, entry_date, text):
+        """Queue the note once its job row is written; never blocks"""
+        finished = Future()
+        with self._lock:
+            self._futures.add(finished)
+        finished.add_done_callback(self._done)
+        
+        analysis = submit_sentiment(text, SENTIMENT_BUDGET_MS / 1000)
+        analysis.add_done_callback(lambda future: self._save(job_id, user_id, entry_date, text, future, finished))
+
+    def _due_for_prune(self):
+        with self._lock:
+            if time.time() - self._pruned_at < self.prune_interval:
+                return False
+            self._pruned_at = time.time()
+            return True
+
+    def _done(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def get(self, job_id, user_id):
+        """The user's job as the status endpoint reports it, or None"""
+        db = get_db(read_only=True, since=read_since(user_id), user_id=user_id)
+        if not db:
+            raise RuntimeError('Database error')
+        cursor = db.cursor(dictionary=True)
+        try:
+            cursor.execute("""
+            SELECT job_id, user_id, entry_date, status, result FROM sentiment_jobs
+            WHERE job_id = %s AND user_id = %s
+            """, (job_id, user_id))
+            job = cursor.fetchone()
+        finally:
+            cursor.close()
+            db.close()
+        if job:
+            job['entry_date'] = job['entry_date'].strftime('%Y-%m-%d')
+            job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def _save(self, job_id, user_id, entry_date, text, analysis, finished):
+        """Runs on whichever thread finished the analysis - the write goes to a worker"""
+        try:
+            self._executor.submit(self._run, job_id, user_id, entry_date, text, analysis.result(), finished)
+        except Exception as e:
+            instrumentation.report_error('Sentiment job', e)
+            finished.set_result(None)
+
+    def _run(self, job_id, user_id, entry_date, text, result, finished):
+        try:
+            save_sentiment(job_id, user_id, entry_date, text, result)
+        except Exception as e:
+            instrumentation.report_error('Sentiment job', e)
+            try:
+                fail_sentiment_job(job_id, user_id)
+            except Exception as e:
+                instrumentation.report_error('Sentiment job', e)
+        finally:
+            finished.set_result(None)
+
+    def drain(self, timeout=None):
+        """Wait up to `timeout` seconds for queued jobs, then stop the workers; returns how many were dropped"""
+        with self._lock:
+            futures = list(self._futures)
+        _, unfinished = wait(futures, timeout=timeout)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        return len(unfinished)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+# Write a finished sentiment score back to the mood entry and its job
+def save_sentiment(job_id, user_id, entry_date, text, result):
+    db = get_db(user_id=user_id)
+    if not db:
+        raise RuntimeError('Database error')
+
+    cursor = db.cursor()
     try:
-        # Get last 14 days of data
+        # Only update if the note hasn't been replaced since the job was queued
         cursor.execute("""
-        SELECT m.mood_value, a.exercise_minutes, a.social_interaction, a.sleep_hours,
-               DAYNAME(m.entry_date) as day_name
-        FROM mood_entries m
-        LEFT JOIN activities a ON m.user_id = a.user_id AND m.entry_date = a.entry_date
-        WHERE m.user_id = %s AND m.entry_date >= DATE_SUB(CURDATE(), INTERVAL 14 DAY)
-        """, (user_id,))
-        
-        data = cursor.fetchall()
-        insights = []
-        
-        if len(data) >= 3:
-            # Exercise insight
-            exercise_days = [d for d in data if d[1] and d[1] > 0]
-            no_exercise_days = [d for d in data if not d[1] or d[1] == 0]
-            
-            if len(exercise_days) >= 2 and len(no_exercise_days) >= 1:
-                exercise_avg = statistics.mean([d[0] for d in exercise_days])
-                no_exercise_avg = statistics.mean([d[0] for d in no_exercise_days])
-                
-                if exercise_avg > no_exercise_avg + 0.5:
-                    insights.append({
-                        'title': 'Exercise Mood Boost',
-                        'description': f'Your mood is {exercise_avg - no_exercise_avg:.1f} points higher on workout days!',
-                        'confidence_level': 'high'
-                    })
-            
-            # Sleep insight
-            sleep_data = [d for d in data if d[3]]  # Has sleep data
-            if len(sleep_data) >= 3:
-                good_sleep = [d for d in sleep_data if d[3] >= 7.5]
-                poor_sleep = [d for d in sleep_data if d[3] < 6.5]
-                
-                if len(good_sleep) >= 1 and len(poor_sleep) >= 1:
-                    good_avg = statistics.mean([d[0] for d in good_sleep])
-                    poor_avg = statistics.mean([d[0] for d in poor_sleep])
-                    
-                    if good_avg > poor_avg + 0.5:
-                        insights.append({
-                            'title': 'Sleep Quality Impact',
-                            'description': f'Good sleep improves your mood by {good_avg - poor_avg:.1f} points!',
-                            'confidence_level': 'medium'
-                        })
-            
-            # Social insight
-            social_days = [d for d in data if d[2]]  # Had social interaction
-            solo_days = [d for d in data if not d[2]]
+        UPDATE mood_entries SET sentiment_score = %s
+        WHERE user_id = %s AND entry_date = %s AND quick_note = %s
+        """, (result['score'], user_id, entry_date, text))
+        cursor.execute("""
+        UPDATE sentiment_jobs SET status = 'done', result = %s, finished_at = NOW() WHERE job_id = %s
+        """, (json.dumps(result), job_id))
+    finally:
+        cursor.close()
+        db.close()
+
+def fail_sentiment_job(job_id, user_id):
+    db = get_db(user_id=user_id)
+    if not db:
+        raise RuntimeError('Database error')
+
+    cursor = db.cursor()
+    try:
+        cursor.execute("UPDATE sentiment_jobs SET status = 'failed', finished_at = NOW() WHERE job_id = %s",
+                       (job_id,))
+    finally:
+        cursor.close()
+        db.close()
+
+
+sentiment_jobs = SentimentJobs(workers=SENTIMENT_WORKERS, ttl=SENTIMENT_JOB_TTL)
+
+# Cached dashboard payloads per user, each tagged with the data version (see
+# data_version()) it was built from. The caller reads the stored version first and a
+# payload is only served while it still matches, so a write on any worker or host
+# retires every copy without anyone being told.
+# With shared_stamps the version is instead a per-user stamp in the shared file, bumped
+# by invalidate() after each write commits, so checking it needs no MySQL read. A build
+# that raced a write is stored under the stamp it read before building, which the write
+# has already moved past, so it is never served.
+class DashboardCache:
+    def __init__(self, max_size=10000, db_path=None, shared_stamps=False):
+        if shared_stamps and not db_path:
+            raise ValueError('shared dashboard stamps need a db_path')
+        self.max_size = max_size
+        self.db_path = db_path
+        self.shared_stamps = shared_stamps
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'not_modified': 0}
+
+        if db_path:
+            with self._connect() as shared:
+                shared.execute("""
+                CREATE TABLE IF NOT EXISTS dashboard_entries (
+                    user_id INTEGER PRIMARY KEY,
+                    day TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    etag TEXT NOT NULL,
+                    payload TEXT NOT NULL
+                )
+                """)
+                shared.execute("""
+                CREATE TABLE IF NOT EXISTS dashboard_stamps (
+                    user_id INTEGER PRIMARY KEY,
+                    stamp INTEGER NOT NULL
+                )
+                """)
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=5)
+
+    def stamp(self, user_id):
+        """The user's shared stamp, or None without shared stamps (or if the file can't be read)"""
+        if not self.shared_stamps:
+            return None
+        try:
+            with self._connect() as shared:
+                row = shared.execute("SELECT stamp FROM dashboard_stamps WHERE user_id = ?", (user_id,)).fetchone()
+        except sqlite3.Error as e:
+            instrumentation.report_error('Dashboard cache', e)
+            return None
+        return row[0] if row else 0
+
+    def get(self, user_id, version):
+        """(payload_json, etag) for today's dashboard at this data version, or None"""
+        current = (date.today().isoformat(), version)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[:2] != current:
+                del self._entries[user_id]
+                entry = None
+            if entry:
+                self._entries.move_to_end(user_id)
+
+        if not entry and self.db_path:
+            # Another worker on this host may already have built it
+            try:
+                with self._connect() as shared:
+                    row = shared.execute(
+                        "SELECT day, version, etag, payload FROM dashboard_entries WHERE user_id = ?", (user_id,)
+                    ).fetchone()
+            except sqlite3.Error as e:
+                instrumentation.report_error('Dashboard cache', e)
+                row = None
+
+            if row and row[:2] == current:
+                entry = row
+                self._remember(user_id, entry)
+
+        with self._lock:
+            self.stats['hits' if entry else 'misses'] += 1
+        return (entry[3], entry[2]) if entry else None
+
+    def _remember(self, user_id, entry):
+        with self._lock:
+            self._entries[user_id] = entry
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def put(self, user_id, version, payload_json):
+        """Store a dashboard built from this data version and return its ETag (version None: not stored)"""
+        etag = hashlib.sha1(payload_json.encode('utf-8')).hexdigest()
+        if version is None:
+            return etag
+        entry = (date.today().isoformat(), version, etag, payload_json)
+        self._remember(user_id, entry)
+
+        if self.db_path:
+            try:
+                with self._connect() as shared:
+                    shared.execute(
+                        "INSERT OR REPLACE INTO dashboard_entries (user_id, day, version, etag, payload) "
+                        "VALUES (?, ?, ?, ?, ?)", (user_id, *entry))
+            except sqlite3.Error as e:
+                instrumentation.report_error('Dashboard cache', e)
+        return etag
+
+    def invalidate(self, user_id):
+        """Frees this worker's copy early; with shared stamps, also retires every copy (call after the write commits)"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self.stats['invalidations'] += 1
+
+        if self.shared_stamps:
+            try:
+                with self._connect() as shared:
+                    shared.execute(
+                        "INSERT INTO dashboard_stamps (user_id, stamp) VALUES (?, 1) "
+                        "ON CONFLICT (user_id) DO UPDATE SET stamp = stamp + 1", (user_id,))
+                    shared.execute("DELETE FROM dashboard_entries WHERE user_id = ?", (user_id,))
+            except sqlite3.Error as e:
+                instrumentation.report_error('Dashboard cache', e)
+
+    def record(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['size'] = len(self._entries)
+        stats['shared'] = bool(self.db_path)
+        stats['shared_stamps'] = self.shared_stamps
+        return stats
+
+
+dashboard_cache = DashboardCache(max_size=DASHBOARD_CACHE_SIZE, db_path=DASHBOARD_CACHE_DB,
+                                 shared_stamps=DASHBOARD_STAMPS == 'shared')
+
+# Send a cached dashboard, or 304 if the client already has this version
+def dashboard_response(payload_json, etag):
+    if request.if_none_match.contains(etag):
+        dashboard_cache.record('not_modified')
+        response = Response(status=304)
+    else:
+        response = Response(payload_json, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+# Per-user daily aggregates for insights: one row per (user, day, bucket)
+# holding the mood sum and entry count, so insights never scan raw entries
+# (tables are created by migrations.py)
+INSIGHTS_WINDOW_DAYS = int(os.getenv('INSIGHTS_WINDOW_DAYS', '14'))
+
+# Which insight buckets a day falls into
+def day_buckets(exercise_minutes, social_interaction, sleep_hours):
+    buckets = ['all']
+    buckets.append('exercise' if exercise_minutes and exercise_minutes > 0 else 'no_exercise')
+    buckets.append('social' if social_interaction else 'solo')
+    if sleep_hours:
+        buckets.append('sleep_logged')
+        if sleep_hours >= 7.5:
+            buckets.append('good_sleep')
+        elif sleep_hours < 6.5:
+            buckets.append('poor_sleep')
+    return buckets
+
+def refresh_aggregates(cursor, user_id=None, entry_dates=None):
+    """Rebuild aggregate rows for some of a user's days (after upserts), or for everything when no filter is given"""
+    if user_id:
+        placeholders = ', '.join(['%s'] * len(entry_dates))
+        where = f"WHERE m.user_id = %s AND m.entry_date IN ({placeholders})"
+        params = (user_id, *entry_dates)
+    else:
+        where, params = "", ()
+    
+    cursor.execute(f"""
+    SELECT m.user_id, m.entry_date, m.mood_value, a.exercise_minutes, a.social_interaction, a.sleep_hours
+    FROM mood_entries m
+    LEFT JOIN activities a ON m.user_id = a.user_id AND m.entry_date = a.entry_date
+    {where}
+    """, params)
+    rows = [tuple(row.values()) if isinstance(row, dict) else row for row in cursor.fetchall()]
+    
+    # An upsert may have moved the day into different buckets, so replace it wholesale
+    if user_id:
+        cursor.execute(f"DELETE FROM mood_aggregates WHERE user_id = %s AND entry_date IN ({placeholders})", params)
+    
+    values = [(uid, day, bucket, mood, 1)
+              for uid, day, mood, exercise, social, sleep in rows
+              for bucket in day_buckets(exercise, social, sleep)]
+    if values:
+        cursor.executemany("""
+        INSERT INTO mood_aggregates (user_id, entry_date, bucket, mood_sum, entries)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE mood_sum = VALUES(mood_sum), entries = VALUES(entries)
+        """, values)
+
+LOAD_AGGREGATES_QUERY = """
+SELECT bucket, SUM(mood_sum), SUM(entries)
+FROM mood_aggregates
+WHERE user_id = %s AND entry_date >= DATE_SUB(CURDATE(), INTERVAL %s DAY)
+GROUP BY bucket
+"""
+
+def load_aggregates(user_id, cursor):
+    """Bucket -> (mood_sum, entries) over the insights window"""
+    cursor.execute(LOAD_AGGREGATES_QUERY, (user_id, INSIGHTS_WINDOW_DAYS))
+    
+    totals = {}
+    for row in cursor.fetchall():
+        bucket, mood_sum, entries = tuple(row.values()) if isinstance(row, dict) else row
+        totals[bucket] = (float(mood_sum), int(entries))
+    return totals
+
+# Threshold insights from the bucket aggregates
+def bucket_insights(user_id, cursor):
+    totals = load_aggregates(user_id, cursor)
+    count = lambda bucket: totals.get(bucket, (0, 0))[1]
+    mean = lambda bucket: totals[bucket][0] / totals[bucket][1]
+    insights = []
+    
+    if count('all') >= 3:
+        # Exercise insight
+        if count('exercise') >= 2 and count('no_exercise') >= 1:
+            exercise_avg = mean('exercise')
+            no_exercise_avg = mean('no_exercise')
             
-            if len(social_days) >= 2 and len(solo_days) >= 1:
-                social_avg = statistics.mean([d[0] for d in social_days])
-                solo_avg = statistics.mean([d[0] for d in solo_days])
+            if exercise_avg > no_exercise_avg + 0.5:
+                insights.append({
+                    'title': 'Exercise Mood Boost',
+                    'description': f'Your mood is {exercise_avg - no_exercise_avg:.1f} points higher on workout days!',
+                    'confidence_level': 'high'
+                })
+        
+        # Sleep insight
+        if count('sleep_logged') >= 3:
+            if count('good_sleep') >= 1 and count('poor_sleep') >= 1:
+                good_avg = mean('good_sleep')
+                poor_avg = mean('poor_sleep')
                 
-                if social_avg > solo_avg + 0.3:
+                if good_avg > poor_avg + 0.5:
                     insights.append({
-                        'title': 'Social Connection Power',
-                        'description': 'Social activities consistently boost your energy!',
-                        'confidence_level': 'high'
+                        'title': 'Sleep Quality Impact',
+                        'description': f'Good sleep improves your mood by {good_avg - poor_avg:.1f} points!',
+                        'confidence_level': 'medium'
                     })
         
-        return insights[:3]  # Return top 3 insights
+        # Social insight
+        if count('social') >= 2 and count('solo') >= 1:
+            social_avg = mean('social')
+            solo_avg = mean('solo')
+            
+            if social_avg > solo_avg + 0.3:
+                insights.append({
+                    'title': 'Social Connection Power',
+                    'description': 'Social activities consistently boost your energy!',
+                    'confidence_level': 'high'
+                })
+    
+    return insights
+
+# Permutation-tested insights over every activity column
+INSIGHTS_WINDOW_QUERY = """
+SELECT m.entry_date, m.mood_value,
+       a.sleep_hours, a.exercise_minutes, a.social_interaction, a.caffeine_intake, a.work_stress_level
+FROM mood_entries m
+LEFT JOIN activities a ON m.user_id = a.user_id AND m.entry_date = a.entry_date
+WHERE m.user_id = %s AND m.entry_date >= DATE_SUB(CURDATE(), INTERVAL %s DAY)
+ORDER BY m.entry_date
+"""
+
+def statistical_insights(user_id, cursor):
+    cursor.execute(INSIGHTS_WINDOW_QUERY, (user_id, INSIGHTS_WINDOW_DAYS))
+    rows = [tuple(row.values()) if isinstance(row, dict) else row for row in cursor.fetchall()]
+    return insights.evaluate_user(user_id, rows, date.today())
+
+def statistical_insights_from_rows(user_id, rows, version):
+    """Insights from a window the caller already has (e.g. returned by save_mood_entry)"""
+    results = insights.evaluate_user(user_id, rows, date.today())[:3]
+    insight_cache.put(user_id, version, results)
+    return results
+
+# Insight engines: 'statistical' (default) or 'buckets' (fixed thresholds on aggregates).
+# mood_aggregates is only kept up to date while 'buckets' is the engine, so after
+# switching to it run `python migrations.py --rebuild-aggregates` once.
+INSIGHT_ENGINES = {
+    'statistical': statistical_insights,
+    'buckets': bucket_insights
+}
+INSIGHT_ENGINE = os.getenv('INSIGHT_ENGINE', 'statistical')
+INSIGHT_CACHE_SIZE = int(os.getenv('INSIGHT_CACHE_SIZE', '10000'))
+
+# Per-user insight results for one data version (see data_version()) and day, so a
+# write handled by any process makes every process's copy stale
+class InsightCache:
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def get(self, user_id, version):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[0] == date.today() and entry[1] == version:
+                self._entries.move_to_end(user_id)
+                self.stats['hits'] += 1
+                return entry[2]
+            self.stats['misses'] += 1
+            return None
+
+    def put(self, user_id, version, results):
+        with self._lock:
+            self._entries[user_id] = (date.today(), version, results)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self.stats['invalidations'] += 1
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['size'] = len(self._entries)
+        stats['engine'] = INSIGHT_ENGINE
+        return stats
+
+
+insight_cache = InsightCache(max_size=INSIGHT_CACHE_SIZE)
+
+# Insights precomputed by precompute_insights.py (or written back after a live run),
+# valid for the day they were computed while the user's data version is the one they
+# were computed from. The store only lands if that version is still current, so a
+# result computed before a write can't replace what the write cleared.
+LOAD_PRECOMPUTED_QUERY = """
+SELECT p.insights FROM precomputed_insights p
+JOIN users u ON u.id = p.user_id AND u.data_version = p.data_version
+WHERE p.user_id = %s AND p.window_end = CURDATE()
+"""
+STORE_PRECOMPUTED_QUERY = """
+INSERT INTO precomputed_insights (user_id, insights, window_end, computed_at, data_version)
+SELECT id, %s, CURDATE(), NOW(), data_version FROM users WHERE id = %s AND data_version = %s
+ON DUPLICATE KEY UPDATE insights = VALUES(insights), window_end = VALUES(window_end),
+computed_at = VALUES(computed_at), data_version = VALUES(data_version)
+"""
+
+def load_precomputed(user_id, cursor):
+    cursor.execute(LOAD_PRECOMPUTED_QUERY, (user_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    value = row['insights'] if isinstance(row, dict) else row[0]
+    return json.loads(value)
+
+def store_precomputed(user_id, results, cursor, version):
+    cursor.execute(STORE_PRECOMPUTED_QUERY, (json.dumps(results), user_id, version))
+
+def clear_precomputed(user_id, cursor):
+    """Call inside the write transaction so stale insights can't outlive the write"""
+    cursor.execute("DELETE FROM precomputed_insights WHERE user_id = %s", (user_id,))
+
+# Every write to a user's entries bumps users.data_version in the same transaction
+# (save_mood_entry, write_entries, rebuild_streak); caches tag what they hold with the
+# version it was built from and compare it with the stored one before serving it
+DATA_VERSION_QUERY = "SELECT data_version FROM users WHERE id = %s"
+
+def data_version(cursor, user_id):
+    cursor.execute(DATA_VERSION_QUERY, (user_id,))
+    row = cursor.fetchone()
+    if isinstance(row, dict):
+        row = tuple(row.values())
+    return row[0] if row else 0
+
+def bump_data_version(cursor, user_id):
+    cursor.execute("UPDATE users SET data_version = data_version + 1 WHERE id = %s", (user_id,))
+
+# Drop this process's copies of a user's derived data after they write (other
+# processes notice the new data version)
+def invalidate_user_caches(user_id):
+    """Returns the write's replication stamp (None without replicas) for the user's session"""
+    insight_cache.invalidate(user_id)
+    dashboard_cache.invalidate(user_id)
+    
+    # Their next reads have to see this write, so replicas must catch up first
+    if replica_router:
+        stamp = replica_router.note_write(user_id)
+        if has_request_context() and session.get('user_id') == user_id:
+            session['last_write'] = stamp
+        return stamp
+    return None
+
+# Generate insights from user data
+def generate_insights(user_id, cursor, writable=True, version=None):
+    """writable=False (a replica cursor) skips writing results back to precomputed_insights;
+    version is the user's data_version if the caller has already read it"""
+    try:
+        if version is None:
+            version = data_version(cursor, user_id)
+        cached = insight_cache.get(user_id, version)
+        if cached is not None:
+            return cached
         
+        # Statistical results are shared through the precomputed table
+        if INSIGHT_ENGINE == 'statistical':
+            results = load_precomputed(user_id, cursor)
+            if results is None:
+                results = statistical_insights(user_id, cursor)[:3]  # Return top 3 insights
+                if writable:
+                    store_precomputed(user_id, results, cursor, version)
+        else:
+            results = INSIGHT_ENGINES[INSIGHT_ENGINE](user_id, cursor)[:3]
     except Exception as e:
-        print(f"Insight error: {e}")
+        instrumentation.report_error('Insight', e)
         return []
+    
+    insight_cache.put(user_id, version, results)
+    return results
+
+# Graceful shutdown for a worker: finish queued sentiment jobs, then release pools
+def shutdown(timeout=30.0):
+    dropped = sentiment_jobs.drain(timeout)
+    if dropped:
+        app.logger.warning('Shutdown: %d sentiment jobs did not finish in %.0fs', dropped, timeout)
+    sentiment_batcher.shutdown()
+    password_hasher.shutdown()
+    for pool in all_pools():
+        pool.close_all()
+
+# Request timing, per-query DB timings and the optional slow-request profiler
+profiler = None
+if PROFILE_SLOW_MS:
+    profiler = instrumentation.SamplingProfiler(float(PROFILE_SLOW_MS), PROFILE_INTERVAL_MS, PROFILE_DIR)
+instrumentation.init_app(app, profiler)
+
+admission_controller = None
+if ADMISSION_CONTROL:
+    store = admission.SQLiteStore(ADMISSION_STORE_DB) if ADMISSION_STORE_DB else admission.MemoryStore()
+    admission_controller = admission.AdmissionController(store, max_inflight=ADMISSION_MAX_INFLIGHT)
+    admission.init_app(app, admission_controller)
+
+# Writes for a user who is being moved between shards are turned away the same way
+@app.errorhandler(admission.Rejected)
+def rejected_response(rejected):
+    return admission.rejection_response(rejected)
 
 # API ENDPOINTS
 
@@ -176,13 +1926,123 @@ def health_check():
     
     ai_status = "ready" if HUGGING_FACE_API_KEY else "no key"
     
+    breaker = sentiment_breaker.metrics()
     return jsonify({
-        'status': 'healthy',
+        'status': 'degraded' if breaker['state'] != 'closed' else 'healthy',
         'database': db_status,
+        'db_pool': db_pool.metrics(),
+        'sentiment_cache': sentiment_cache.metrics(),
+        'sentiment_batching': sentiment_batcher.metrics(),
+        'sentiment_breaker': breaker,
+        'replicas': replica_router.metrics() if replica_router else None,
+        'shards': shard_router.metrics() if shard_router else None,
+        'admission': admission_controller.metrics() if admission_controller else None,
+        'dashboard_cache': dashboard_cache.metrics(),
+        'insight_cache': insight_cache.metrics(),
+        'password_hashing': password_hasher.metrics(),
         'ai': ai_status,
+        'sentiment_engines': [engine.name for engine in sentiment_engines if engine.available()],
         'message': 'Mood Journal API is running!'
     })
 
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text exposition of request timings plus the component stats from /api/health"""
+    components = {
+        'db_pool': db_pool.metrics(),
+        'sentiment_cache': sentiment_cache.metrics(),
+        'sentiment_batching': sentiment_batcher.metrics(),
+        'sentiment_breaker': sentiment_breaker.metrics(),
+        'dashboard_cache': dashboard_cache.metrics(),
+        'insight_cache': insight_cache.metrics(),
+        'password_hashing': password_hasher.metrics(),
+    }
+    if profiler:
+        components['profiler'] = profiler.metrics()
+    if admission_controller:
+        components['admission'] = admission_controller.metrics()
+    if shard_router:
+        components['shards'] = shard_router.metrics()
+    
+    gauges = [(f'mood_{component}_{name}', {}, value)
+              for component, stats in components.items()
+              for name, value in stats.items()
+              if isinstance(value, (int, float)) and not isinstance(value, bool)]
+    return Response(instrumentation.registry.render(gauges), mimetype='text/plain; version=0.0.4')
+
+# Users: with sharding the directory allocates the ID (unique across shards) and the
+# user row goes to the shard the ring picks for it
+def create_user(username, email, password_hash, first_name, age_range):
+    """New user's ID (None if the database is down); IntegrityError if the username or email is taken"""
+    db = get_db()
+    if not db:
+        return None
+    
+    cursor = db.cursor()
+    try:
+        if not shard_router:
+            cursor.execute("""
+            INSERT INTO users (username, email, password_hash, first_name, age_range)
+            VALUES (%s, %s, %s, %s, %s)
+            """, (username, email, password_hash, first_name, age_range))
+            return cursor.lastrowid
+        
+        # 'new' until the user row exists, so the rebalancer leaves it alone
+        cursor.execute("INSERT INTO user_directory (username, email, state) VALUES (%s, %s, 'new')",
+                       (username, email))
+        user_id = cursor.lastrowid
+        shard = shard_router.place(user_id)
+        try:
+            shard_db = get_db(shard=shard)
+            if not shard_db:
+                raise RuntimeError(f'Shard {shard} unavailable')
+            shard_cursor = shard_db.cursor()
+            try:
+                shard_cursor.execute("""
+                INSERT INTO users (id, username, email, password_hash, first_name, age_range)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                """, (user_id, username, email, password_hash, first_name, age_range))
+            finally:
+                shard_cursor.close()
+                shard_db.close()
+        except Exception:
+            # Free the username and email again
+            cursor.execute("DELETE FROM user_directory WHERE user_id = %s", (user_id,))
+            raise
+        cursor.execute("UPDATE user_directory SET shard = %s, state = 'active' WHERE user_id = %s", (shard, user_id))
+        return user_id
+    finally:
+        cursor.close()
+        db.close()
+
+def find_user(email):
+    """users row (as a dict) for an email, or None"""
+    shard = None
+    if shard_router:
+        db = get_db()
+        if not db:
+            raise RuntimeError('Database error')
+        cursor = db.cursor()
+        try:
+            cursor.execute("SELECT shard FROM user_directory WHERE email = %s", (email,))
+            row = cursor.fetchone()
+        finally:
+            cursor.close()
+            db.close()
+        # No directory row: a user from before sharding, on the default shard
+        shard = (row[0] if row else None) or shard_router.default
+    
+    db = get_db(shard=shard)
+    if not db:
+        raise RuntimeError('Database error')
+    cursor = db.cursor(dictionary=True)
+    try:
+        cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
+        return cursor.fetchone()
+    finally:
+        cursor.close()
+        db.close()
+
 @app.route('/api/register', methods=['POST'])
 def register():
     """Register new user"""
@@ -197,38 +2057,29 @@ def register():
     if len(data['password']) < 6:
         return jsonify({'error': 'Password must be at least 6 characters'}), 400
     
-    db = get_db()
-    if not db:
-        return jsonify({'error': 'Database error'}), 500
-    
-    cursor = db.cursor()
+    # Hash password before borrowing a DB connection
+    try:
+        password_hash = password_hasher.hash(data['password'])
+    except HasherBusy:
+        return busy_response()
     
     try:
-        # Hash password
-        password_hash = bcrypt.hashpw(data['password'].encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-        
-        # Insert user
-        cursor.execute("""
-        INSERT INTO users (username, email, password_hash, first_name, age_range)
-        VALUES (%s, %s, %s, %s, %s)
-        """, (data['username'], data['email'], password_hash, data['first_name'], data.get('age_range', '25-34')))
-        
-        user_id = cursor.lastrowid
-        session['user_id'] = user_id
-        
-        return jsonify({
-            'success': True,
-            'user_id': user_id,
-            'message': f'Welcome {data["first_name"]}!'
-        })
-        
+        user_id = create_user(data['username'], data['email'], password_hash, data['first_name'],
+                              data.get('age_range', '25-34'))
     except mysql.connector.IntegrityError:
         return jsonify({'error': 'Username or email already exists'}), 400
     except Exception as e:
+        instrumentation.report_error('Registration', e)
         return jsonify({'error': 'Registration failed'}), 500
-    finally:
-        cursor.close()
-        db.close()
+    if user_id is None:
+        return jsonify({'error': 'Database error'}), 500
+    
+    session['user_id'] = user_id
+    return jsonify({
+        'success': True,
+        'user_id': user_id,
+        'message': f'Welcome {data["first_name"]}!'
+    })
 
 @app.route('/api/login', methods=['POST'])
 def login():
@@ -238,32 +2089,68 @@ def login():
     if not data.get('email') or not data.get('password'):
         return jsonify({'error': 'Email and password required'}), 400
     
-    db = get_db()
-    if not db:
-        return jsonify({'error': 'Database error'}), 500
-    
-    cursor = db.cursor(dictionary=True)
+    # find_user() hands its connections back before bcrypt runs
+    try:
+        user = find_user(data['email'])
+    except Exception as e:
+        instrumentation.report_error('Login', e)
+        return jsonify({'error': 'Login failed'}), 500
     
     try:
-        cursor.execute("SELECT * FROM users WHERE email = %s", (data['email'],))
-        user = cursor.fetchone()
-        
-        if user and bcrypt.checkpw(data['password'].encode('utf-8'), user['password_hash'].encode('utf-8')):
-            session['user_id'] = user['id']
-            return jsonify({
-                'success': True,
-                'user_id': user['id'],
-                'first_name': user['first_name']
-            })
-        else:
+        if not user or not password_hasher.check(data['password'], user['password_hash']):
             return jsonify({'error': 'Invalid credentials'}), 401
-            
+        
+        # Upgrade the stored hash if the cost factor has gone up since it was made
+        if password_hasher.needs_rehash(user['password_hash']):
+            rehash_password(user['id'], data['password'])
+    except HasherBusy:
+        return busy_response()
     except Exception as e:
+        instrumentation.report_error('Login', e)
         return jsonify({'error': 'Login failed'}), 500
+    
+    session['user_id'] = user['id']
+    return jsonify({
+        'success': True,
+        'user_id': user['id'],
+        'first_name': user['first_name']
+    })
+
+def rehash_password(user_id, password):
+    """Best effort - a failed rehash is retried on the next login"""
+    try:
+        password_hash = password_hasher.hash(password)
+    except HasherBusy:
+        return
+    
+    try:
+        db = get_db(user_id=user_id)
+    except admission.Rejected:
+        return  # being moved to another shard
+    if not db:
+        return
+    
+    cursor = db.cursor()
+    try:
+        cursor.execute("UPDATE users SET password_hash = %s WHERE id = %s", (password_hash, user_id))
+        password_hasher.count_rehash()
+    except Exception as e:
+        instrumentation.report_error('Rehash', e)
     finally:
         cursor.close()
         db.close()
 
+# save_mood_entry() arguments for a request body
+SAVE_MOOD_CALL = "CALL save_mood_entry(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
+
+def save_mood_params(user_id, data, today):
+    act = data.get('activities')
+    return (user_id, today, datetime.now().time(), data['mood_value'], data['mood_label'],
+            data.get('quick_note', ''), act is not None, (act or {}).get('sleep_hours'),
+            (act or {}).get('exercise_minutes', 0), (act or {}).get('social_interaction', False),
+            (act or {}).get('caffeine_intake', 0), (act or {}).get('work_stress_level', 5),
+            INSIGHTS_WINDOW_DAYS, INSIGHT_ENGINE == 'buckets')
+
 @app.route('/api/mood-entry', methods=['POST'])
 @login_required
 def save_mood():
@@ -271,7 +2158,7 @@ def save_mood():
     data = request.get_json()
     user_id = session['user_id']
     
-    db = get_db()
+    db = get_db(user_id=user_id)
     if not db:
         return jsonify({'error': 'Database error'}), 500
     
@@ -279,36 +2166,28 @@ def save_mood():
     
     try:
         today = date.today()
-        now = datetime.now().time()
-        
-        # Save mood entry
-        cursor.execute("""
-        INSERT INTO mood_entries (user_id, mood_value, mood_label, entry_date, entry_time, quick_note)
-        VALUES (%s, %s, %s, %s, %s, %s)
-        ON DUPLICATE KEY UPDATE 
-        mood_value = VALUES(mood_value), mood_label = VALUES(mood_label), quick_note = VALUES(quick_note)
-        """, (user_id, data['mood_value'], data['mood_label'], today, now, data.get('quick_note', '')))
         
-        # Save activities if provided
-        if 'activities' in data:
-            act = data['activities']
-            cursor.execute("""
-            INSERT INTO activities (user_id, entry_date, sleep_hours, exercise_minutes, social_interaction, caffeine_intake, work_stress_level)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            ON DUPLICATE KEY UPDATE 
-            sleep_hours = VALUES(sleep_hours), exercise_minutes = VALUES(exercise_minutes), 
-            social_interaction = VALUES(social_interaction), caffeine_intake = VALUES(caffeine_intake), 
-            work_stress_level = VALUES(work_stress_level)
-            """, (user_id, today, act.get('sleep_hours'), act.get('exercise_minutes', 0), 
-                  act.get('social_interaction', False), act.get('caffeine_intake', 0), act.get('work_stress_level', 5)))
+        # One CALL writes the entry, activities, streak (and bucket aggregates, for that
+        # engine) in a single transaction and hands back the insights window (see migrations.py)
+        version_rows, rows = call_procedure(cursor, SAVE_MOOD_CALL, save_mood_params(user_id, data, today))
         
-        # AI analysis
+        # AI analysis runs in the background so saves don't wait on the model (the job
+        # row is written before the read-your-writes stamp, so polls can see it)
         ai_result = None
         if data.get('quick_note'):
-            ai_result = analyze_sentiment(data['quick_note'])
+            job_id = sentiment_jobs.submit(cursor, user_id, today, data['quick_note'])
+            ai_result = {
+                'status': 'pending',
+                'job_id': job_id,
+                'message': 'Analyzing your note...'
+            }
+        invalidate_user_caches(user_id)
         
         # Generate insights
-        insights = generate_insights(user_id, cursor)
+        if INSIGHT_ENGINE == 'statistical':
+            insights = statistical_insights_from_rows(user_id, rows, version_rows[0][0])
+        else:
+            insights = generate_insights(user_id, cursor)
         
         return jsonify({
             'success': True,
@@ -318,149 +2197,694 @@ def save_mood():
         })
         
     except Exception as e:
+        instrumentation.report_error('Save', e)
         return jsonify({'error': 'Failed to save mood'}), 500
     finally:
         cursor.close()
         db.close()
 
+@app.route('/api/sentiment/<job_id>', methods=['GET'])
+@login_required
+def sentiment_status(job_id):
+    """Poll the result of a background sentiment job"""
+    try:
+        job = sentiment_jobs.get(job_id, session['user_id'])
+    except Exception as e:
+        instrumentation.report_error('Sentiment job', e)
+        return jsonify({'error': 'Database error'}), 500
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+
+    return jsonify({
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'entry_date': job['entry_date'],
+        'ai_analysis': job['result']
+    })
+
+DASHBOARD_QUERY = """
+SELECT m.entry_date, m.mood_value, m.mood_label, m.quick_note,
+       a.sleep_hours, a.exercise_minutes, a.social_interaction, a.work_stress_level,
+       s.current_streak, s.longest_streak
+FROM mood_entries m
+LEFT JOIN activities a ON m.user_id = a.user_id AND m.entry_date = a.entry_date
+LEFT JOIN user_streaks s ON s.user_id = m.user_id
+WHERE m.user_id = %s AND m.entry_date >= DATE_SUB(CURDATE(), INTERVAL 7 DAY)
+ORDER BY m.entry_date DESC
+"""
+
+# Dashboard body from DASHBOARD_QUERY rows (as dicts) and the user's insights
+def dashboard_payload(mood_data, insights):
+    # Convert dates to strings
+    streak = longest_streak = 0
+    for entry in mood_data:
+        entry['day'] = entry['entry_date'].strftime('%a')
+        entry['entry_date'] = entry['entry_date'].isoformat()
+        streak = entry.pop('current_streak') or 0
+        longest_streak = entry.pop('longest_streak') or 0
+    
+    # Calculate stats
+    if mood_data:
+        moods = [entry['mood_value'] for entry in mood_data]
+        avg_mood = statistics.mean(moods)
+        trend = "improving" if len(mood_data) > 2 and moods[0] > moods[-1] else "stable"
+    else:
+        avg_mood = 0
+        trend = "starting"
+    
+    return {
+        'mood_data': mood_data,
+        'insights': insights,
+        'stats': {
+            'current_streak': streak,
+            'longest_streak': longest_streak,
+            'average_mood': round(avg_mood, 1),
+            'trend': trend,
+            'total_entries': len(mood_data)
+        }
+    }
+
 @app.route('/api/dashboard', methods=['GET'])
 @login_required
 def dashboard():
     """Get dashboard with mood trends and insights"""
     user_id = session['user_id']
     
-    db = get_db()
+    # With shared stamps a cached dashboard (or a 304) is answered without touching MySQL
+    stamp = dashboard_cache.stamp(user_id)
+    if stamp is not None:
+        cached = dashboard_cache.get(user_id, stamp)
+        if cached:
+            return dashboard_response(*cached)
+    
+    db = get_db(read_only=True, since=read_since(user_id), user_id=user_id)
     if not db:
         return jsonify({'error': 'Database error'}), 500
     
     cursor = db.cursor(dictionary=True)
     
     try:
-        # Get last 7 days
-        cursor.execute("""
-        SELECT m.entry_date, m.mood_value, m.mood_label, m.quick_note,
-               a.sleep_hours, a.exercise_minutes, a.social_interaction, a.work_stress_level
-        FROM mood_entries m
-        LEFT JOIN activities a ON m.user_id = a.user_id AND m.entry_date = a.entry_date
-        WHERE m.user_id = %s AND m.entry_date >= DATE_SUB(CURDATE(), INTERVAL 7 DAY)
-        ORDER BY m.entry_date DESC
-        """, (user_id,))
+        version = None
+        if not dashboard_cache.shared_stamps:
+            # One primary-key read decides whether the cached copy is still current
+            version = data_version(cursor, user_id)
+            cached = dashboard_cache.get(user_id, version)
+            if cached:
+                return dashboard_response(*cached)
         
+        # Get last 7 days, with streak state riding along on each row
+        cursor.execute(DASHBOARD_QUERY, (user_id,))
         mood_data = cursor.fetchall()
         
-        # Convert dates to strings
-        for entry in mood_data:
-            entry['entry_date'] = entry['entry_date'].strftime('%Y-%m-%d')
-            entry['day'] = datetime.strptime(entry['entry_date'], '%Y-%m-%d').strftime('%a')
-        
-        # Calculate stats
-        if mood_data:
-            moods = [entry['mood_value'] for entry in mood_data]
-            avg_mood = statistics.mean(moods)
-            streak = calculate_streak(user_id, cursor)
-            trend = "improving" if len(mood_data) > 2 and moods[0] > moods[-1] else "stable"
-        else:
-            avg_mood = 0
-            streak = 0
-            trend = "starting"
-        
         # Get insights
-        insights = generate_insights(user_id, cursor)
+        insights = generate_insights(user_id, cursor, writable=db.role == 'primary', version=version)
         
-        return jsonify({
-            'mood_data': mood_data,
-            'insights': insights,
-            'stats': {
-                'current_streak': streak,
-                'average_mood': round(avg_mood, 1),
-                'trend': trend,
-                'total_entries': len(mood_data)
-            }
-        })
+        payload_json = app.json.dumps(dashboard_payload(mood_data, insights))
+        etag = dashboard_cache.put(user_id, stamp if dashboard_cache.shared_stamps else version, payload_json)
+        
+        return dashboard_response(payload_json, etag)
         
     except Exception as e:
+        instrumentation.report_error('Dashboard', e)
         return jsonify({'error': 'Dashboard failed'}), 500
     finally:
         cursor.close()
         db.close()
 
-def calculate_streak(user_id, cursor):
-    """Calculate consecutive check-in days"""
+# Streak state per user: the run ending at the latest entry, plus the best run ever
+def streak_runs(dates):
+    """(current, longest) run lengths for ascending, distinct dates"""
+    current = longest = 0
+    previous = None
+    for day in dates:
+        current = current + 1 if previous and day - previous == timedelta(days=1) else 1
+        longest = max(longest, current)
+        previous = day
+    return current, longest
+
+def streak_history_query(user_id=None, archived=True):
+    """(sql, params) listing the days with a mood entry, per user in date order"""
+    where = "WHERE user_id = %s" if user_id else "WHERE TRUE"
+    params = (user_id,) if user_id else ()
+    # Archived days count too (archived=False only before mood_archive exists)
+    archive = f"UNION SELECT user_id, entry_date FROM mood_archive {where} AND mood_value IS NOT NULL" \
+        if archived else ""
+    return f"""
+    SELECT user_id, entry_date FROM mood_entries {where}
+    {archive}
+    ORDER BY user_id, entry_date
+    """, params * 2 if archived else params
+
+def rebuild_streak(cursor, user_id=None, archived=True):
+    """Recompute streaks from the full entry history (one user, or everyone when backfilling)"""
+    cursor.execute(*streak_history_query(user_id, archived))
+    
+    history = {}
+    for row in cursor.fetchall():
+        uid, day = tuple(row.values()) if isinstance(row, dict) else row
+        history.setdefault(uid, []).append(day)
+    
+    values = [(uid, *streak_runs(dates), dates[-1]) for uid, dates in history.items()]
+    if values:
+        cursor.executemany("""
+        INSERT INTO user_streaks (user_id, current_streak, longest_streak, last_entry_date)
+        VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE current_streak = VALUES(current_streak),
+        longest_streak = VALUES(longest_streak), last_entry_date = VALUES(last_entry_date)
+        """, values)
+    if user_id:
+        bump_data_version(cursor, user_id)
+
+# Days before this date have been archived (archive_entries.py moves it forward)
+def archived_until(cursor):
+    cursor.execute("SELECT watermark FROM job_watermarks WHERE job = 'archive_entries'")
+    row = cursor.fetchone()
+    if isinstance(row, dict):
+        row = tuple(row.values())
+    return row[0] if row else None
+
+def write_archived_entries(cursor, user_id, rows, overwrite=True):
+    """write_entries() for days that are already archived: one mood_archive row per day"""
+    ignore = '' if overwrite else 'IGNORE'
+    mood_update = "mood_value = VALUES(mood_value), mood_label = VALUES(mood_label), quick_note = VALUES(quick_note)"
+    activity_update = """, sleep_hours = VALUES(sleep_hours), exercise_minutes = VALUES(exercise_minutes),
+    social_interaction = VALUES(social_interaction), caffeine_intake = VALUES(caffeine_intake),
+    work_stress_level = VALUES(work_stress_level)"""
+    
+    # Days without activities leave any stored activity columns alone
+    for with_activities in (True, False):
+        values = []
+        for row in rows:
+            act = row.get('activities')
+            if (act is not None) != with_activities:
+                continue
+            activity = (act.get('sleep_hours'), act.get('exercise_minutes', 0), act.get('social_interaction', False),
+                        act.get('caffeine_intake', 0), act.get('work_stress_level', 5)) if act is not None else (None,) * 5
+            values.append((user_id, row['entry_date'], row['entry_time'], row['mood_value'], row['mood_label'],
+                           row['quick_note'], *activity))
+        if not values:
+            continue
+        update = f"ON DUPLICATE KEY UPDATE {mood_update}{activity_update if with_activities else ''}" if overwrite else ''
+        cursor.executemany(f"""
+        INSERT {ignore} INTO mood_archive (user_id, entry_date, entry_time, mood_value, mood_label, quick_note,
+                                           sleep_hours, exercise_minutes, social_interaction, caffeine_intake,
+                                           work_stress_level)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        {update}
+        """, values)
+
+# Write many days at once with multi-row upserts (overwrite=False keeps existing days)
+def write_entries(cursor, user_id, rows, overwrite=True):
+    # Imported history from before the archive watermark goes straight to the archive
+    boundary = archived_until(cursor)
+    if boundary:
+        write_archived_entries(cursor, user_id, [row for row in rows if row['entry_date'] < boundary], overwrite)
+        rows = [row for row in rows if row['entry_date'] >= boundary]
+        if not rows:
+            return
+    
+    ignore = '' if overwrite else 'IGNORE'
+    mood_update = """
+    ON DUPLICATE KEY UPDATE 
+    mood_value = VALUES(mood_value), mood_label = VALUES(mood_label), quick_note = VALUES(quick_note)
+    """ if overwrite else ''
+    activity_update = """
+    ON DUPLICATE KEY UPDATE 
+    sleep_hours = VALUES(sleep_hours), exercise_minutes = VALUES(exercise_minutes), 
+    social_interaction = VALUES(social_interaction), caffeine_intake = VALUES(caffeine_intake), 
+    work_stress_level = VALUES(work_stress_level)
+    """ if overwrite else ''
+    
+    cursor.executemany(f"""
+    INSERT {ignore} INTO mood_entries (user_id, mood_value, mood_label, entry_date, entry_time, quick_note)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    {mood_update}
+    """, [(user_id, row['mood_value'], row['mood_label'], row['entry_date'], row['entry_time'], row['quick_note'])
+          for row in rows])
+    
+    activities = [(user_id, row['entry_date'], act.get('sleep_hours'), act.get('exercise_minutes', 0),
+                   act.get('social_interaction', False), act.get('caffeine_intake', 0), act.get('work_stress_level', 5))
+                  for row in rows if (act := row.get('activities')) is not None]
+    if activities:
+        cursor.executemany(f"""
+        INSERT {ignore} INTO activities (user_id, entry_date, sleep_hours, exercise_minutes, social_interaction, caffeine_intake, work_stress_level)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        {activity_update}
+        """, activities)
+    
+    if INSIGHT_ENGINE == 'buckets':
+        refresh_aggregates(cursor, user_id, sorted({row['entry_date'] for row in rows}))
+    clear_precomputed(user_id, cursor)
+    bump_data_version(cursor, user_id)
+
+# Bulk import settings
+IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', '1000'))
+IMPORT_MAX_ERRORS = int(os.getenv('IMPORT_MAX_ERRORS', '100'))
+ACTIVITY_FIELDS = ['sleep_hours', 'exercise_minutes', 'social_interaction', 'caffeine_intake', 'work_stress_level']
+# Values outside these would make MySQL reject the whole chunk, so they fail their row instead
+ACTIVITY_RANGES = {
+    'sleep_hours': (0, 24),
+    'exercise_minutes': (0, 1440),
+    'caffeine_intake': (0, 50),
+    'work_stress_level': (1, 10)
+}
+QUICK_NOTE_MAX_BYTES = 65535  # TEXT column
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y')
+
+def parse_whole_number(value):
+    """'7', '7.0', 7 and 7.0 are 7; int() would refuse '7.0' and silently truncate 7.5"""
+    if isinstance(value, bool):
+        raise ValueError('not a number')
+    number = float(value)
+    if not number.is_integer():
+        raise ValueError('not a whole number')
+    return int(number)
+
+def parse_import_row(raw):
+    """Validate one imported row, raising ValueError with a readable reason"""
+    if not isinstance(raw, dict):
+        raise ValueError('row must be an object')
+    raw = {key: value for key, value in raw.items() if value not in (None, '')}
+    
+    try:
+        entry_date = date.fromisoformat(str(raw['entry_date']))
+    except KeyError:
+        raise ValueError('entry_date is required')
+    except ValueError:
+        raise ValueError('entry_date must be YYYY-MM-DD')
+    if entry_date > date.today():
+        raise ValueError('entry_date is in the future')
+    
+    try:
+        mood_value = parse_whole_number(raw['mood_value'])
+    except KeyError:
+        raise ValueError('mood_value is required')
+    except (TypeError, ValueError):
+        raise ValueError('mood_value must be a whole number')
+    if not 1 <= mood_value <= 10:
+        raise ValueError('mood_value must be between 1 and 10')
+    
+    try:
+        entry_time = time_of_day.fromisoformat(str(raw.get('entry_time', '12:00:00')))
+    except ValueError:
+        raise ValueError('entry_time must be HH:MM or HH:MM:SS')
+    if entry_time.tzinfo is not None:
+        raise ValueError('entry_time must not have a time zone')
+    
+    quick_note = str(raw.get('quick_note', ''))
+    if len(quick_note.encode('utf-8')) > QUICK_NOTE_MAX_BYTES:
+        raise ValueError('quick_note is too long')
+    
+    row = {
+        'entry_date': entry_date,
+        'entry_time': entry_time,
+        'mood_value': mood_value,
+        'mood_label': str(raw.get('mood_label', ''))[:50],
+        'quick_note': quick_note,
+        'activities': None
+    }
+    
+    if any(field in raw for field in ACTIVITY_FIELDS):
+        try:
+            row['activities'] = {
+                'sleep_hours': float(raw['sleep_hours']) if 'sleep_hours' in raw else None,
+                'exercise_minutes': int(raw.get('exercise_minutes', 0)),
+                'social_interaction': parse_bool(raw.get('social_interaction', False)),
+                'caffeine_intake': int(raw.get('caffeine_intake', 0)),
+                'work_stress_level': int(raw.get('work_stress_level', 5))
+            }
+        except ValueError:
+            raise ValueError('activity fields must be numbers')
+        
+        for field, (low, high) in ACTIVITY_RANGES.items():
+            value = row['activities'][field]
+            if value is not None and not low <= value <= high:
+                raise ValueError(f'{field} must be between {low} and {high}')
+    return row
+
+class UnreadableUpload(Exception):
+    """The upload itself can't be read any further (not UTF-8, or CSV the parser gives up on)"""
+    pass
+
+def read_import_rows(stream, fmt):
+    """Yield (line_number, raw_row_or_error) from an NDJSON or CSV upload without buffering it;
+    a bad row is yielded as its error; a body that stops being readable raises UnreadableUpload"""
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    line_number = 0
+    try:
+        if fmt == 'csv':
+            reader = csv.DictReader(text)
+            for raw in reader:
+                line_number = reader.line_num
+                yield line_number, raw
+        else:
+            for line_number, line in enumerate(text, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except (ValueError, RecursionError):  # RecursionError: nested too deeply to parse
+                    yield line_number, ValueError('invalid JSON')
+    except UnicodeDecodeError:
+        raise UnreadableUpload(f'upload is not valid UTF-8 (after line {line_number})')
+    except csv.Error as e:
+        raise UnreadableUpload(f'invalid CSV after line {line_number}: {e}')
+
+@app.route('/api/import', methods=['POST'])
+@login_required
+def import_entries():
+    """Bulk import mood history from NDJSON or CSV (?format=csv or a text/csv body)"""
+    user_id = session['user_id']
+    fmt = request.args.get('format') or ('csv' if 'csv' in (request.mimetype or '') else 'ndjson')
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    
+    db = get_db(user_id=user_id)
+    if not db:
+        return jsonify({'error': 'Database error'}), 500
+    
+    cursor = db.cursor()
+    started = time.perf_counter()
+    report = {'rows_read': 0, 'rows_imported': 0, 'rows_failed': 0, 'chunks': 0, 'errors': []}
+    
+    def flush(chunk):
+        db.start_transaction()
+        write_entries(cursor, user_id, chunk)
+        db.commit()
+        report['rows_imported'] += len(chunk)
+        report['chunks'] += 1
+    
     try:
-        cursor.execute("""
-        SELECT entry_date FROM mood_entries 
-        WHERE user_id = %s 
-        ORDER BY entry_date DESC LIMIT 30
-        """, (user_id,))
         
-        dates = [row[0] for row in cursor.fetchall()]
-        if not dates:
-            return 0
+        chunk = []
+        for line_number, raw in read_import_rows(request.stream, fmt):
+            report['rows_read'] += 1
+            try:
+                if isinstance(raw, Exception):
+                    raise raw
+                chunk.append(parse_import_row(raw))
+            except (ValueError, TypeError) as e:
+                report['rows_failed'] += 1
+                if len(report['errors']) < IMPORT_MAX_ERRORS:
+                    report['errors'].append({'line': line_number, 'error': str(e)})
+                continue
+            
+            if len(chunk) >= IMPORT_CHUNK_SIZE:
+                flush(chunk)
+                chunk = []
+        if chunk:
+            flush(chunk)
         
-        streak = 1
-        current = dates[0]
+        rebuild_streak(cursor, user_id)
         
-        for i in range(1, len(dates)):
-            expected = current - timedelta(days=i)
-            if dates[i] == expected:
-                streak += 1
-            else:
-                break
+    except UnreadableUpload as e:
+        if db.in_transaction:
+            db.rollback()
+        report['error'] = f'{e} - rows before the failing chunk were saved'
+        status = 400
+    except Exception as e:
+        instrumentation.report_error('Import', e)
+        if db.in_transaction:
+            db.rollback()
+        report['error'] = 'Import stopped early - rows before the failing chunk were saved'
+        status = 500
+    finally:
+        cursor.close()
+        db.close()
+        invalidate_user_caches(user_id)
+    
+    elapsed = time.perf_counter() - started
+    report['elapsed_seconds'] = round(elapsed, 3)
+    report['rows_per_second'] = round(report['rows_imported'] / elapsed) if elapsed else 0
+    report['success'] = 'error' not in report
+    return jsonify(report), 200 if report['success'] else status
+
+# Export settings
+EXPORT_PAGE_SIZE = int(os.getenv('EXPORT_PAGE_SIZE', '1000'))
+EXPORT_COLUMNS = ['entry_date', 'entry_time', 'mood_value', 'mood_label', 'quick_note', 'sentiment_score',
+                  'sleep_hours', 'exercise_minutes', 'social_interaction', 'caffeine_intake', 'work_stress_level']
+
+# Keyset pages: archived days before the watermark, then the live tables from it on
+EXPORT_ARCHIVE_QUERY = """
+SELECT entry_date, entry_time, mood_value, mood_label, quick_note, sentiment_score,
+       sleep_hours, exercise_minutes, social_interaction, caffeine_intake, work_stress_level
+FROM mood_archive
+WHERE user_id = %s AND entry_date > %s AND entry_date < %s AND mood_value IS NOT NULL
+ORDER BY entry_date
+LIMIT %s
+"""
+
+EXPORT_LIVE_QUERY = """
+SELECT m.entry_date, m.entry_time, m.mood_value, m.mood_label, m.quick_note, m.sentiment_score,
+       a.sleep_hours, a.exercise_minutes, a.social_interaction, a.caffeine_intake, a.work_stress_level
+FROM mood_entries m
+LEFT JOIN activities a ON m.user_id = a.user_id AND m.entry_date = a.entry_date
+WHERE m.user_id = %s AND m.entry_date > %s AND m.entry_date >= %s
+ORDER BY m.entry_date
+LIMIT %s
+"""
+
+def export_pages(user_id, page_size=EXPORT_PAGE_SIZE, since=0.0):
+    """Yield lists of JSON-ready rows, one keyset page at a time, in date order"""
+    db = get_db(read_only=True, since=since, user_id=user_id)
+    if not db:
+        raise RuntimeError('Database error')
+    
+    cursor = db.cursor()
+    try:
+        boundary = archived_until(cursor)
+        sources = [(EXPORT_ARCHIVE_QUERY, boundary)] if boundary else []
+        sources.append((EXPORT_LIVE_QUERY, boundary or date.min))
         
-        return streak
-    except:
-        return 0
+        last_date = date.min
+        for query, bound in sources:
+            while True:
+                cursor.execute(query, (user_id, last_date, bound, page_size))
+                
+                page = []
+                for row in cursor:
+                    page.append({column: export_value(value) for column, value in zip(EXPORT_COLUMNS, row)})
+                    last_date = row[0]
+                
+                if page:
+                    yield page
+                if len(page) < page_size:
+                    break
+    finally:
+        cursor.close()
+        db.close()
+
+def export_value(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return str(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+def export_ndjson(pages):
+    for page in pages:
+        yield ''.join(json.dumps(row) + '\n' for row in page)
+
+def export_csv(pages):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    for page in pages:
+        writer.writerows(page)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def export_arrow(pages):
+    schema = pyarrow.schema([
+        ('entry_date', pyarrow.string()), ('entry_time', pyarrow.string()),
+        ('mood_value', pyarrow.int32()), ('mood_label', pyarrow.string()),
+        ('quick_note', pyarrow.string()), ('sentiment_score', pyarrow.float64()),
+        ('sleep_hours', pyarrow.float64()), ('exercise_minutes', pyarrow.int32()),
+        ('social_interaction', pyarrow.bool_()), ('caffeine_intake', pyarrow.int32()),
+        ('work_stress_level', pyarrow.int32())
+    ])
+    sink = io.BytesIO()
+    writer = pyarrow.ipc.new_stream(sink, schema)
+    for page in pages:
+        for row in page:
+            if row['social_interaction'] is not None:
+                row['social_interaction'] = bool(row['social_interaction'])
+        writer.write_batch(pyarrow.RecordBatch.from_pylist(page, schema=schema))
+        yield sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+    writer.close()
+    yield sink.getvalue()
+
+EXPORT_FORMATS = {
+    'ndjson': (export_ndjson, 'application/x-ndjson', 'ndjson'),
+    'csv': (export_csv, 'text/csv', 'csv'),
+    'arrow': (export_arrow, 'application/vnd.apache.arrow.stream', 'arrows')
+}
+
+@app.route('/api/export', methods=['GET'])
+@login_required
+def export_entries():
+    """Stream the user's full history as NDJSON, CSV or Arrow IPC (?format=)"""
+    user_id = session['user_id']
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f'format must be one of {", ".join(EXPORT_FORMATS)}'}), 400
+    if fmt == 'arrow' and pyarrow is None:
+        return jsonify({'error': 'Arrow export needs pyarrow installed on the server'}), 400
+    
+    encode, mimetype, extension = EXPORT_FORMATS[fmt]
+    pages = export_pages(user_id, since=read_since(user_id))
+    response = Response(stream_with_context(encode(pages)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=mood-history.{extension}'
+    return response
+
+ANALYTICS_LIVE_QUERY = """
+SELECT m.entry_date, m.mood_value,
+       a.sleep_hours, a.exercise_minutes, a.social_interaction, a.caffeine_intake, a.work_stress_level
+FROM mood_entries m
+LEFT JOIN activities a ON m.user_id = a.user_id AND m.entry_date = a.entry_date
+WHERE m.user_id = %s AND m.entry_date BETWEEN %s AND %s
+"""
+
+# Ranges starting before the archive watermark: archived days below it, live days from it on
+ANALYTICS_ARCHIVE_QUERY = f"""
+SELECT entry_date, mood_value,
+       sleep_hours, exercise_minutes, social_interaction, caffeine_intake, work_stress_level
+FROM mood_archive
+WHERE user_id = %s AND entry_date BETWEEN %s AND %s AND entry_date < %s AND mood_value IS NOT NULL
+UNION ALL
+{ANALYTICS_LIVE_QUERY} AND m.entry_date >= %s
+ORDER BY entry_date
+"""
+
+@app.route('/api/analytics', methods=['GET'])
+@login_required
+def mood_analytics():
+    """Weekly/monthly averages, rolling means, day-of-week profile and activity correlations (?start=&end=&window=)"""
+    user_id = session['user_id']
+    
+    try:
+        end = date.fromisoformat(request.args['end']) if request.args.get('end') else date.today()
+        start = date.fromisoformat(request.args['start']) if request.args.get('start') else end - timedelta(days=90)
+        window = int(request.args.get('window', 7))
+    except ValueError:
+        return jsonify({'error': 'start/end must be YYYY-MM-DD and window a whole number'}), 400
+    if start > end or window < 1:
+        return jsonify({'error': 'start must be before end and window at least 1'}), 400
+    
+    db = get_db(read_only=True, since=read_since(user_id), user_id=user_id)
+    if not db:
+        return jsonify({'error': 'Database error'}), 500
+    
+    cursor = db.cursor()
+    
+    try:
+        # Ranges that start before the watermark reach into the archive (imports write
+        # old days there whatever ARCHIVE_AFTER_DAYS says, so always ask the watermark)
+        boundary = archived_until(cursor)
+        if boundary and start < boundary:
+            cursor.execute(ANALYTICS_ARCHIVE_QUERY, (user_id, start, end, boundary, user_id, start, end, boundary))
+        else:
+            cursor.execute(ANALYTICS_LIVE_QUERY + " ORDER BY m.entry_date", (user_id, start, end))
+        rows = cursor.fetchall()
+    except Exception as e:
+        instrumentation.report_error('Analytics', e)
+        return jsonify({'error': 'Analytics failed'}), 500
+    finally:
+        cursor.close()
+        db.close()
+    
+    result = analytics.summarize(rows, window)
+    result['range'] = {'start': start.isoformat(), 'end': end.isoformat(), 'window_days': window}
+    return jsonify(result)
+
+# Sample week used for demo data; demo_rows() repeats it (with jitter, if given
+# a random generator) to fill any number of days
+DEMO_WEEK = [
+    (8, 'Great', 8.0, 45, True, 1, 3, 'Amazing workout this morning!'),
+    (7, 'Good', 7.5, 0, False, 2, 4, 'Productive work day'),
+    (4, 'Meh', 6.0, 0, False, 0, 2, 'Sunday blues'),
+    (9, 'Amazing', 8.5, 60, False, 1, 2, 'Best day ever!'),
+    (6, 'Okay', 7.0, 0, False, 3, 7, 'Work stress'),
+    (8, 'Great', 7.5, 30, True, 1, 3, 'Coffee with friends'),
+    (7, 'Good', 6.5, 0, False, 4, 8, 'Long but good day')
+]
+
+DEMO_LABELS = [(9, 'Amazing'), (8, 'Great'), (7, 'Good'), (5, 'Okay'), (3, 'Meh'), (1, 'Rough')]
+
+def demo_rows(days, rng=None):
+    """Entries for the last `days` days in the write_entries() row format"""
+    rows = []
+    for days_ago in range(days):
+        mood_val, mood_label, sleep_hrs, exercise_min, social, caffeine, stress, note = DEMO_WEEK[days_ago % 7]
+        if rng:
+            mood_val = min(10, max(1, mood_val + rng.randint(-2, 2)))
+            mood_label = next(label for floor, label in DEMO_LABELS if mood_val >= floor)
+            sleep_hrs = round(min(12.0, max(3.0, sleep_hrs + rng.uniform(-1.5, 1.5))), 1)
+            exercise_min = max(0, exercise_min + rng.choice((-15, 0, 15))) if rng.random() < 0.8 else rng.choice((0, 30))
+            social = social if rng.random() < 0.8 else not social
+            stress = min(10, max(1, stress + rng.randint(-2, 2)))
+        rows.append({
+            'entry_date': date.today() - timedelta(days=days_ago),
+            'entry_time': '12:00:00',
+            'mood_value': mood_val,
+            'mood_label': mood_label,
+            'quick_note': note,
+            'activities': {
+                'sleep_hours': sleep_hrs,
+                'exercise_minutes': exercise_min,
+                'social_interaction': social,
+                'caffeine_intake': caffeine,
+                'work_stress_level': stress
+            }
+        })
+    return rows
 
 # Test endpoint to create sample data
 @app.route('/api/create-demo', methods=['POST'])
 def create_demo():
     """Create demo user with sample data"""
-    db = get_db()
+    try:
+        password_hash = password_hasher.hash('demo123')
+    except HasherBusy:
+        return busy_response()
+    
+    # Create demo user (or reuse it)
+    try:
+        try:
+            user_id = create_user('demo_user', 'demo@test.com', password_hash, 'Demo', '25-34')
+        except mysql.connector.IntegrityError:
+            user = find_user('demo@test.com')
+            user_id = user['id'] if user else None
+    except Exception as e:
+        return jsonify({'error': f'Demo creation failed: {e}'}), 500
+    if not user_id:
+        return jsonify({'error': 'Failed to create demo user'}), 500
+    
+    db = get_db(user_id=user_id)
     if not db:
         return jsonify({'error': 'Database error'}), 500
     
     cursor = db.cursor()
     
     try:
-        # Create demo user
-        password_hash = bcrypt.hashpw('demo123'.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-        
-        cursor.execute("""
-        INSERT IGNORE INTO users (username, email, password_hash, first_name, age_range)
-        VALUES (%s, %s, %s, %s, %s)
-        """, ('demo_user', 'demo@test.com', password_hash, 'Demo', '25-34'))
-        
-        # Get user ID
-        cursor.execute("SELECT id FROM users WHERE username = 'demo_user'")
-        result = cursor.fetchone()
-        if not result:
-            return jsonify({'error': 'Failed to create demo user'}), 500
-        
-        user_id = result[0]
-        
         # Create sample mood entries (last 7 days)
-        sample_data = [
-            (0, 8, 'Great', 8.0, 45, True, 1, 3, 'Amazing workout this morning!'),
-            (1, 7, 'Good', 7.5, 0, False, 2, 4, 'Productive work day'),
-            (2, 4, 'Meh', 6.0, 0, False, 0, 2, 'Sunday blues'),
-            (3, 9, 'Amazing', 8.5, 60, False, 1, 2, 'Best day ever!'),
-            (4, 6, 'Okay', 7.0, 0, False, 3, 7, 'Work stress'),
-            (5, 8, 'Great', 7.5, 30, True, 1, 3, 'Coffee with friends'),
-            (6, 7, 'Good', 6.5, 0, False, 4, 8, 'Long but good day')
-        ]
+        rows = demo_rows(7)
         
-        for days_ago, mood_val, mood_label, sleep_hrs, exercise_min, social, caffeine, stress, note in sample_data:
-            entry_date = date.today() - timedelta(days=days_ago)
-            
-            cursor.execute("""
-            INSERT IGNORE INTO mood_entries (user_id, mood_value, mood_label, entry_date, entry_time, quick_note)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            """, (user_id, mood_val, mood_label, entry_date, '12:00:00', note))
-            
-            cursor.execute("""
-            INSERT IGNORE INTO activities (user_id, entry_date, sleep_hours, exercise_minutes, social_interaction, caffeine_intake, work_stress_level)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """, (user_id, entry_date, sleep_hrs, exercise_min, social, caffeine, stress))
+        write_entries(cursor, user_id, rows, overwrite=False)
+        
+        rebuild_streak(cursor, user_id)
+        invalidate_user_caches(user_id)
         
         return jsonify({
             'success': True,
@@ -493,8 +2917,13 @@ if __name__ == '__main__':
     # Test database
     db = get_db()
     if db:
+        cursor = db.cursor()
+        applied = migrations.applied_versions(cursor)
+        cursor.close()
         db.close()
         print("SUCCESS: Database connected!")
+        if any(version not in applied for version, _, _ in migrations.MIGRATIONS):
+            print("WARNING: Schema is out of date - run: python migrations.py")
     else:
         print("ERROR: Database connection failed!")
         print("Check MySQL is running and .env settings")
@@ -508,6 +2937,7 @@ if __name__ == '__main__':
     print("=" * 50)
     print("Server starting at http://localhost:5000")
     print("Test health check: http://localhost:5000/api/health")
+    print("Development server only - in production run: gunicorn app:app")
     print("Mood Journal ready!")
     
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,148 @@
+# Nightly cold archival
+# mood_entries and activities are partitioned by month on entry_date (migrations.py).
+# Months that ended before the one ARCHIVE_AFTER_DAYS ago are copied into mood_archive - one
+# compressed row per user and day, mood and activities together - and their partitions
+# are dropped, which is instant and keeps the live tables (and their indexes) down to
+# the recent months. Analytics, export and streaks read mood_archive for days before
+# the archive watermark, and imports of those days are written straight to it.
+#
+#   python archive_entries.py            # archive every month past the horizon
+#   python archive_entries.py --dry-run  # list the partitions that would go
+#
+# Each run also adds the upcoming monthly partitions. With DB_SHARDS set, each shard is
+# archived in turn; the watermark is a month start derived from the date, so shards
+# archived on the same day agree (rebalance_shards.py relies on that).
+#
+# Order: copy the months into the archive, move the watermark past them (reads and imports
+# switch to the archive), wait --grace seconds for imports that were already writing to
+# the live tables, copy again - overwriting, so edits made during the grace period win -
+# to pick those up, then drop the partitions.
+
+import argparse
+import time
+from datetime import date, timedelta
+
+from app import ARCHIVE_AFTER_DAYS, archived_until, get_db, shard_names
+from migrations import PARTITIONED_TABLES, ensure_partitions, partitions
+
+JOB_NAME = 'archive_entries'
+
+
+def write_watermark(cursor, watermark):
+    cursor.execute("""
+    INSERT INTO job_watermarks (job, watermark, finished_at) VALUES (%s, %s, NOW())
+    ON DUPLICATE KEY UPDATE watermark = GREATEST(watermark, VALUES(watermark)), finished_at = VALUES(finished_at)
+    """, (JOB_NAME, watermark))
+
+
+# The second pass copies over what the first archived: days imported or edited during
+# the grace period are newer in the live tables
+ACTIVITY_COLUMNS = ['sleep_hours', 'exercise_minutes', 'social_interaction', 'caffeine_intake', 'work_stress_level']
+MOOD_COLUMNS = ['entry_time', 'mood_value', 'mood_label', 'quick_note', 'sentiment_score', 'created_at']
+ACTIVITY_UPDATE = "ON DUPLICATE KEY UPDATE " + ", ".join(f"{c} = VALUES({c})" for c in ACTIVITY_COLUMNS)
+MOOD_UPDATE = "ON DUPLICATE KEY UPDATE " + ", ".join(f"{c} = VALUES({c})" for c in MOOD_COLUMNS + ACTIVITY_COLUMNS)
+
+
+def archive_watermark():
+    """Start of the month ARCHIVE_AFTER_DAYS ago; every day before it belongs in the archive"""
+    return (date.today() - timedelta(days=ARCHIVE_AFTER_DAYS)).replace(day=1)
+
+
+def copy_range(cursor, start, end, overwrite=False):
+    """Archive the days in [start, end); with overwrite, live rows replace archived ones.
+    Returns MySQL's affected-row count (an updated row counts twice)"""
+    ignore = '' if overwrite else 'IGNORE'
+    cursor.execute(f"""
+    INSERT {ignore} INTO mood_archive (user_id, entry_date, entry_time, mood_value, mood_label, quick_note,
+                                     sentiment_score, created_at, sleep_hours, exercise_minutes,
+                                     social_interaction, caffeine_intake, work_stress_level)
+    SELECT m.user_id, m.entry_date, m.entry_time, m.mood_value, m.mood_label, m.quick_note,
+           m.sentiment_score, m.created_at, a.sleep_hours, a.exercise_minutes,
+           a.social_interaction, a.caffeine_intake, a.work_stress_level
+    FROM mood_entries m
+    LEFT JOIN activities a ON a.user_id = m.user_id AND a.entry_date = m.entry_date
+    WHERE m.entry_date >= %s AND m.entry_date < %s
+    {MOOD_UPDATE if overwrite else ''}
+    """, (start, end))
+    added = cursor.rowcount
+
+    # Activity-only days would otherwise vanish with their partition
+    cursor.execute(f"""
+    INSERT {ignore} INTO mood_archive (user_id, entry_date, sleep_hours, exercise_minutes,
+                                     social_interaction, caffeine_intake, work_stress_level)
+    SELECT a.user_id, a.entry_date, a.sleep_hours, a.exercise_minutes,
+           a.social_interaction, a.caffeine_intake, a.work_stress_level
+    FROM activities a
+    LEFT JOIN mood_entries m ON m.user_id = a.user_id AND m.entry_date = a.entry_date
+    WHERE a.entry_date >= %s AND a.entry_date < %s AND m.user_id IS NULL
+    {ACTIVITY_UPDATE if overwrite else ''}
+    """, (start, end))
+    return added + cursor.rowcount
+
+
+def run(dry_run=False, grace=10.0, shard=None):
+    started = time.perf_counter()
+    label = f' on shard {shard}' if shard else ''
+
+    db = get_db(shard=shard)
+    if not db:
+        raise SystemExit('Database connection failed')
+    cursor = db.cursor()
+
+    try:
+        for table in PARTITIONED_TABLES:
+            added = ensure_partitions(cursor, table)
+            if added:
+                print(f"Added {added} monthly partitions to {table}{label}")
+
+        until = archive_watermark()
+        expired = {table: [name for name, bound in partitions(cursor, table) if bound and bound <= until]
+                   for table in PARTITIONED_TABLES}
+        if archived_until(cursor) == until and not any(expired.values()):
+            print(f"Nothing before {until}{label} left to archive")
+            return
+
+        if dry_run:
+            for table, names in expired.items():
+                print(f"{table}{label}: drop {', '.join(names) or 'nothing'}")
+            print(f"Would archive everything before {until}")
+            return
+
+        # A month at a time keeps each INSERT ... SELECT transaction small
+        bounds = sorted({bound for table in PARTITIONED_TABLES for _, bound in partitions(cursor, table)
+                         if bound and bound < until} | {until})
+        months = list(zip([date.min] + bounds[:-1], bounds))
+        archived = sum(copy_range(cursor, start, end) for start, end in months)
+        write_watermark(cursor, until)
+        time.sleep(grace)
+        late = sum(copy_range(cursor, start, end, overwrite=True) for start, end in months)
+
+        for table, names in expired.items():
+            if names:
+                cursor.execute(f"ALTER TABLE {table} DROP PARTITION {', '.join(names)}")
+            # The lowest partition left holds everything older, so clear any stragglers there too
+            cursor.execute(f"DELETE FROM {table} WHERE entry_date < %s", (until,))
+
+        # Aggregates only serve the insights window
+        cursor.execute("DELETE FROM mood_aggregates WHERE entry_date < %s", (until,))
+
+        elapsed = time.perf_counter() - started
+        print(f"Archived {archived} days before {until}{label} in {elapsed:.1f}s "
+              f"({late} rows affected by the second pass)")
+    finally:
+        cursor.close()
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Move old mood entries into the archive')
+    parser.add_argument('--dry-run', action='store_true', help='only list the partitions that would be archived')
+    parser.add_argument('--grace', type=float, default=10.0,
+                        help='seconds to wait for in-flight imports after moving the watermark')
+    args = parser.parse_args()
+    for shard in shard_names():
+        run(dry_run=args.dry_run, grace=args.grace, shard=shard)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,315 @@
+# Async serving mode
+#   pip install -r requirements.txt
+#   uvicorn async_app:asgi --host 0.0.0.0 --port 5000
+#
+# The routes that spend their time waiting on MySQL (dashboard, mood-entry, health)
+# run natively on an event loop here with an aiomysql pool, so a single process can
+# hold hundreds of them in flight. Notes go to the same sentiment jobs as the sync
+# app (micro-batcher, hedging, retries, circuit breaker, sentiment_jobs table), whose
+# status route is served by the Flask app. Every other route (login, register,
+# import, export, ...) falls through to the Flask app on a thread pool, and so does
+# everything when DB_SHARDS or DB_REPLICAS is set, since the pool here only reaches
+# the primary of the main database. Paths, sessions and response bodies are the same
+# in both modes: the cookie is the Flask session cookie and the payloads are built
+# by the same helpers in app.py.
+
+import asyncio
+import json
+import os
+import time
+from datetime import date
+from functools import wraps
+
+import aiomysql
+from asgiref.wsgi import WsgiToAsgi
+from quart import Quart, Response, g, jsonify, request, session
+from werkzeug.exceptions import HTTPException
+
+import app as mood_app
+import admission
+import instrumentation
+import insights
+
+ASYNC_DB_POOL_SIZE = int(os.getenv('ASYNC_DB_POOL_SIZE', '50'))
+
+quart_app = Quart(__name__)
+quart_app.secret_key = mood_app.app.secret_key
+
+# Created on startup, inside the server's event loop
+db_pool = None
+
+
+@quart_app.before_serving
+async def start():
+    global db_pool
+    # Check the database is reachable (and migrate it when AUTO_MIGRATE=1) through the sync path
+    conn = await asyncio.to_thread(mood_app.get_db)
+    if conn:
+        conn.close()
+
+    config = mood_app.DB_CONFIG
+    db_pool = await aiomysql.create_pool(host=config['host'], user=config['user'], password=config['password'],
+                                         db=config['database'], autocommit=True,
+                                         minsize=0, maxsize=ASYNC_DB_POOL_SIZE)
+
+
+@quart_app.after_serving
+async def stop():
+    db_pool.close()
+    await db_pool.wait_closed()
+    # Finishes queued sentiment jobs too
+    await asyncio.to_thread(mood_app.shutdown)
+
+
+@quart_app.before_request
+async def start_timer():
+    g.started = time.perf_counter()
+    controller = mood_app.admission_controller
+    if controller and request.method != 'OPTIONS':
+        try:
+            # admit() can write to the shared SQLite rate-limit store, so keep it off the event loop
+            await asyncio.to_thread(controller.admit, request.endpoint, session.get('user_id'), request.remote_addr)
+        except admission.Rejected as rejected:
+            response = jsonify({'error': rejected.message})
+            response.status_code = rejected.status
+            response.headers['Retry-After'] = str(rejected.retry_after)
+            return response
+        g.admitted = True
+
+
+@quart_app.teardown_request
+async def release_slot(error=None):
+    if g.pop('admitted', False):
+        await asyncio.to_thread(mood_app.admission_controller.release)
+
+
+@quart_app.after_request
+async def finish(response):
+    # Same CORS rules as flask_cors on the sync app
+    origin = request.headers.get('Origin')
+    if origin in mood_app.CORS_ORIGINS:
+        response.headers['Access-Control-Allow-Origin'] = origin
+        response.headers['Access-Control-Allow-Credentials'] = 'true'
+        response.vary.add('Origin')
+
+    endpoint = request.endpoint or 'unmatched'
+    instrumentation.registry.observe('http_request_duration_seconds', time.perf_counter() - g.started,
+                                     endpoint=endpoint, method=request.method)
+    instrumentation.registry.inc('http_requests_total', endpoint=endpoint, method=request.method,
+                                 status=response.status_code)
+    return response
+
+
+def login_required(f):
+    @wraps(f)
+    async def decorated_function(*args, **kwargs):
+        if 'user_id' not in session:
+            return jsonify({'error': 'Please log in first'}), 401
+        return await f(*args, **kwargs)
+    return decorated_function
+
+
+# Insights: cache, then the precomputed row, then a live run (numpy work off the loop)
+async def generate_insights(user_id, cursor):
+    if mood_app.INSIGHT_ENGINE != 'statistical':
+        return await asyncio.to_thread(sync_insights, user_id)
+
+    try:
+        await cursor.execute(mood_app.DATA_VERSION_QUERY, (user_id,))
+        row = await cursor.fetchone()
+        version = (row['data_version'] if isinstance(row, dict) else row[0]) if row else 0
+        cached = mood_app.insight_cache.get(user_id, version)
+        if cached is not None:
+            return cached
+
+        await cursor.execute(mood_app.LOAD_PRECOMPUTED_QUERY, (user_id,))
+        row = await cursor.fetchone()
+        if row is not None:
+            results = json.loads(row['insights'] if isinstance(row, dict) else row[0])
+        else:
+            await cursor.execute(mood_app.INSIGHTS_WINDOW_QUERY, (user_id, mood_app.INSIGHTS_WINDOW_DAYS))
+            rows = [tuple(row.values()) if isinstance(row, dict) else row for row in await cursor.fetchall()]
+            results = (await asyncio.to_thread(insights.evaluate_user, user_id, rows, date.today()))[:3]
+            await cursor.execute(mood_app.STORE_PRECOMPUTED_QUERY, (json.dumps(results), user_id, version))
+    except Exception as e:
+        instrumentation.report_error('Insight', e)
+        return []
+
+    mood_app.insight_cache.put(user_id, version, results)
+    return results
+
+
+def sync_insights(user_id):
+    """Engines other than 'statistical' only have a sync implementation"""
+    db = mood_app.get_db()
+    if not db:
+        return []
+    cursor = db.cursor(dictionary=True)
+    try:
+        return mood_app.generate_insights(user_id, cursor)
+    finally:
+        cursor.close()
+        db.close()
+
+
+# API ENDPOINTS
+
+@quart_app.route('/api/health', methods=['GET'])
+async def health_check():
+    """Test if app is working"""
+    try:
+        async with db_pool.acquire() as conn:
+            await conn.ping(reconnect=False)
+        db_status = "connected"
+    except Exception:
+        db_status = "failed"
+
+    ai_status = "ready" if mood_app.HUGGING_FACE_API_KEY else "no key"
+    breaker = mood_app.sentiment_breaker.metrics()
+
+    return jsonify({
+        'status': 'degraded' if breaker['state'] != 'closed' else 'healthy',
+        'database': db_status,
+        'db_pool': {'size': db_pool.size, 'free': db_pool.freesize, 'max_size': db_pool.maxsize},
+        'sentiment_cache': mood_app.sentiment_cache.metrics(),
+        'sentiment_batching': mood_app.sentiment_batcher.metrics(),
+        'sentiment_breaker': breaker,
+        'admission': mood_app.admission_controller.metrics() if mood_app.admission_controller else None,
+        'shards': mood_app.shard_router.metrics() if mood_app.shard_router else None,
+        'dashboard_cache': mood_app.dashboard_cache.metrics(),
+        'insight_cache': mood_app.insight_cache.metrics(),
+        'password_hashing': mood_app.password_hasher.metrics(),
+        'ai': ai_status,
+        'sentiment_engines': [engine.name for engine in mood_app.sentiment_engines if engine.available()],
+        'mode': 'async',
+        'message': 'Mood Journal API is running!'
+    })
+
+
+@quart_app.route('/api/mood-entry', methods=['POST'])
+@login_required
+async def save_mood():
+    """Save mood entry with AI analysis"""
+    data = await request.get_json()
+    user_id = session['user_id']
+
+    try:
+        today = date.today()
+        async with db_pool.acquire() as conn, conn.cursor() as cursor:
+            await cursor.execute(mood_app.SAVE_MOOD_CALL, mood_app.save_mood_params(user_id, data, today))
+            version = (await cursor.fetchone())[0]
+            await cursor.nextset()
+            rows = await cursor.fetchall()
+            while await cursor.nextset():
+                pass
+
+            # AI analysis runs in the background so saves don't wait on the model
+            ai_result = None
+            if data.get('quick_note'):
+                job_id, statements = mood_app.sentiment_jobs.new_job(user_id, today)
+                for sql, params in statements:
+                    await cursor.execute(sql, params)
+                mood_app.sentiment_jobs.start(job_id, user_id, today, data['quick_note'])
+                ai_result = {
+                    'status': 'pending',
+                    'job_id': job_id,
+                    'message': 'Analyzing your note...'
+                }
+
+        stamp = await asyncio.to_thread(mood_app.invalidate_user_caches, user_id)
+        if stamp is not None:
+            session['last_write'] = stamp
+
+        # Generate insights
+        if mood_app.INSIGHT_ENGINE == 'statistical':
+            results = await asyncio.to_thread(mood_app.statistical_insights_from_rows, user_id, list(rows), version)
+        else:
+            results = await asyncio.to_thread(sync_insights, user_id)
+
+        return jsonify({
+            'success': True,
+            'message': 'Mood saved successfully!',
+            'ai_analysis': ai_result,
+            'insights': results[:2]
+        })
+
+    except Exception as e:
+        instrumentation.report_error('Save', e)
+        return jsonify({'error': 'Failed to save mood'}), 500
+
+
+def dashboard_response(payload_json, etag):
+    if request.if_none_match.contains(etag):
+        mood_app.dashboard_cache.record('not_modified')
+        response = Response('', status=304)
+    else:
+        response = Response(payload_json, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@quart_app.route('/api/dashboard', methods=['GET'])
+@login_required
+async def dashboard():
+    """Get dashboard with mood trends and insights"""
+    user_id = session['user_id']
+    cache = mood_app.dashboard_cache
+
+    try:
+        # With shared stamps a cached dashboard (or a 304) is answered without touching MySQL
+        stamp = await asyncio.to_thread(cache.stamp, user_id)
+        if stamp is not None:
+            cached = await asyncio.to_thread(cache.get, user_id, stamp)
+            if cached:
+                return dashboard_response(*cached)
+
+        async with db_pool.acquire() as conn, conn.cursor(aiomysql.DictCursor) as cursor:
+            version = stamp
+            if not cache.shared_stamps:
+                await cursor.execute(mood_app.DATA_VERSION_QUERY, (user_id,))
+                row = await cursor.fetchone()
+                version = row['data_version'] if row else 0
+                cached = await asyncio.to_thread(cache.get, user_id, version)
+                if cached:
+                    return dashboard_response(*cached)
+
+            await cursor.execute(mood_app.DASHBOARD_QUERY, (user_id,))
+            mood_data = list(await cursor.fetchall())
+            results = await generate_insights(user_id, cursor)
+
+        # Serialized by the Flask app so bodies (and ETags) match the sync mode byte for byte
+        payload_json = mood_app.app.json.dumps(mood_app.dashboard_payload(mood_data, results))
+        etag = await asyncio.to_thread(cache.put, user_id, version, payload_json)
+        return dashboard_response(payload_json, etag)
+
+    except Exception as e:
+        instrumentation.report_error('Dashboard', e)
+        return jsonify({'error': 'Dashboard failed'}), 500
+
+
+# ASGI entry point: native async routes here, everything else through the Flask app
+flask_asgi = WsgiToAsgi(mood_app.app)
+native_routes = quart_app.url_map.bind('localhost')
+
+
+def is_native(scope):
+    # CORS preflights are answered by flask_cors
+    if scope['method'] == 'OPTIONS':
+        return False
+    # The aiomysql pool only reaches the main database's primary; with sharding or
+    # replicas on, user routes go through the Flask app's routers (and read-your-writes)
+    if (mood_app.shard_router or mood_app.replica_router) and scope['path'] != '/api/health':
+        return False
+    try:
+        native_routes.match(scope['path'], method=scope['method'])
+        return True
+    except HTTPException:
+        return False
+
+
+async def asgi(scope, receive, send):
+    if scope['type'] == 'http' and not is_native(scope):
+        await flask_asgi(scope, receive, send)
+    else:
+        await quart_app(scope, receive, send)
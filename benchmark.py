@@ -0,0 +1,337 @@
+# Load test / benchmark harness
+# Starts the stub sentiment server and the app in this process (or targets a running
+# server with --url), seeds N users x M days of demo data, then drives a weighted mix
+# of register/login/save_mood/dashboard calls from concurrent clients and reports
+# throughput, p50/p95/p99 latency and DB statements per request for each endpoint.
+#
+#   python benchmark.py --users 200 --days 90 --clients 16 --duration 30
+#   python benchmark.py ... --save-baseline bench_baseline.json
+#   python benchmark.py ... --baseline bench_baseline.json   # exits 1 on a regression
+#
+# bench_baseline.json is the committed baseline; its "config" holds the options it was
+# recorded with (a run with other options only gets a warning). Recorded with:
+#   python benchmark.py --no-seed --mix overhead --clients 16 --duration 30 --warmup 5 \
+#       --save-baseline bench_baseline.json
+#
+# With --url the server is someone else's process, so no stub is started here: run
+# sentiment_stub.py yourself and start that server with AI_URL pointing at it.
+#
+# Seeding writes bench_* users into the database from .env, so point DB_NAME at a
+# scratch database. Statement counts come from /api/metrics.
+
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from http.server import ThreadingHTTPServer
+
+import requests
+
+import sentiment_stub
+
+PASSWORD = 'bench123'
+
+# Endpoint weights per mix (names are the Flask endpoint names). 'overhead' needs no
+# database: it measures the server itself (run it with --no-seed)
+MIXES = {
+    'default': {'dashboard': 60, 'save_mood': 25, 'login': 10, 'register': 5},
+    'read-heavy': {'dashboard': 90, 'save_mood': 8, 'login': 2},
+    'write-heavy': {'dashboard': 30, 'save_mood': 60, 'login': 5, 'register': 5},
+    'overhead': {'metrics': 100},
+}
+
+NOTES = ['Great run this morning', 'Tired and a bit stressed', 'Coffee with friends',
+         'Long day at work', 'Feeling happy and productive', '']
+
+
+def start_stub(latency_ms, error_rate):
+    sentiment_stub.StubHandler.latency = latency_ms / 1000
+    sentiment_stub.StubHandler.error_rate = error_rate
+    server = ThreadingHTTPServer(('127.0.0.1', 0), sentiment_stub.StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_app(mood_app):
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, mood_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench_email(index):
+    return f'bench_{index}@bench.test'
+
+
+def seed(mood_app, users, days):
+    """bench_0..bench_{users-1}, each with `days` days of jittered demo entries"""
+    started = time.perf_counter()
+    # One hash at the app's cost for everyone, so logins don't trigger rehashes
+    password_hash = mood_app.hash_password_sync(PASSWORD, mood_app.password_hasher.rounds)
+
+    # Users go through the app's helpers so they land on the right shard
+    user_ids = []
+    for i in range(users):
+        try:
+            user_id = mood_app.create_user(f'bench_{i}', bench_email(i), password_hash, 'Bench', '25-34')
+        except mood_app.mysql.connector.IntegrityError:
+            user_id = mood_app.find_user(bench_email(i))['id']
+        if user_id is None:
+            raise SystemExit('Database connection failed')
+        user_ids.append(user_id)
+
+    for user_id in user_ids:
+        db = mood_app.get_db(user_id=user_id)
+        if not db:
+            raise SystemExit('Database connection failed')
+        cursor = db.cursor()
+        try:
+            db.start_transaction()
+            mood_app.write_entries(cursor, user_id, mood_app.demo_rows(days, random.Random(user_id)))
+            db.commit()
+            mood_app.rebuild_streak(cursor, user_id)
+        finally:
+            cursor.close()
+            db.close()
+    print(f"Seeded {len(user_ids)} users x {days} days in {time.perf_counter() - started:.1f}s")
+
+
+# One call per endpoint; each returns the response
+def call_login(session, base, rng, users):
+    return session.post(f'{base}/api/login', json={'email': bench_email(rng.randrange(users)),
+                                                    'password': PASSWORD})
+
+
+def call_register(session, base, rng, users):
+    name = f'benchreg_{uuid.uuid4().hex[:12]}'
+    return session.post(f'{base}/api/register', json={
+        'username': name, 'email': f'{name}@bench.test', 'password': PASSWORD, 'first_name': 'Bench'})
+
+
+def call_save_mood(session, base, rng, users):
+    mood = rng.randint(1, 10)
+    return session.post(f'{base}/api/mood-entry', json={
+        'mood_value': mood,
+        'mood_label': 'Good' if mood >= 6 else 'Meh',
+        'quick_note': rng.choice(NOTES),
+        'activities': {
+            'sleep_hours': round(rng.uniform(4, 10), 1),
+            'exercise_minutes': rng.choice((0, 0, 20, 45)),
+            'social_interaction': rng.random() < 0.5,
+            'caffeine_intake': rng.randint(0, 4),
+            'work_stress_level': rng.randint(1, 10)
+        }
+    })
+
+
+def call_dashboard(session, base, rng, users):
+    return session.get(f'{base}/api/dashboard')
+
+
+def call_metrics(session, base, rng, users):
+    return session.get(f'{base}/api/metrics')
+
+
+CALLS = {'login': call_login, 'register': call_register, 'save_mood': call_save_mood, 'dashboard': call_dashboard,
+         'metrics': call_metrics}
+
+
+def client(index, base, mix, users, deadline, samples, seed_value):
+    """One simulated user: log in, then call endpoints from the mix until the deadline"""
+    rng = random.Random(seed_value * 1000 + index)
+    session = requests.Session()
+    call_login(session, base, rng, users)
+    names, weights = zip(*mix.items())
+    local = []
+    while time.monotonic() < deadline:
+        name = rng.choices(names, weights)[0]
+        started = time.perf_counter()
+        try:
+            ok = CALLS[name](session, base, rng, users).status_code < 400
+        except requests.RequestException:
+            ok = False
+        local.append((name, time.perf_counter() - started, ok))
+    samples.extend(local)
+
+
+def run_load(base, mix, users, clients, duration, seed_value):
+    samples = []
+    deadline = time.monotonic() + duration
+    threads = [threading.Thread(target=client, args=(i, base, mix, users, deadline, samples, seed_value))
+               for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples
+
+
+METRIC_LINE = re.compile(r'^(db_queries_total|http_requests_total)\{([^}]*)\} (\S+)$')
+
+
+def scrape_counts(base):
+    """{endpoint: [requests, statements]} from the app's /api/metrics"""
+    counts = defaultdict(lambda: [0, 0])
+    try:
+        text = requests.get(f'{base}/api/metrics', timeout=10).text
+    except requests.RequestException:
+        return counts
+    for line in text.splitlines():
+        match = METRIC_LINE.match(line)
+        if not match:
+            continue
+        labels = dict(re.findall(r'(\w+)="([^"]*)"', match.group(2)))
+        slot = 0 if match.group(1) == 'http_requests_total' else 1
+        counts[labels.get('endpoint')][slot] += float(match.group(3))
+    return counts
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return None
+    return values[max(0, math.ceil(pct / 100 * len(values)) - 1)]
+
+
+def summarize(samples, duration, before, after):
+    results = {}
+    by_endpoint = defaultdict(list)
+    for name, seconds, ok in samples:
+        by_endpoint[name].append((seconds, ok))
+
+    for name, entries in sorted(by_endpoint.items()):
+        latencies = sorted(seconds for seconds, _ in entries)
+        served = after[name][0] - before[name][0]
+        statements = after[name][1] - before[name][1]
+        results[name] = {
+            'requests': len(entries),
+            'errors': sum(1 for _, ok in entries if not ok),
+            'throughput': round(len(entries) / duration, 2),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'queries_per_request': round(statements / served, 2) if served else None
+        }
+    return results
+
+
+def print_results(results, duration):
+    print(f"\n{'endpoint':<12} {'requests':>9} {'errors':>7} {'req/s':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8}")
+    for name, r in results.items():
+        queries = '-' if r['queries_per_request'] is None else f"{r['queries_per_request']:.2f}"
+        print(f"{name:<12} {r['requests']:>9} {r['errors']:>7} {r['throughput']:>8.1f} "
+              f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {queries:>8}")
+    total = sum(r['requests'] for r in results.values())
+    print(f"{'total':<12} {total:>9} {sum(r['errors'] for r in results.values()):>7} {total / duration:>8.1f}\n")
+
+
+def compare(results, baseline, tolerance):
+    """Regressions against a saved run: slower p95, lower throughput, or more statements per request"""
+    regressions = []
+    for name, old in baseline['results'].items():
+        new = results.get(name)
+        if not new:
+            continue
+        if new['p95_ms'] > old['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {old['p95_ms']:.1f}ms -> {new['p95_ms']:.1f}ms")
+        if new['throughput'] < old['throughput'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {old['throughput']:.1f} -> {new['throughput']:.1f} req/s")
+        if (old['queries_per_request'] is not None and new['queries_per_request'] is not None
+                and new['queries_per_request'] > old['queries_per_request'] + 0.5):
+            regressions.append(f"{name}: queries/request {old['queries_per_request']} -> "
+                               f"{new['queries_per_request']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Mood Journal API')
+    parser.add_argument('--url', help='benchmark a running server instead of starting one in-process')
+    parser.add_argument('--users', type=int, default=100, help='seeded users')
+    parser.add_argument('--days', type=int, default=30, help='days of entries per seeded user')
+    parser.add_argument('--no-seed', action='store_true', help='reuse bench users from an earlier run')
+    parser.add_argument('--mix', choices=sorted(MIXES), default='default')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--duration', type=float, default=20, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=3, help='unmeasured seconds before the run')
+    parser.add_argument('--stub-latency-ms', type=float, help='stub sentiment latency (default 150)')
+    parser.add_argument('--stub-error-rate', type=float, help='share of stub calls that fail (default 0)')
+    parser.add_argument('--seed', type=int, default=1, help='random seed for the clients')
+    parser.add_argument('--save-baseline', metavar='PATH', help='write results as the new baseline')
+    parser.add_argument('--baseline', metavar='PATH', help='compare against a saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown (default 20%%)')
+    args = parser.parse_args()
+
+    if args.url:
+        # The server already has its AI_URL; a stub started here would never be called
+        if args.stub_latency_ms is not None or args.stub_error_rate is not None:
+            parser.error('--stub-* options only apply to the in-process server; with --url, start '
+                         'sentiment_stub.py yourself and point the server\'s AI_URL at it')
+    else:
+        args.stub_latency_ms = 150.0 if args.stub_latency_ms is None else args.stub_latency_ms
+        args.stub_error_rate = 0.0 if args.stub_error_rate is None else args.stub_error_rate
+        # The app reads these at import time, so the stub has to be up first
+        stub = start_stub(args.stub_latency_ms, args.stub_error_rate)
+        os.environ['AI_URL'] = f'http://127.0.0.1:{stub.server_port}/'
+        os.environ.setdefault('HUGGING_FACE_API_KEY', 'stub')
+    # Every client comes from 127.0.0.1, so per-IP limits would throttle the run
+    # (start a --url server with ADMISSION_CONTROL=0 too)
+    os.environ.setdefault('ADMISSION_CONTROL', '0')
+    import app as mood_app
+
+    if not args.no_seed:
+        seed(mood_app, args.users, args.days)
+
+    if args.url:
+        base = args.url.rstrip('/')
+    else:
+        server = start_app(mood_app)
+        base = f'http://127.0.0.1:{server.server_port}'
+
+    mix = MIXES[args.mix]
+    if args.warmup:
+        run_load(base, mix, args.users, args.clients, args.warmup, args.seed)
+
+    before = scrape_counts(base)
+    samples = run_load(base, mix, args.users, args.clients, args.duration, args.seed)
+    after = scrape_counts(base)
+
+    results = summarize(samples, args.duration, before, after)
+    print_results(results, args.duration)
+    if not args.url:
+        print(f"Stub sentiment server: {sentiment_stub.stats['requests']} requests, "
+              f"{sentiment_stub.stats['inputs']} notes")
+
+    # Stub settings are None with --url: they belong to whoever started that server
+    config = {key: getattr(args, key) for key in
+              ('users', 'days', 'mix', 'clients', 'duration', 'stub_latency_ms', 'stub_error_rate')}
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'config': config, 'results': results}, f, indent=2)
+        print(f"Baseline written to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('config') != config:
+            print(f"Warning: baseline was recorded with {baseline.get('config')}")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions against the baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("No regressions against the baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+# Production server settings
+#   gunicorn app:app
+# gunicorn reads this file from the working directory. Every setting can be
+# overridden with an environment variable (WEB_WORKERS, WEB_THREADS, BIND, ...).
+#
+# Deploy: run `python migrations.py` first; the server doesn't change the schema itself,
+# and the master refuses to start workers while any database is behind.
+#
+# The app is imported once in the master (preload) so workers fork with the code,
+# the calibrated bcrypt cost and the database check already done. Each worker then
+# opens its own DB connections and, on shutdown, finishes in-flight requests and
+# queued sentiment jobs before exiting. Workers keep nothing another worker needs: cached
+# dashboards and insights are checked against users.data_version in MySQL (or, with
+# DASHBOARD_STAMPS=shared, dashboards against a stamp in the DASHBOARD_CACHE_DB file
+# every worker shares), and sentiment job state lives in the sentiment_jobs table.
+#
+# Benchmark against the dev server with the same seeded data, both pointed at the stub model:
+#   python sentiment_stub.py --port 8081 --latency-ms 150 &
+#   export AI_URL=http://127.0.0.1:8081/ HUGGING_FACE_API_KEY=stub
+#   python app.py                                      # dev server on :5000
+#   python benchmark.py --url http://127.0.0.1:5000 --users 200 --days 60 --clients 32 \
+#       --save-baseline dev.json
+#   gunicorn app:app                                   # stop the dev server first
+#   python benchmark.py --url http://127.0.0.1:5000 --no-seed --clients 32 --baseline dev.json
+# The second run reports per-endpoint changes against the dev server numbers.
+#
+# Measured so far (one CPU core shared by server, clients and stub; no MySQL server on
+# that machine, so only the database-free 'overhead' mix, GET /api/metrics, could run):
+#   ADMISSION_CONTROL=0 python app.py        # app.run: debug=True, one threaded process
+#   ADMISSION_CONTROL=0 gunicorn app:app     # this file: 1 worker x 4 gthread threads
+#   python benchmark.py --url http://127.0.0.1:5000 --no-seed --mix overhead \
+#       --clients 16 --duration 30 --warmup 5 --save-baseline bench_<server>.json
+#
+#                 req/s   p50 ms   p95 ms   p99 ms   errors
+#   app.run       332.2     46.6     65.3     75.8        0   (bench_dev_server.json)
+#   gunicorn      396.3     37.7     57.5     68.5        0   (bench_gunicorn.json)
+#
+# That is the serving stack alone (+19% throughput, -19% p50). The database-bound mixes,
+# where the worker, thread and pool sizing below matter most, still need a run against
+# MySQL with the commands above.
+
+import multiprocessing
+import os
+import sys
+
+cores = multiprocessing.cpu_count()
+
+bind = os.getenv('BIND', '0.0.0.0:5000')
+
+# Requests mostly wait on MySQL, so a few threads per process; CPU work (bcrypt,
+# insight statistics) is what the processes are for
+worker_class = 'gthread'
+workers = int(os.getenv('WEB_WORKERS', str(cores)))
+threads = int(os.getenv('WEB_THREADS', '4'))
+
+preload_app = True
+timeout = int(os.getenv('WEB_TIMEOUT', '60'))
+graceful_timeout = int(os.getenv('GRACEFUL_TIMEOUT', '30'))
+keepalive = 5
+accesslog = os.getenv('ACCESS_LOG', '-')
+
+# Pools are per worker, so size them for one worker rather than the whole machine:
+# a connection per request thread plus headroom for the background sentiment writers
+os.environ.setdefault('DB_POOL_SIZE', str(threads + 2))
+os.environ.setdefault('BCRYPT_WORKERS', str(max(1, cores // workers)))
+os.environ.setdefault('BCRYPT_MAX_QUEUE', str(threads * 2))
+DB_POOL_WARM = int(os.getenv('DB_POOL_WARM', str(threads)))
+
+
+def when_ready(server):
+    """Master, after preloading: one-off work the workers should inherit"""
+    import app
+    # New code on an old schema fails at its first CALL; stop here instead
+    if not app.AUTO_MIGRATE:
+        try:
+            behind = app.pending_migrations()
+        except Exception as e:
+            server.log.warning(f"Could not check the schema version: {e}")
+            behind = []
+        for database, versions in behind:
+            server.log.error(f"{database} is missing migrations {versions}: run `python migrations.py`")
+        if behind:
+            sys.exit(1)
+
+    app.password_hasher.rounds
+    db = app.get_db()
+    if db:
+        db.close()
+    # Connections must not be shared across fork
+    for pool in app.all_pools():
+        pool.close_all()
+
+
+def post_fork(server, worker):
+    import app
+    try:
+        opened = app.db_pool.warm(DB_POOL_WARM)
+        server.log.info(f"Worker {worker.pid}: {opened} database connections ready")
+    except Exception as e:
+        server.log.warning(f"Worker {worker.pid}: pool warmup failed: {e}")
+
+
+def worker_exit(server, worker):
+    import app
+    app.shutdown(graceful_timeout)
@@ -0,0 +1,153 @@
+# Statistical insight engine
+# Every activity column is tested against mood in one pass over the window:
+# an effect size, a permutation p-value and a bootstrap interval, all computed
+# as matrix operations over the resamples instead of one loop per resample.
+
+import numpy as np
+
+from analytics import ACTIVITY_COLUMNS, build_columns
+
+PERMUTATIONS = 1000
+BOOTSTRAPS = 500
+MIN_DAYS = 5
+MIN_GROUP = 2
+REPORT_P_VALUE = 0.2
+
+# How each activity is compared with mood: split into two groups, or fit a line
+ACTIVITY_TESTS = {
+    'exercise_minutes': {'kind': 'split', 'split': lambda v: v > 0},
+    'social_interaction': {'kind': 'split', 'split': lambda v: v > 0},
+    'sleep_hours': {'kind': 'slope', 'unit': 'hour of sleep'},
+    'caffeine_intake': {'kind': 'slope', 'unit': 'caffeinated drink'},
+    'work_stress_level': {'kind': 'slope', 'unit': 'point of work stress'},
+}
+
+
+def mean_difference(moods, groups):
+    """Row-wise mean(mood | group) - mean(mood | not group) for a matrix of resampled moods"""
+    in_group = groups.sum(axis=-1)
+    out_group = groups.shape[-1] - in_group
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (moods * groups).sum(axis=-1) / in_group - (moods * ~groups).sum(axis=-1) / out_group
+
+
+def slope(moods, values):
+    """Row-wise least-squares slope of mood on values"""
+    x = values - values.mean(axis=-1, keepdims=True)
+    y = moods - moods.mean(axis=-1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (x * y).sum(axis=-1) / (x * x).sum(axis=-1)
+
+
+def test_activity(name, values, moods, rng):
+    """Effect, p-value and 90% bootstrap interval for one activity, or None if there isn't enough data"""
+    spec = ACTIVITY_TESTS[name]
+    n = moods.size
+
+    if spec['kind'] == 'split':
+        exposure = spec['split'](values)
+        if exposure.sum() < MIN_GROUP or (~exposure).sum() < MIN_GROUP:
+            return None
+        statistic = lambda m, e: mean_difference(m, e)
+        pooled_sd = np.sqrt((moods[exposure].var(ddof=1) + moods[~exposure].var(ddof=1)) / 2)
+    else:
+        exposure = values
+        if np.ptp(values) == 0:
+            return None
+        statistic = lambda m, e: slope(m, e)
+        pooled_sd = None
+
+    observed = float(statistic(moods, exposure))
+
+    # Permutation test: shuffle mood against the activity, all shuffles at once
+    shuffled = rng.permuted(np.broadcast_to(moods, (PERMUTATIONS, n)), axis=1)
+    null = statistic(shuffled, exposure)
+    p_value = (1 + np.count_nonzero(np.abs(null) >= abs(observed) - 1e-12)) / (PERMUTATIONS + 1)
+
+    # Bootstrap: resample days, keeping mood and activity paired
+    picks = rng.integers(0, n, size=(BOOTSTRAPS, n))
+    boot = statistic(moods[picks], exposure[picks])
+    boot = boot[np.isfinite(boot)]
+    low, high = np.percentile(boot, [5, 95]) if boot.size else (np.nan, np.nan)
+
+    if spec['kind'] == 'split':
+        standardized = float(observed / pooled_sd) if pooled_sd else 0.0
+    else:
+        r = np.corrcoef(values, moods)[0, 1]
+        standardized = float(r) if np.isfinite(r) else 0.0
+
+    return {
+        'activity': name,
+        'kind': spec['kind'],
+        'effect': observed,
+        'standardized_effect': standardized,
+        'p_value': float(p_value),
+        'interval': (float(low), float(high)),
+        'days': int(n)
+    }
+
+
+def describe(result):
+    name, effect = result['activity'], result['effect']
+    up = effect > 0
+
+    if name == 'exercise_minutes':
+        title = 'Exercise Mood Boost' if up else 'Rest Days Feel Better'
+        description = f'Your mood is {abs(effect):.1f} points {"higher" if up else "lower"} on workout days.'
+    elif name == 'social_interaction':
+        title = 'Social Connection Power' if up else 'Recharging Solo'
+        description = f'Your mood is {abs(effect):.1f} points {"higher" if up else "lower"} on days you see people.'
+    else:
+        unit = ACTIVITY_TESTS[name]['unit']
+        titles = {
+            'sleep_hours': ('Sleep Quality Impact', 'More Sleep, Lower Mood?'),
+            'caffeine_intake': ('Caffeine Lift', 'Caffeine Crash'),
+            'work_stress_level': ('Stress Resilience', 'Work Stress Weighs On You'),
+        }
+        title = titles[name][0 if up else 1]
+        description = f'Each extra {unit} goes with a {abs(effect):.2f} point {"rise" if up else "drop"} in mood.'
+
+    if result['p_value'] < 0.05:
+        level = 'high'
+    elif result['p_value'] < 0.1:
+        level = 'medium'
+    else:
+        level = 'low'
+
+    interval = [round(bound, 2) if np.isfinite(bound) else None for bound in result['interval']]
+    return {
+        'title': title,
+        'description': description,
+        'confidence_level': level,
+        'confidence': round(1 - result['p_value'], 3),
+        'effect_size': round(result['standardized_effect'], 2),
+        'interval': interval,
+        'days': result['days']
+    }
+
+
+def evaluate(rows, seed=0):
+    """Ranked insights from (entry_date, mood_value, *ACTIVITY_COLUMNS) rows"""
+    if len(rows) < MIN_DAYS:
+        return []
+
+    columns = build_columns(rows)
+    rng = np.random.default_rng(seed)
+    results = []
+
+    for name in ACTIVITY_COLUMNS:
+        values = columns[name]
+        recorded = ~np.isnan(values)
+        if recorded.sum() < MIN_DAYS:
+            continue
+        result = test_activity(name, values[recorded], columns['mood_value'][recorded], rng)
+        if result and np.isfinite(result['effect']) and result['p_value'] < REPORT_P_VALUE:
+            results.append(result)
+
+    results.sort(key=lambda r: (r['p_value'], -abs(r['standardized_effect'])))
+    return [describe(result) for result in results]
+
+
+def evaluate_user(user_id, rows, day):
+    """evaluate() seeded from the user and their data, so the app and the batch job agree"""
+    return evaluate(rows, seed=[user_id, len(rows), day.toordinal()])
@@ -0,0 +1,353 @@
+# Request instrumentation
+# Latency histograms per endpoint, split into the components a request spends
+# time in (db, sentiment, bcrypt, serialization), per-query DB timings tagged by
+# the function that ran them, error counts, and an opt-in sampling profiler that
+# writes folded stacks (flamegraph.pl / speedscope format) for slow requests.
+#
+# Everything lives in process memory: with several workers each one reports its
+# own numbers, so scrape every worker or aggregate in Prometheus.
+
+import os
+import sys
+import threading
+import time
+import traceback
+from bisect import bisect_left
+from collections import Counter
+
+# Upper bounds in seconds, Prometheus style (+Inf is implied)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COMPONENTS = ('db', 'sentiment', 'bcrypt', 'serialization')
+
+# Functions that only pass a query through; the call site is whoever called them
+PASS_THROUGH = {'call_procedure', 'execute', 'executemany', 'fetchone', 'fetchall', 'fetchmany',
+                '__iter__', '__next__', 'timed_results'}
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.total += seconds
+
+
+# Labelled histograms and counters, rendered in the Prometheus text format
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._help = {}
+
+    def describe(self, name, kind, text):
+        self._help[name] = (kind, text)
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def render(self, gauges=()):
+        """Exposition text; gauges is an iterable of (name, labels dict, value) read at scrape time"""
+        with self._lock:
+            histograms = {key: (list(h.counts), h.total, h.buckets) for key, h in self._histograms.items()}
+            counters = dict(self._counters)
+
+        lines = []
+        seen = set()
+
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                text = self._help.get(name, (kind, name))[1]
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), (counts, total, buckets) in sorted(histograms.items()):
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, count in zip(buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+
+        for (name, labels), value in sorted(counters.items()):
+            header(name, 'counter')
+            lines.append(f"{name}{format_labels(labels)} {value}")
+
+        for name, labels, value in gauges:
+            header(name, 'gauge')
+            lines.append(f"{name}{format_labels(tuple(sorted(labels.items())))} {value}")
+
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+registry = Registry()
+registry.describe('http_request_duration_seconds', 'histogram', 'Request latency by endpoint')
+registry.describe('http_request_component_seconds', 'histogram',
+                  'Time each request spent in db, sentiment, bcrypt and serialization work')
+registry.describe('db_query_seconds', 'histogram', 'Query latency (execute plus fetch) by call site')
+registry.describe('component_seconds', 'histogram', 'Component latency outside requests too, by call site')
+registry.describe('http_requests_total', 'counter', 'Requests by endpoint and status')
+registry.describe('app_errors_total', 'counter', 'Errors caught and logged, by where they happened')
+registry.describe('db_queries_total', 'counter', 'Statements executed while serving each endpoint')
+
+# Component totals for the request running on this thread
+_local = threading.local()
+
+
+def begin_request():
+    _local.components = dict.fromkeys(COMPONENTS, 0.0)
+    _local.queries = 0
+
+
+def end_request():
+    """(component totals, statement count) for the request that just finished"""
+    components = getattr(_local, 'components', None)
+    _local.components = None
+    return components, getattr(_local, 'queries', 0)
+
+
+def count_query():
+    if getattr(_local, 'components', None) is not None:
+        _local.queries += 1
+
+
+def call_site(depth=2):
+    """Name of the first function up the stack that isn't just passing a query along"""
+    frame = sys._getframe(depth)
+    while frame is not None and frame.f_code.co_name in PASS_THROUGH:
+        frame = frame.f_back
+    return frame.f_code.co_name if frame is not None else 'unknown'
+
+
+def record(component, site, seconds):
+    registry.observe('component_seconds', seconds, component=component, site=site)
+    if component == 'db':
+        registry.observe('db_query_seconds', seconds, site=site)
+    components = getattr(_local, 'components', None)
+    if components is not None:
+        components[component] += seconds
+
+
+# with timed('bcrypt', 'login'): ...
+class timed:
+    def __init__(self, component, site=None):
+        self.component = component
+        self.site = site
+
+    def __enter__(self):
+        if self.site is None:
+            self.site = call_site()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.component, self.site, time.perf_counter() - self.started)
+        return False
+
+
+def report_error(where, error):
+    """Count an error that is handled (and otherwise only printed)"""
+    registry.inc('app_errors_total', where=where, exception=type(error).__name__)
+    print(f"{where} error: {error}")
+
+
+# Cursor wrapper that times execute and fetch calls, tagged with the calling function
+class TimedCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._site = 'unknown'
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _timed(self, fn, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            record('db', self._site, time.perf_counter() - started)
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        self._site = call_site()
+        count_query()
+        result = self._timed(self._cursor.execute, operation, params, *args, **kwargs)
+        if kwargs.get('multi'):
+            return self.timed_results(result)
+        return result
+
+    def timed_results(self, results):
+        """multi=True hands back a generator; each step runs a statement, so time those too"""
+        iterator = iter(results)
+        while True:
+            started = time.perf_counter()
+            try:
+                result = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                record('db', self._site, time.perf_counter() - started)
+            yield result
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        self._site = call_site()
+        count_query()
+        return self._timed(self._cursor.executemany, operation, seq_params, *args, **kwargs)
+
+    def fetchone(self):
+        return self._timed(self._cursor.fetchone)
+
+    def fetchall(self):
+        return self._timed(self._cursor.fetchall)
+
+    def fetchmany(self, *args, **kwargs):
+        return self._timed(self._cursor.fetchmany, *args, **kwargs)
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+
+# Samples the stacks of in-flight requests; slow ones get their stacks written out
+class SamplingProfiler:
+    def __init__(self, slow_ms, interval_ms=5.0, directory='profiles', max_files=200):
+        self.slow = slow_ms / 1000.0
+        self.interval = interval_ms / 1000.0
+        self.directory = directory
+        self.max_files = max_files
+        self._lock = threading.Lock()
+        self._active = {}
+        self._thread = None
+        self.stats = {'profiled': 0, 'dumped': 0, 'samples': 0}
+
+    def start(self, key):
+        with self._lock:
+            self._active[threading.get_ident()] = (key, Counter())
+            self.stats['profiled'] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample, name='sampling-profiler', daemon=True)
+                self._thread.start()
+
+    def stop(self, key, seconds):
+        with self._lock:
+            _, stacks = self._active.pop(threading.get_ident(), (None, None))
+        if stacks and seconds >= self.slow:
+            self._dump(key, seconds, stacks)
+
+    def _sample(self):
+        own = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                active = dict(self._active)
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for ident, (_, stacks) in active.items():
+                frame = frames.get(ident)
+                if frame is None or ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stacks[';'.join(reversed(stack))] += 1
+            with self._lock:
+                self.stats['samples'] += len(active)
+
+    def _dump(self, key, seconds, stacks):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if len(os.listdir(self.directory)) >= self.max_files:
+                return
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{key.strip('/').replace('/', '_') or 'root'}-{int(seconds * 1000)}ms.folded"
+            with open(os.path.join(self.directory, name), 'w') as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            with self._lock:
+                self.stats['dumped'] += 1
+        except OSError:
+            traceback.print_exc()
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats['slow_ms'] = self.slow * 1000
+        stats['interval_ms'] = self.interval * 1000
+        return stats
+
+
+def init_app(app, profiler=None):
+    """Hook request timing (and the profiler, if given) into a Flask app"""
+    from flask import g, has_request_context, request
+    from flask.json.provider import DefaultJSONProvider
+
+    class TimedJSONProvider(DefaultJSONProvider):
+        def dumps(self, obj, **kwargs):
+            site = (request.endpoint or 'unmatched') if has_request_context() else 'json'
+            with timed('serialization', site):
+                return super().dumps(obj, **kwargs)
+
+    app.json = TimedJSONProvider(app)
+
+    @app.before_request
+    def start_timer():
+        begin_request()
+        g.request_started = time.perf_counter()
+        if profiler is not None:
+            profiler.start(request.path)
+
+    # Streamed responses (export) are timed to the first byte
+    @app.after_request
+    def record_request(response):
+        started = g.pop('request_started', None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        endpoint = request.endpoint or 'unmatched'
+        registry.observe('http_request_duration_seconds', elapsed, endpoint=endpoint, method=request.method)
+        registry.inc('http_requests_total', endpoint=endpoint, method=request.method, status=response.status_code)
+        components, queries = end_request()
+        for component, seconds in (components or {}).items():
+            registry.observe('http_request_component_seconds', seconds, endpoint=endpoint, component=component)
+        registry.inc('db_queries_total', queries, endpoint=endpoint)
+        if profiler is not None:
+            profiler.stop(request.path, elapsed)
+        return response
+
+    @app.teardown_request
+    def cleanup(error=None):
+        # after_request doesn't run when a view raises
+        if g.pop('request_started', None) is not None:
+            end_request()
+            if error is not None:
+                registry.inc('app_errors_total', where=request.endpoint or 'unmatched',
+                             exception=type(error).__name__)
+            if profiler is not None:
+                profiler.stop(request.path, 0.0)
@@ -0,0 +1,124 @@
+# Local lexicon-based sentiment engine
+# No network and no model download - scores a note in microseconds.
+# Same output shape as the Hugging Face path in app.py: score in [-1, 1] plus a label.
+
+import math
+import re
+
+# Word valence from -3 (very negative) to +3 (very positive)
+LEXICON = {
+    # positive
+    'good': 1.9, 'great': 3.0, 'happy': 2.7, 'happier': 2.4, 'amazing': 2.8, 'awesome': 3.0,
+    'wonderful': 2.8, 'excited': 2.2, 'exciting': 2.2, 'love': 3.0, 'loved': 2.9, 'loving': 2.7,
+    'best': 3.0, 'better': 1.9, 'fun': 2.3, 'nice': 1.8, 'calm': 1.3, 'relaxed': 2.0, 'relaxing': 2.0,
+    'peaceful': 2.2, 'productive': 1.8, 'proud': 2.1, 'grateful': 2.6, 'thankful': 2.4, 'joy': 2.8,
+    'glad': 2.0, 'energized': 2.0, 'energetic': 1.9, 'rested': 1.5, 'motivated': 1.8, 'hopeful': 1.9,
+    'fantastic': 2.9, 'enjoyed': 2.3, 'enjoy': 2.2, 'friends': 1.2, 'laugh': 2.2, 'laughed': 2.2,
+    'accomplished': 2.1, 'content': 1.5, 'confident': 2.1, 'fresh': 1.3, 'okay': 0.8, 'ok': 0.8,
+    'fine': 0.8, 'cool': 1.3, 'win': 2.4, 'won': 2.3, 'success': 2.7, 'successful': 2.7,
+    # negative
+    'bad': -2.5, 'sad': -2.1, 'terrible': -2.9, 'awful': -2.9, 'hate': -2.7, 'hated': -2.6,
+    'stress': -1.8, 'stressed': -2.0, 'stressful': -2.1, 'tired': -1.6, 'exhausted': -2.2,
+    'anxious': -1.9, 'anxiety': -2.0, 'angry': -2.3, 'upset': -1.9, 'lonely': -2.0, 'alone': -1.0,
+    'worried': -1.9, 'worry': -1.8, 'depressed': -2.7, 'miserable': -2.8, 'frustrated': -2.0,
+    'frustrating': -2.1, 'overwhelmed': -2.1, 'blues': -1.6, 'boring': -1.3, 'bored': -1.2,
+    'sick': -1.9, 'hurt': -2.1, 'pain': -2.2, 'cry': -2.1, 'cried': -2.1, 'crying': -2.1,
+    'annoyed': -1.8, 'annoying': -1.8, 'meh': -0.7, 'rough': -1.4, 'hard': -0.8, 'worst': -3.1,
+    'worse': -2.1, 'fail': -2.3, 'failed': -2.3, 'lost': -1.3, 'scared': -2.2, 'afraid': -2.0,
+    'drained': -1.9, 'sleepless': -1.7, 'burnout': -2.3, 'nervous': -1.5, 'tough': -0.9,
+}
+
+NEGATIONS = {
+    'not', 'no', 'never', 'none', 'nothing', 'nobody', 'neither', 'nor', 'without', 'hardly',
+    'barely', 'cannot', 'cant', 'dont', 'didnt', 'doesnt', 'isnt', 'wasnt', 'arent', 'werent',
+    'wont', 'wouldnt', 'shouldnt', 'couldnt', 'aint',
+}
+
+INTENSIFIERS = {
+    'very': 1.3, 'really': 1.3, 'so': 1.25, 'extremely': 1.5, 'super': 1.4, 'incredibly': 1.5,
+    'totally': 1.3, 'absolutely': 1.4, 'completely': 1.3, 'too': 1.2, 'most': 1.2,
+    'slightly': 0.6, 'somewhat': 0.7, 'kinda': 0.7, 'kind': 0.8, 'sort': 0.8, 'bit': 0.7,
+    'little': 0.7, 'barely': 0.5,
+}
+
+# How far a negation reaches and how much it flips a word
+NEGATION_SCOPE = 3
+NEGATION_FACTOR = -0.74
+# Keeps normalized scores inside (-1, 1) while staying responsive for short notes
+NORMALIZE_ALPHA = 15
+
+TOKEN_RE = re.compile(r"[a-z]+(?:'[a-z]+)?")
+
+# One lookup per token: (valence, intensity multiplier, is_negation)
+WORD_TABLE = {}
+for word, valence in LEXICON.items():
+    WORD_TABLE[word] = (valence, 1.0, False)
+for word, multiplier in INTENSIFIERS.items():
+    WORD_TABLE[word] = (WORD_TABLE.get(word, (0.0,))[0], multiplier, word in NEGATIONS)
+for word in NEGATIONS:
+    valence, multiplier, _ = WORD_TABLE.get(word, (0.0, 1.0, False))
+    WORD_TABLE[word] = (valence, multiplier, True)
+
+
+def tokenize(text):
+    return [token.replace("'", '') for token in TOKEN_RE.findall(text.lower())]
+
+
+def raw_score(tokens):
+    """Sum of word valences after negation and intensifier adjustments"""
+    total = 0.0
+    negate_left = 0
+    boost = 1.0
+
+    for token in tokens:
+        valence, multiplier, is_negation = WORD_TABLE.get(token, (0.0, 1.0, False))
+
+        if is_negation:
+            negate_left = NEGATION_SCOPE
+            boost = 1.0
+            continue
+
+        if valence:
+            value = valence * boost
+            if negate_left:
+                value *= NEGATION_FACTOR
+            total += value
+            boost = 1.0
+        elif multiplier != 1.0:
+            boost *= multiplier
+
+        if negate_left:
+            negate_left -= 1
+
+    return total
+
+
+def normalize(total):
+    return total / math.sqrt(total * total + NORMALIZE_ALPHA)
+
+
+def score_batch(texts):
+    """Score a list of notes, returning (score, label, confidence) per note"""
+    # A plain loop on purpose: the work is tokenizing and dict lookups, and a NumPy
+    # version over all tokens at once measured slower at every batch size
+    results = []
+    for text in texts:
+        tokens = tokenize(text or '')
+        score = normalize(raw_score(tokens)) if tokens else 0.0
+
+        if score >= 0.05:
+            label = 'positive'
+        elif score <= -0.05:
+            label = 'negative'
+        else:
+            label = 'neutral'
+
+        hits = sum(1 for token in tokens if token in LEXICON)
+        coverage = hits / len(tokens) if tokens else 0.0
+        confidence = min(0.95, 0.5 + abs(score) / 2 * min(1.0, 0.5 + coverage))
+        results.append((round(score, 3), label, round(confidence, 3)))
+    return results
+
+
+def score_text(text):
+    return score_batch([text])[0]
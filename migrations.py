@@ -0,0 +1,1014 @@
+# Versioned schema migrations - the one place the database schema is defined
+#
+#   python migrations.py            # apply pending migrations (a deploy step, before the
+#                                   # new app starts; AUTO_MIGRATE=1 is for local dev only)
+#   python migrations.py --status   # list applied/pending versions
+#   python migrations.py --check    # EXPLAIN the hot queries and fail if any scans a table
+#   python migrations.py --rebuild-aggregates  # refill mood_aggregates (after switching
+#                                              # INSIGHT_ENGINE to 'buckets')
+#
+# With DB_SHARDS set, each command runs against the main database and then every shard.
+#
+# Each migration is idempotent (it checks information_schema before changing anything),
+# so it is safe to run against a database created by hand, from the workbench model or
+# by the legacy `mood app.py` init_database().
+
+import argparse
+import os
+import sys
+from datetime import date, timedelta
+
+LOCK_NAME = 'mood_journal_migrations'
+
+# Tables range-partitioned by month on entry_date, and how many months past the
+# current one always have a partition (migrate() splits new ones off pmax)
+PARTITIONED_TABLES = ('mood_entries', 'activities')
+PARTITION_MONTHS_AHEAD = 3
+
+
+# Schema inspection helpers
+def table_exists(cursor, table):
+    cursor.execute("""
+    SELECT COUNT(*) FROM information_schema.TABLES
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+    """, (table,))
+    return cursor.fetchone()[0] > 0
+
+
+def column_exists(cursor, table, column):
+    cursor.execute("""
+    SELECT COUNT(*) FROM information_schema.COLUMNS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """, (table, column))
+    return cursor.fetchone()[0] > 0
+
+
+def index_columns(cursor, table):
+    """index name -> (is_unique, [columns in order])"""
+    cursor.execute("""
+    SELECT INDEX_NAME, NON_UNIQUE, COLUMN_NAME FROM information_schema.STATISTICS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+    ORDER BY INDEX_NAME, SEQ_IN_INDEX
+    """, (table,))
+    indexes = {}
+    for name, non_unique, column in cursor.fetchall():
+        indexes.setdefault(name, (not non_unique, []))[1].append(column)
+    return indexes
+
+
+def ensure_index(cursor, table, name, columns, unique=False):
+    """Add an index unless an equivalent one already exists (under any name)"""
+    for is_unique, existing in index_columns(cursor, table).values():
+        if unique and is_unique and existing == columns:
+            return
+        if not unique and existing[:len(columns)] == columns:
+            return
+    kind = 'UNIQUE INDEX' if unique else 'INDEX'
+    cursor.execute(f"ALTER TABLE {table} ADD {kind} {name} ({', '.join(columns)})")
+
+
+def ensure_column(cursor, table, column, definition):
+    if not column_exists(cursor, table, column):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def foreign_keys(cursor, table):
+    cursor.execute("""
+    SELECT CONSTRAINT_NAME FROM information_schema.TABLE_CONSTRAINTS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND CONSTRAINT_TYPE = 'FOREIGN KEY'
+    """, (table,))
+    return [row[0] for row in cursor.fetchall()]
+
+
+# Monthly partitions: p202405 holds May 2024 (the lowest one also holds anything
+# older) and pmax anything past the newest month
+def next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def month_partition(month):
+    return f"PARTITION p{month:%Y%m} VALUES LESS THAN ('{next_month(month).isoformat()}')"
+
+
+def partition_months(first, months_ahead=PARTITION_MONTHS_AHEAD):
+    """Partition definitions from first's month through months_ahead past this one"""
+    last = date.today().replace(day=1)
+    for _ in range(months_ahead):
+        last = next_month(last)
+    month = first.replace(day=1)
+    definitions = []
+    while month <= last:
+        definitions.append(month_partition(month))
+        month = next_month(month)
+    return definitions
+
+
+def partitions(cursor, table):
+    """[(name, upper bound date, or None for MAXVALUE)] in order; empty if not partitioned"""
+    cursor.execute("""
+    SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+    ORDER BY PARTITION_ORDINAL_POSITION
+    """, (table,))
+    return [(name, None if bound == 'MAXVALUE' else date.fromisoformat(bound.strip("'")))
+            for name, bound in cursor.fetchall()]
+
+
+def ensure_partitions(cursor, table, months_ahead=PARTITION_MONTHS_AHEAD):
+    """Split monthly partitions off pmax up to months_ahead past this month; returns how many"""
+    existing = partitions(cursor, table)
+    if not existing:
+        return 0
+    bounds = [bound for _, bound in existing if bound]
+    added = partition_months(max(bounds) if bounds else date.today(), months_ahead)
+    if added:
+        cursor.execute(f"""
+        ALTER TABLE {table} REORGANIZE PARTITION pmax INTO
+        ({', '.join(added)}, PARTITION pmax VALUES LESS THAN (MAXVALUE))
+        """)
+    return len(added)
+
+
+# Migrations. Each one must do the same thing whenever it runs, so the SQL it relies on
+# is frozen here rather than borrowed from app.py (which moves on): to change something,
+# add a new migration with a new copy and leave the old ones alone.
+
+# Bucket aggregates for every existing day, as day_buckets() in app.py sorted them when
+# migration 4 was written
+BACKFILL_AGGREGATES = """
+INSERT INTO mood_aggregates (user_id, entry_date, bucket, mood_sum, entries)
+SELECT m.user_id, m.entry_date, b.bucket, m.mood_value, 1
+FROM mood_entries m
+LEFT JOIN activities a ON a.user_id = m.user_id AND a.entry_date = m.entry_date
+JOIN (SELECT 'all' AS bucket UNION ALL SELECT 'exercise' UNION ALL SELECT 'no_exercise'
+      UNION ALL SELECT 'social' UNION ALL SELECT 'solo' UNION ALL SELECT 'sleep_logged'
+      UNION ALL SELECT 'good_sleep' UNION ALL SELECT 'poor_sleep') b
+WHERE CASE b.bucket
+    WHEN 'all' THEN TRUE
+    WHEN 'exercise' THEN COALESCE(a.exercise_minutes, 0) > 0
+    WHEN 'no_exercise' THEN COALESCE(a.exercise_minutes, 0) <= 0
+    WHEN 'social' THEN COALESCE(a.social_interaction, 0) <> 0
+    WHEN 'solo' THEN COALESCE(a.social_interaction, 0) = 0
+    WHEN 'sleep_logged' THEN COALESCE(a.sleep_hours, 0) <> 0
+    WHEN 'good_sleep' THEN COALESCE(a.sleep_hours, 0) <> 0 AND a.sleep_hours >= 7.5
+    WHEN 'poor_sleep' THEN COALESCE(a.sleep_hours, 0) <> 0 AND a.sleep_hours < 6.5
+END
+"""
+
+# Streak state for every user from their entries (mood_archive doesn't exist yet at
+# migration 5): consecutive dates share date - row_number, the current streak is the run
+# ending at the latest entry
+BACKFILL_STREAKS = """
+INSERT INTO user_streaks (user_id, current_streak, longest_streak, last_entry_date)
+SELECT user_id,
+       SUBSTRING_INDEX(GROUP_CONCAT(run_length ORDER BY run_end DESC), ',', 1),
+       MAX(run_length), MAX(run_end)
+FROM (
+    SELECT user_id, COUNT(*) AS run_length, MAX(entry_date) AS run_end
+    FROM (
+        SELECT user_id, entry_date,
+               DATE_SUB(entry_date, INTERVAL ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY entry_date) DAY)
+               AS run_start
+        FROM (SELECT DISTINCT user_id, entry_date FROM mood_entries) days
+    ) numbered
+    GROUP BY user_id, run_start
+) runs
+GROUP BY user_id
+"""
+
+
+def base_tables(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        username VARCHAR(50) UNIQUE NOT NULL,
+        email VARCHAR(100) UNIQUE NOT NULL,
+        password_hash VARCHAR(255) NOT NULL,
+        first_name VARCHAR(50),
+        age_range VARCHAR(20),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS mood_entries (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        user_id INT NOT NULL,
+        mood_value INT NOT NULL,
+        mood_label VARCHAR(50),
+        entry_date DATE NOT NULL,
+        entry_time TIME,
+        quick_note TEXT,
+        sentiment_score DECIMAL(3,2),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS activities (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        user_id INT NOT NULL,
+        entry_date DATE NOT NULL,
+        sleep_hours DECIMAL(3,1),
+        exercise_minutes INT DEFAULT 0,
+        social_interaction BOOLEAN DEFAULT FALSE,
+        caffeine_intake INT DEFAULT 0,
+        work_stress_level INT DEFAULT 5,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    )
+    """)
+
+
+def reconcile_legacy_entries(cursor):
+    """The legacy app kept activities inside mood_entries and had no entry_time"""
+    ensure_column(cursor, 'mood_entries', 'entry_time', 'TIME')
+    ensure_column(cursor, 'mood_entries', 'sentiment_score', 'DECIMAL(3,2)')
+
+    if column_exists(cursor, 'mood_entries', 'exercise_minutes'):
+        cursor.execute("""
+        INSERT IGNORE INTO activities (user_id, entry_date, sleep_hours, exercise_minutes,
+                                       social_interaction, work_stress_level)
+        SELECT user_id, entry_date, sleep_hours, exercise_minutes, social_interaction, work_stress_level
+        FROM mood_entries
+        """)
+
+
+def hot_query_indexes(cursor):
+    # The legacy table allowed several entries per day; keep the newest before adding the unique key
+    for table in ('mood_entries', 'activities'):
+        if not column_exists(cursor, table, 'id'):
+            continue
+        cursor.execute(f"""
+        DELETE older FROM {table} older
+        JOIN {table} newer ON newer.user_id = older.user_id
+         AND newer.entry_date = older.entry_date AND newer.id > older.id
+        """)
+
+    # ON DUPLICATE KEY UPDATE in save_mood/import relies on these
+    ensure_index(cursor, 'mood_entries', 'uq_mood_user_date', ['user_id', 'entry_date'], unique=True)
+    ensure_index(cursor, 'activities', 'uq_activity_user_date', ['user_id', 'entry_date'], unique=True)
+
+    # Covers the insights/analytics range scan (user, date range, mood) without touching rows
+    ensure_index(cursor, 'mood_entries', 'idx_mood_user_date_value', ['user_id', 'entry_date', 'mood_value'])
+
+
+def insight_aggregates(cursor):
+    if not table_exists(cursor, 'mood_aggregates'):
+        cursor.execute("""
+        CREATE TABLE mood_aggregates (
+            user_id INT NOT NULL,
+            entry_date DATE NOT NULL,
+            bucket VARCHAR(20) NOT NULL,
+            mood_sum INT NOT NULL,
+            entries INT NOT NULL,
+            PRIMARY KEY (user_id, entry_date, bucket)
+        )
+        """)
+        if os.getenv('INSIGHT_ENGINE', 'statistical') == 'buckets':
+            cursor.execute(BACKFILL_AGGREGATES)
+
+
+def streak_state(cursor):
+    if not table_exists(cursor, 'user_streaks'):
+        cursor.execute("""
+        CREATE TABLE user_streaks (
+            user_id INT PRIMARY KEY,
+            current_streak INT NOT NULL,
+            longest_streak INT NOT NULL,
+            last_entry_date DATE NOT NULL
+        )
+        """)
+        cursor.execute(BACKFILL_STREAKS)
+
+
+def precomputed_insights(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS precomputed_insights (
+        user_id INT PRIMARY KEY,
+        insights JSON NOT NULL,
+        window_end DATE NOT NULL,
+        computed_at DATETIME NOT NULL
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS job_watermarks (
+        job VARCHAR(50) PRIMARY KEY,
+        watermark DATE NOT NULL,
+        finished_at DATETIME NOT NULL
+    )
+    """)
+
+
+# save_mood_entry() as created by migration 7: the whole save_mood write path in one CALL
+SAVE_MOOD_ENTRY_V7 = """
+CREATE PROCEDURE save_mood_entry(
+    IN p_user_id INT, IN p_date DATE, IN p_time TIME,
+    IN p_mood INT, IN p_label VARCHAR(50), IN p_note TEXT,
+    IN p_has_activities BOOLEAN, IN p_sleep DECIMAL(3,1), IN p_exercise INT,
+    IN p_social BOOLEAN, IN p_caffeine INT, IN p_stress INT,
+    IN p_window_days INT)
+BEGIN
+    DECLARE v_current INT;
+    DECLARE v_longest INT;
+    DECLARE v_last DATE;
+    DECLARE EXIT HANDLER FOR SQLEXCEPTION
+    BEGIN
+        ROLLBACK;
+        RESIGNAL;
+    END;
+
+    START TRANSACTION;
+
+    INSERT INTO mood_entries (user_id, mood_value, mood_label, entry_date, entry_time, quick_note)
+    VALUES (p_user_id, p_mood, p_label, p_date, p_time, p_note)
+    ON DUPLICATE KEY UPDATE
+    mood_value = VALUES(mood_value), mood_label = VALUES(mood_label), quick_note = VALUES(quick_note);
+
+    IF p_has_activities THEN
+        INSERT INTO activities (user_id, entry_date, sleep_hours, exercise_minutes, social_interaction,
+                                caffeine_intake, work_stress_level)
+        VALUES (p_user_id, p_date, p_sleep, p_exercise, p_social, p_caffeine, p_stress)
+        ON DUPLICATE KEY UPDATE
+        sleep_hours = VALUES(sleep_hours), exercise_minutes = VALUES(exercise_minutes),
+        social_interaction = VALUES(social_interaction), caffeine_intake = VALUES(caffeine_intake),
+        work_stress_level = VALUES(work_stress_level);
+    END IF;
+
+    -- Insight aggregates for the day
+    DELETE FROM mood_aggregates WHERE user_id = p_user_id AND entry_date = p_date;
+    INSERT INTO mood_aggregates (user_id, entry_date, bucket, mood_sum, entries)
+    SELECT m.user_id, m.entry_date, b.bucket, m.mood_value, 1
+    FROM mood_entries m
+    LEFT JOIN activities a ON a.user_id = m.user_id AND a.entry_date = m.entry_date
+    JOIN (SELECT 'all' AS bucket UNION ALL SELECT 'exercise' UNION ALL SELECT 'no_exercise'
+          UNION ALL SELECT 'social' UNION ALL SELECT 'solo' UNION ALL SELECT 'sleep_logged'
+          UNION ALL SELECT 'good_sleep' UNION ALL SELECT 'poor_sleep') b
+    WHERE m.user_id = p_user_id AND m.entry_date = p_date AND CASE b.bucket
+        WHEN 'all' THEN TRUE
+        WHEN 'exercise' THEN COALESCE(a.exercise_minutes, 0) > 0
+        WHEN 'no_exercise' THEN COALESCE(a.exercise_minutes, 0) <= 0
+        WHEN 'social' THEN COALESCE(a.social_interaction, 0) <> 0
+        WHEN 'solo' THEN COALESCE(a.social_interaction, 0) = 0
+        WHEN 'sleep_logged' THEN COALESCE(a.sleep_hours, 0) <> 0
+        WHEN 'good_sleep' THEN COALESCE(a.sleep_hours, 0) <> 0 AND a.sleep_hours >= 7.5
+        WHEN 'poor_sleep' THEN COALESCE(a.sleep_hours, 0) <> 0 AND a.sleep_hours < 6.5
+    END;
+
+    -- Streak state
+    SELECT current_streak, longest_streak, last_entry_date INTO v_current, v_longest, v_last
+    FROM user_streaks WHERE user_id = p_user_id FOR UPDATE;
+
+    IF v_last IS NULL THEN
+        INSERT INTO user_streaks (user_id, current_streak, longest_streak, last_entry_date)
+        VALUES (p_user_id, 1, 1, p_date);
+    ELSEIF p_date > v_last THEN
+        SET v_current = IF(DATEDIFF(p_date, v_last) = 1, v_current + 1, 1);
+        UPDATE user_streaks
+        SET current_streak = v_current, longest_streak = GREATEST(v_longest, v_current), last_entry_date = p_date
+        WHERE user_id = p_user_id;
+    ELSEIF p_date < v_last THEN
+        -- Backfilled day: recount runs (consecutive dates share date - row_number)
+        UPDATE user_streaks s
+        JOIN (
+            SELECT MAX(run_length) AS longest_run,
+                   SUBSTRING_INDEX(GROUP_CONCAT(run_length ORDER BY run_end DESC), ',', 1) AS current_run
+            FROM (
+                SELECT COUNT(*) AS run_length, MAX(entry_date) AS run_end
+                FROM (
+                    SELECT entry_date,
+                           DATE_SUB(entry_date, INTERVAL ROW_NUMBER() OVER (ORDER BY entry_date) DAY) AS run_start
+                    FROM mood_entries WHERE user_id = p_user_id
+                ) days
+                GROUP BY run_start
+            ) runs
+        ) r
+        SET s.current_streak = r.current_run, s.longest_streak = r.longest_run
+        WHERE s.user_id = p_user_id;
+    END IF;
+
+    DELETE FROM precomputed_insights WHERE user_id = p_user_id;
+
+    COMMIT;
+
+    -- The fresh insights window comes back in the same round trip
+    SELECT m.entry_date, m.mood_value,
+           a.sleep_hours, a.exercise_minutes, a.social_interaction, a.caffeine_intake, a.work_stress_level
+    FROM mood_entries m
+    LEFT JOIN activities a ON m.user_id = a.user_id AND m.entry_date = a.entry_date
+    WHERE m.user_id = p_user_id AND m.entry_date >= DATE_SUB(CURDATE(), INTERVAL p_window_days DAY)
+    ORDER BY m.entry_date;
+END
+"""
+
+# Migration 12: bucket aggregates only when the caller asks (INSIGHT_ENGINE=buckets)
+SAVE_MOOD_ENTRY_V12 = """
+CREATE PROCEDURE save_mood_entry(
+    IN p_user_id INT, IN p_date DATE, IN p_time TIME,
+    IN p_mood INT, IN p_label VARCHAR(50), IN p_note TEXT,
+    IN p_has_activities BOOLEAN, IN p_sleep DECIMAL(3,1), IN p_exercise INT,
+    IN p_social BOOLEAN, IN p_caffeine INT, IN p_stress INT,
+    IN p_window_days INT, IN p_buckets BOOLEAN)
+BEGIN
+    DECLARE v_current INT;
+    DECLARE v_longest INT;
+    DECLARE v_last DATE;
+    DECLARE EXIT HANDLER FOR SQLEXCEPTION
+    BEGIN
+        ROLLBACK;
+        RESIGNAL;
+    END;
+
+    START TRANSACTION;
+
+    INSERT INTO mood_entries (user_id, mood_value, mood_label, entry_date, entry_time, quick_note)
+    VALUES (p_user_id, p_mood, p_label, p_date, p_time, p_note)
+    ON DUPLICATE KEY UPDATE
+    mood_value = VALUES(mood_value), mood_label = VALUES(mood_label), quick_note = VALUES(quick_note);
+
+    IF p_has_activities THEN
+        INSERT INTO activities (user_id, entry_date, sleep_hours, exercise_minutes, social_interaction,
+                                caffeine_intake, work_stress_level)
+        VALUES (p_user_id, p_date, p_sleep, p_exercise, p_social, p_caffeine, p_stress)
+        ON DUPLICATE KEY UPDATE
+        sleep_hours = VALUES(sleep_hours), exercise_minutes = VALUES(exercise_minutes),
+        social_interaction = VALUES(social_interaction), caffeine_intake = VALUES(caffeine_intake),
+        work_stress_level = VALUES(work_stress_level);
+    END IF;
+
+    -- Insight aggregates for the day (only the 'buckets' insight engine reads them)
+    IF p_buckets THEN
+        DELETE FROM mood_aggregates WHERE user_id = p_user_id AND entry_date = p_date;
+        INSERT INTO mood_aggregates (user_id, entry_date, bucket, mood_sum, entries)
+        SELECT m.user_id, m.entry_date, b.bucket, m.mood_value, 1
+        FROM mood_entries m
+        LEFT JOIN activities a ON a.user_id = m.user_id AND a.entry_date = m.entry_date
+        JOIN (SELECT 'all' AS bucket UNION ALL SELECT 'exercise' UNION ALL SELECT 'no_exercise'
+              UNION ALL SELECT 'social' UNION ALL SELECT 'solo' UNION ALL SELECT 'sleep_logged'
+              UNION ALL SELECT 'good_sleep' UNION ALL SELECT 'poor_sleep') b
+        WHERE m.user_id = p_user_id AND m.entry_date = p_date AND CASE b.bucket
+            WHEN 'all' THEN TRUE
+            WHEN 'exercise' THEN COALESCE(a.exercise_minutes, 0) > 0
+            WHEN 'no_exercise' THEN COALESCE(a.exercise_minutes, 0) <= 0
+            WHEN 'social' THEN COALESCE(a.social_interaction, 0) <> 0
+            WHEN 'solo' THEN COALESCE(a.social_interaction, 0) = 0
+            WHEN 'sleep_logged' THEN COALESCE(a.sleep_hours, 0) <> 0
+            WHEN 'good_sleep' THEN COALESCE(a.sleep_hours, 0) <> 0 AND a.sleep_hours >= 7.5
+            WHEN 'poor_sleep' THEN COALESCE(a.sleep_hours, 0) <> 0 AND a.sleep_hours < 6.5
+        END;
+    END IF;
+
+    -- Streak state
+    SELECT current_streak, longest_streak, last_entry_date INTO v_current, v_longest, v_last
+    FROM user_streaks WHERE user_id = p_user_id FOR UPDATE;
+
+    IF v_last IS NULL THEN
+        INSERT INTO user_streaks (user_id, current_streak, longest_streak, last_entry_date)
+        VALUES (p_user_id, 1, 1, p_date);
+    ELSEIF p_date > v_last THEN
+        SET v_current = IF(DATEDIFF(p_date, v_last) = 1, v_current + 1, 1);
+        UPDATE user_streaks
+        SET current_streak = v_current, longest_streak = GREATEST(v_longest, v_current), last_entry_date = p_date
+        WHERE user_id = p_user_id;
+    ELSEIF p_date < v_last THEN
+        -- Backfilled day: recount runs (consecutive dates share date - row_number)
+        UPDATE user_streaks s
+        JOIN (
+            SELECT MAX(run_length) AS longest_run,
+                   SUBSTRING_INDEX(GROUP_CONCAT(run_length ORDER BY run_end DESC), ',', 1) AS current_run
+            FROM (
+                SELECT COUNT(*) AS run_length, MAX(entry_date) AS run_end
+                FROM (
+                    SELECT entry_date,
+                           DATE_SUB(entry_date, INTERVAL ROW_NUMBER() OVER (ORDER BY entry_date) DAY) AS run_start
+                    FROM mood_entries WHERE user_id = p_user_id
+                ) days
+                GROUP BY run_start
+            ) runs
+        ) r
+        SET s.current_streak = r.current_run, s.longest_streak = r.longest_run
+        WHERE s.user_id = p_user_id;
+    END IF;
+
+    DELETE FROM precomputed_insights WHERE user_id = p_user_id;
+
+    COMMIT;
+
+    -- The fresh insights window comes back in the same round trip
+    SELECT m.entry_date, m.mood_value,
+           a.sleep_hours, a.exercise_minutes, a.social_interaction, a.caffeine_intake, a.work_stress_level
+    FROM mood_entries m
+    LEFT JOIN activities a ON m.user_id = a.user_id AND m.entry_date = a.entry_date
+    WHERE m.user_id = p_user_id AND m.entry_date >= DATE_SUB(CURDATE(), INTERVAL p_window_days DAY)
+    ORDER BY m.entry_date;
+END
+"""
+
+# Migration 14: bumps users.data_version and returns it ahead of the insights window
+SAVE_MOOD_ENTRY_V14 = """
+CREATE PROCEDURE save_mood_entry(
+    IN p_user_id INT, IN p_date DATE, IN p_time TIME,
+    IN p_mood INT, IN p_label VARCHAR(50), IN p_note TEXT,
+    IN p_has_activities BOOLEAN, IN p_sleep DECIMAL(3,1), IN p_exercise INT,
+    IN p_social BOOLEAN, IN p_caffeine INT, IN p_stress INT,
+    IN p_window_days INT, IN p_buckets BOOLEAN)
+BEGIN
+    DECLARE v_current INT;
+    DECLARE v_longest INT;
+    DECLARE v_last DATE;
+    DECLARE v_version INT;
+    DECLARE EXIT HANDLER FOR SQLEXCEPTION
+    BEGIN
+        ROLLBACK;
+        RESIGNAL;
+    END;
+
+    START TRANSACTION;
+
+    INSERT INTO mood_entries (user_id, mood_value, mood_label, entry_date, entry_time, quick_note)
+    VALUES (p_user_id, p_mood, p_label, p_date, p_time, p_note)
+    ON DUPLICATE KEY UPDATE
+    mood_value = VALUES(mood_value), mood_label = VALUES(mood_label), quick_note = VALUES(quick_note);
+
+    IF p_has_activities THEN
+        INSERT INTO activities (user_id, entry_date, sleep_hours, exercise_minutes, social_interaction,
+                                caffeine_intake, work_stress_level)
+        VALUES (p_user_id, p_date, p_sleep, p_exercise, p_social, p_caffeine, p_stress)
+        ON DUPLICATE KEY UPDATE
+        sleep_hours = VALUES(sleep_hours), exercise_minutes = VALUES(exercise_minutes),
+        social_interaction = VALUES(social_interaction), caffeine_intake = VALUES(caffeine_intake),
+        work_stress_level = VALUES(work_stress_level);
+    END IF;
+
+    -- Insight aggregates for the day (only the 'buckets' insight engine reads them)
+    IF p_buckets THEN
+        DELETE FROM mood_aggregates WHERE user_id = p_user_id AND entry_date = p_date;
+        INSERT INTO mood_aggregates (user_id, entry_date, bucket, mood_sum, entries)
+        SELECT m.user_id, m.entry_date, b.bucket, m.mood_value, 1
+        FROM mood_entries m
+        LEFT JOIN activities a ON a.user_id = m.user_id AND a.entry_date = m.entry_date
+        JOIN (SELECT 'all' AS bucket UNION ALL SELECT 'exercise' UNION ALL SELECT 'no_exercise'
+              UNION ALL SELECT 'social' UNION ALL SELECT 'solo' UNION ALL SELECT 'sleep_logged'
+              UNION ALL SELECT 'good_sleep' UNION ALL SELECT 'poor_sleep') b
+        WHERE m.user_id = p_user_id AND m.entry_date = p_date AND CASE b.bucket
+            WHEN 'all' THEN TRUE
+            WHEN 'exercise' THEN COALESCE(a.exercise_minutes, 0) > 0
+            WHEN 'no_exercise' THEN COALESCE(a.exercise_minutes, 0) <= 0
+            WHEN 'social' THEN COALESCE(a.social_interaction, 0) <> 0
+            WHEN 'solo' THEN COALESCE(a.social_interaction, 0) = 0
+            WHEN 'sleep_logged' THEN COALESCE(a.sleep_hours, 0) <> 0
+            WHEN 'good_sleep' THEN COALESCE(a.sleep_hours, 0) <> 0 AND a.sleep_hours >= 7.5
+            WHEN 'poor_sleep' THEN COALESCE(a.sleep_hours, 0) <> 0 AND a.sleep_hours < 6.5
+        END;
+    END IF;
+
+    -- Streak state
+    SELECT current_streak, longest_streak, last_entry_date INTO v_current, v_longest, v_last
+    FROM user_streaks WHERE user_id = p_user_id FOR UPDATE;
+
+    IF v_last IS NULL THEN
+        INSERT INTO user_streaks (user_id, current_streak, longest_streak, last_entry_date)
+        VALUES (p_user_id, 1, 1, p_date);
+    ELSEIF p_date > v_last THEN
+        SET v_current = IF(DATEDIFF(p_date, v_last) = 1, v_current + 1, 1);
+        UPDATE user_streaks
+        SET current_streak = v_current, longest_streak = GREATEST(v_longest, v_current), last_entry_date = p_date
+        WHERE user_id = p_user_id;
+    ELSEIF p_date < v_last THEN
+        -- Backfilled day: recount runs (consecutive dates share date - row_number)
+        UPDATE user_streaks s
+        JOIN (
+            SELECT MAX(run_length) AS longest_run,
+                   SUBSTRING_INDEX(GROUP_CONCAT(run_length ORDER BY run_end DESC), ',', 1) AS current_run
+            FROM (
+                SELECT COUNT(*) AS run_length, MAX(entry_date) AS run_end
+                FROM (
+                    SELECT entry_date,
+                           DATE_SUB(entry_date, INTERVAL ROW_NUMBER() OVER (ORDER BY entry_date) DAY) AS run_start
+                    FROM mood_entries WHERE user_id = p_user_id
+                ) days
+                GROUP BY run_start
+            ) runs
+        ) r
+        SET s.current_streak = r.current_run, s.longest_streak = r.longest_run
+        WHERE s.user_id = p_user_id;
+    END IF;
+
+    DELETE FROM precomputed_insights WHERE user_id = p_user_id;
+
+    -- Caches in every process compare their copy's version with this one
+    UPDATE users SET data_version = data_version + 1 WHERE id = p_user_id;
+    SELECT data_version INTO v_version FROM users WHERE id = p_user_id;
+
+    COMMIT;
+
+    -- The new data version and the fresh insights window come back in the same round trip
+    SELECT v_version AS data_version;
+    SELECT m.entry_date, m.mood_value,
+           a.sleep_hours, a.exercise_minutes, a.social_interaction, a.caffeine_intake, a.work_stress_level
+    FROM mood_entries m
+    LEFT JOIN activities a ON m.user_id = a.user_id AND m.entry_date = a.entry_date
+    WHERE m.user_id = p_user_id AND m.entry_date >= DATE_SUB(CURDATE(), INTERVAL p_window_days DAY)
+    ORDER BY m.entry_date;
+END
+"""
+
+# Migration 17: a backfilled day recounts streaks over archived days as well
+SAVE_MOOD_ENTRY_V17 = """
+CREATE PROCEDURE save_mood_entry(
+    IN p_user_id INT, IN p_date DATE, IN p_time TIME,
+    IN p_mood INT, IN p_label VARCHAR(50), IN p_note TEXT,
+    IN p_has_activities BOOLEAN, IN p_sleep DECIMAL(3,1), IN p_exercise INT,
+    IN p_social BOOLEAN, IN p_caffeine INT, IN p_stress INT,
+    IN p_window_days INT, IN p_buckets BOOLEAN)
+BEGIN
+    DECLARE v_current INT;
+    DECLARE v_longest INT;
+    DECLARE v_last DATE;
+    DECLARE v_version INT;
+    DECLARE EXIT HANDLER FOR SQLEXCEPTION
+    BEGIN
+        ROLLBACK;
+        RESIGNAL;
+    END;
+
+    START TRANSACTION;
+
+    INSERT INTO mood_entries (user_id, mood_value, mood_label, entry_date, entry_time, quick_note)
+    VALUES (p_user_id, p_mood, p_label, p_date, p_time, p_note)
+    ON DUPLICATE KEY UPDATE
+    mood_value = VALUES(mood_value), mood_label = VALUES(mood_label), quick_note = VALUES(quick_note);
+
+    IF p_has_activities THEN
+        INSERT INTO activities (user_id, entry_date, sleep_hours, exercise_minutes, social_interaction,
+                                caffeine_intake, work_stress_level)
+        VALUES (p_user_id, p_date, p_sleep, p_exercise, p_social, p_caffeine, p_stress)
+        ON DUPLICATE KEY UPDATE
+        sleep_hours = VALUES(sleep_hours), exercise_minutes = VALUES(exercise_minutes),
+        social_interaction = VALUES(social_interaction), caffeine_intake = VALUES(caffeine_intake),
+        work_stress_level = VALUES(work_stress_level);
+    END IF;
+
+    -- Insight aggregates for the day (only the 'buckets' insight engine reads them)
+    IF p_buckets THEN
+        DELETE FROM mood_aggregates WHERE user_id = p_user_id AND entry_date = p_date;
+        INSERT INTO mood_aggregates (user_id, entry_date, bucket, mood_sum, entries)
+        SELECT m.user_id, m.entry_date, b.bucket, m.mood_value, 1
+        FROM mood_entries m
+        LEFT JOIN activities a ON a.user_id = m.user_id AND a.entry_date = m.entry_date
+        JOIN (SELECT 'all' AS bucket UNION ALL SELECT 'exercise' UNION ALL SELECT 'no_exercise'
+              UNION ALL SELECT 'social' UNION ALL SELECT 'solo' UNION ALL SELECT 'sleep_logged'
+              UNION ALL SELECT 'good_sleep' UNION ALL SELECT 'poor_sleep') b
+        WHERE m.user_id = p_user_id AND m.entry_date = p_date AND CASE b.bucket
+            WHEN 'all' THEN TRUE
+            WHEN 'exercise' THEN COALESCE(a.exercise_minutes, 0) > 0
+            WHEN 'no_exercise' THEN COALESCE(a.exercise_minutes, 0) <= 0
+            WHEN 'social' THEN COALESCE(a.social_interaction, 0) <> 0
+            WHEN 'solo' THEN COALESCE(a.social_interaction, 0) = 0
+            WHEN 'sleep_logged' THEN COALESCE(a.sleep_hours, 0) <> 0
+            WHEN 'good_sleep' THEN COALESCE(a.sleep_hours, 0) <> 0 AND a.sleep_hours >= 7.5
+            WHEN 'poor_sleep' THEN COALESCE(a.sleep_hours, 0) <> 0 AND a.sleep_hours < 6.5
+        END;
+    END IF;
+
+    -- Streak state
+    SELECT current_streak, longest_streak, last_entry_date INTO v_current, v_longest, v_last
+    FROM user_streaks WHERE user_id = p_user_id FOR UPDATE;
+
+    IF v_last IS NULL THEN
+        INSERT INTO user_streaks (user_id, current_streak, longest_streak, last_entry_date)
+        VALUES (p_user_id, 1, 1, p_date);
+    ELSEIF p_date > v_last THEN
+        SET v_current = IF(DATEDIFF(p_date, v_last) = 1, v_current + 1, 1);
+        UPDATE user_streaks
+        SET current_streak = v_current, longest_streak = GREATEST(v_longest, v_current), last_entry_date = p_date
+        WHERE user_id = p_user_id;
+    ELSEIF p_date < v_last THEN
+        -- Backfilled day: recount runs over live and archived days, like rebuild_streak()
+        -- (consecutive dates share date - row_number)
+        UPDATE user_streaks s
+        JOIN (
+            SELECT MAX(run_length) AS longest_run,
+                   SUBSTRING_INDEX(GROUP_CONCAT(run_length ORDER BY run_end DESC), ',', 1) AS current_run
+            FROM (
+                SELECT COUNT(*) AS run_length, MAX(entry_date) AS run_end
+                FROM (
+                    SELECT entry_date,
+                           DATE_SUB(entry_date, INTERVAL ROW_NUMBER() OVER (ORDER BY entry_date) DAY) AS run_start
+                    FROM (
+                        SELECT entry_date FROM mood_entries WHERE user_id = p_user_id
+                        UNION
+                        SELECT entry_date FROM mood_archive WHERE user_id = p_user_id AND mood_value IS NOT NULL
+                    ) history
+                ) days
+                GROUP BY run_start
+            ) runs
+        ) r
+        SET s.current_streak = r.current_run, s.longest_streak = r.longest_run
+        WHERE s.user_id = p_user_id;
+    END IF;
+
+    DELETE FROM precomputed_insights WHERE user_id = p_user_id;
+
+    -- Caches in every process compare their copy's version with this one
+    UPDATE users SET data_version = data_version + 1 WHERE id = p_user_id;
+    SELECT data_version INTO v_version FROM users WHERE id = p_user_id;
+
+    COMMIT;
+
+    -- The new data version and the fresh insights window come back in the same round trip
+    SELECT v_version AS data_version;
+    SELECT m.entry_date, m.mood_value,
+           a.sleep_hours, a.exercise_minutes, a.social_interaction, a.caffeine_intake, a.work_stress_level
+    FROM mood_entries m
+    LEFT JOIN activities a ON m.user_id = a.user_id AND m.entry_date = a.entry_date
+    WHERE m.user_id = p_user_id AND m.entry_date >= DATE_SUB(CURDATE(), INTERVAL p_window_days DAY)
+    ORDER BY m.entry_date;
+END
+"""
+
+
+def create_procedure(cursor, name, sql):
+    cursor.execute(f"DROP PROCEDURE IF EXISTS {name}")
+    cursor.execute(sql)
+
+
+def save_mood_procedure(cursor):
+    """The whole save_mood write path in one CALL (the latest version must mirror day_buckets() and rebuild_streak() in app.py)"""
+    create_procedure(cursor, 'save_mood_entry', SAVE_MOOD_ENTRY_V7)
+
+
+def save_mood_buckets_only(cursor):
+    create_procedure(cursor, 'save_mood_entry', SAVE_MOOD_ENTRY_V12)
+
+
+def save_mood_archived_streaks(cursor):
+    create_procedure(cursor, 'save_mood_entry', SAVE_MOOD_ENTRY_V17)
+
+
+def replication_heartbeat(cursor):
+    """Written on the primary and read on replicas to measure lag (see ReplicaRouter in app.py)"""
+    if not table_exists(cursor, 'replication_heartbeat'):
+        cursor.execute("""
+        CREATE TABLE replication_heartbeat (
+            id TINYINT PRIMARY KEY,
+            ts DOUBLE NOT NULL
+        )
+        """)
+
+
+def shard_directory(cursor):
+    """Where each user's rows live, and the user ID sequence for every shard (see ShardRouter in app.py)"""
+    if not table_exists(cursor, 'user_directory'):
+        cursor.execute("""
+        CREATE TABLE user_directory (
+            user_id INT AUTO_INCREMENT PRIMARY KEY,
+            username VARCHAR(50) UNIQUE NOT NULL,
+            email VARCHAR(100) UNIQUE NOT NULL,
+            shard VARCHAR(50),
+            state VARCHAR(10) NOT NULL DEFAULT 'active',
+            moved_at DATETIME
+        )
+        """)
+
+
+def mood_archive(cursor):
+    """Old days moved out of the partitioned tables, mood and activities in one compressed row (see archive_entries.py)"""
+    if not table_exists(cursor, 'mood_archive'):
+        cursor.execute("""
+        CREATE TABLE mood_archive (
+            user_id INT NOT NULL,
+            entry_date DATE NOT NULL,
+            entry_time TIME,
+            mood_value INT,
+            mood_label VARCHAR(50),
+            quick_note TEXT,
+            sentiment_score DECIMAL(3,2),
+            created_at TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP,
+            sleep_hours DECIMAL(3,1),
+            exercise_minutes INT,
+            social_interaction BOOLEAN,
+            caffeine_intake INT,
+            work_stress_level INT,
+            PRIMARY KEY (user_id, entry_date)
+        ) ROW_FORMAT=COMPRESSED KEY_BLOCK_SIZE=8
+        """)
+
+
+def app_settings(cursor):
+    """Values worked out once and shared by every process (e.g. the calibrated bcrypt cost)"""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS app_settings (
+        name VARCHAR(50) PRIMARY KEY,
+        value VARCHAR(255) NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    )
+    """)
+
+
+def user_data_versions(cursor):
+    """A per-user counter bumped by every write, so caches in any process can tell their copy is stale"""
+    ensure_column(cursor, 'users', 'data_version', 'INT NOT NULL DEFAULT 0')
+    create_procedure(cursor, 'save_mood_entry', SAVE_MOOD_ENTRY_V14)
+
+
+def precomputed_versions(cursor):
+    """Precomputed insights remember the data version they were computed from"""
+    ensure_column(cursor, 'precomputed_insights', 'data_version', 'INT NOT NULL DEFAULT 0')
+
+
+def sentiment_jobs(cursor):
+    """Background sentiment job state, shared by every worker that might be polled"""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS sentiment_jobs (
+        job_id CHAR(32) PRIMARY KEY,
+        user_id INT NOT NULL,
+        entry_date DATE NOT NULL,
+        status ENUM('pending', 'done', 'failed') NOT NULL,
+        result JSON NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        finished_at DATETIME NULL,
+        INDEX idx_sentiment_jobs_user (user_id),
+        INDEX idx_sentiment_jobs_created (created_at)
+    )
+    """)
+
+
+def partition_entries(cursor):
+    """Monthly RANGE partitions on entry_date: recent-day queries prune to the last months, and old months are dropped whole"""
+    for table in PARTITIONED_TABLES:
+        if partitions(cursor, table):
+            continue
+        # Partitioned InnoDB tables can't have foreign keys, and every unique key must include entry_date
+        for name in foreign_keys(cursor, table):
+            cursor.execute(f"ALTER TABLE {table} DROP FOREIGN KEY {name}")
+        if column_exists(cursor, table, 'id'):
+            cursor.execute(f"ALTER TABLE {table} DROP PRIMARY KEY, ADD PRIMARY KEY (id, entry_date)")
+
+        cursor.execute(f"SELECT MIN(entry_date) FROM {table}")
+        months = partition_months(cursor.fetchone()[0] or date.today())
+        cursor.execute(f"""
+        ALTER TABLE {table} PARTITION BY RANGE COLUMNS (entry_date)
+        ({', '.join(months)}, PARTITION pmax VALUES LESS THAN (MAXVALUE))
+        """)
+
+
+MIGRATIONS = [
+    (1, 'base tables', base_tables),
+    (2, 'reconcile legacy mood_entries shape', reconcile_legacy_entries),
+    (3, 'unique and covering indexes for hot queries', hot_query_indexes),
+    (4, 'insight aggregates', insight_aggregates),
+    (5, 'streak state', streak_state),
+    (6, 'precomputed insights and job watermarks', precomputed_insights),
+    (7, 'save_mood_entry procedure', save_mood_procedure),
+    (8, 'replication heartbeat', replication_heartbeat),
+    (9, 'shard directory', shard_directory),
+    (10, 'mood archive', mood_archive),
+    (11, 'monthly entry partitions', partition_entries),
+    (12, 'save_mood_entry keeps bucket aggregates only for the buckets engine', save_mood_buckets_only),
+    (13, 'app settings', app_settings),
+    (14, 'user data versions', user_data_versions),
+    (15, 'precomputed insight versions', precomputed_versions),
+    (16, 'sentiment jobs', sentiment_jobs),
+    (17, 'save_mood_entry counts archived days when recounting streaks', save_mood_archived_streaks),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def applied_versions(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def pending_versions(cursor):
+    """Versions not applied yet, without creating anything (for startup checks)"""
+    if not table_exists(cursor, 'schema_migrations'):
+        return [version for version, _, _ in MIGRATIONS]
+    cursor.execute("SELECT version FROM schema_migrations")
+    applied = {row[0] for row in cursor.fetchall()}
+    return [version for version, _, _ in MIGRATIONS if version not in applied]
+
+
+def migrate(cursor, verbose=False):
+    """Apply pending migrations in order; safe to call from several workers at once"""
+    cursor.execute("SELECT GET_LOCK(%s, 60)", (LOCK_NAME,))
+    if cursor.fetchone()[0] != 1:
+        raise RuntimeError('Timed out waiting for the migration lock')
+
+    try:
+        applied = applied_versions(cursor)
+        for version, name, apply in MIGRATIONS:
+            if version in applied:
+                continue
+            if verbose:
+                print(f"Applying {version}: {name}")
+            apply(cursor)
+            cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+
+        # Keep the monthly partitions ahead of the calendar
+        for table in PARTITIONED_TABLES:
+            ensure_partitions(cursor, table)
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+        cursor.fetchall()
+
+
+def hot_queries():
+    """Queries on the request path as (name, sql, params), built from the constants the app
+    runs so the check can't drift from them (user 1 stands in for any user)"""
+    import app
+
+    user = 1
+    today = date.today()
+    boundary = today.replace(day=1)
+    start = boundary - timedelta(days=90)
+    return [
+        ('dashboard', app.DASHBOARD_QUERY, (user,)),
+        ('data_version', app.DATA_VERSION_QUERY, (user,)),
+        ('generate_insights', app.INSIGHTS_WINDOW_QUERY, (user, app.INSIGHTS_WINDOW_DAYS)),
+        ('load_precomputed', app.LOAD_PRECOMPUTED_QUERY, (user,)),
+        ('load_aggregates', app.LOAD_AGGREGATES_QUERY, (user, app.INSIGHTS_WINDOW_DAYS)),
+        # Inside save_mood_entry()
+        ('save_mood_streak',
+         "SELECT current_streak, longest_streak, last_entry_date FROM user_streaks WHERE user_id = %s", (user,)),
+        ('rebuild_streak', *app.streak_history_query(user)),
+        ('export_page', app.EXPORT_LIVE_QUERY, (user, date.min, boundary, app.EXPORT_PAGE_SIZE)),
+        ('export_archive_page', app.EXPORT_ARCHIVE_QUERY, (user, date.min, boundary, app.EXPORT_PAGE_SIZE)),
+        ('analytics', app.ANALYTICS_LIVE_QUERY + " ORDER BY m.entry_date", (user, start, today)),
+        ('analytics_archive', app.ANALYTICS_ARCHIVE_QUERY,
+         (user, start, today, boundary, user, start, today, boundary)),
+    ]
+
+
+def check_hot_queries(cursor):
+    """EXPLAIN every hot query; returns a list of (query, table, problem)"""
+    problems = []
+    for name, sql, params in hot_queries():
+        cursor.execute("EXPLAIN " + sql, params)
+        columns = [column[0] for column in cursor.description]
+        for row in cursor.fetchall():
+            plan = dict(zip(columns, row))
+            if plan.get('table') is None or plan.get('select_type') == 'UNION RESULT':
+                continue
+            if plan.get('type') == 'ALL' or not plan.get('key'):
+                problems.append((name, plan['table'], f"type={plan.get('type')} key={plan.get('key')}"))
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mood Journal schema migrations')
+    parser.add_argument('--status', action='store_true', help='show applied and pending migrations')
+    parser.add_argument('--check', action='store_true', help='EXPLAIN hot queries and report table scans')
+    parser.add_argument('--rebuild-aggregates', action='store_true',
+                        help="recompute mood_aggregates from every entry (needed by INSIGHT_ENGINE=buckets)")
+    args = parser.parse_args()
+
+    import mysql.connector
+    from app import DB_CONFIG, DB_SHARDS, refresh_aggregates, same_database, shard_config
+
+    # The main database, then every shard that isn't the main database
+    databases = [('main', DB_CONFIG)]
+    for name, spec in DB_SHARDS:
+        config = shard_config(spec)
+        if not same_database(config, DB_CONFIG):
+            databases.append((f'shard {name}', config))
+
+    failed = False
+    for label, config in databases:
+        if len(databases) > 1:
+            print(f"== {label} ({config['host']}/{config['database']})")
+        db = mysql.connector.connect(**config)
+        cursor = db.cursor()
+        try:
+            if args.status:
+                applied = applied_versions(cursor)
+                for version, name, _ in MIGRATIONS:
+                    print(f"{'applied' if version in applied else 'pending'}  {version}: {name}")
+            elif args.check:
+                problems = check_hot_queries(cursor)
+                for name, table, problem in problems:
+                    print(f"FAIL  {name}: {table} {problem}")
+                failed = failed or bool(problems)
+                if not problems:
+                    print(f"OK  all {len(hot_queries())} hot queries use an index")
+            elif args.rebuild_aggregates:
+                cursor.execute("DELETE FROM mood_aggregates")
+                refresh_aggregates(cursor)
+                print("Rebuilt mood_aggregates")
+            else:
+                migrate(cursor, verbose=True)
+                print(f"Schema is at version {LATEST_VERSION}")
+        finally:
+            cursor.close()
+            db.close()
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+# Nightly insight precomputation
+# Scans the insights window once in (user_id, entry_date) order, evaluates each
+# user's rows on a process pool and upserts the results into precomputed_insights,
+# which dashboard() and save_mood read before computing anything themselves.
+#
+#   python precompute_insights.py                # every user with entries in the window
+#   python precompute_insights.py --incremental  # only users changed since the last run
+#
+# Each result carries the user's data_version as of the scan. A row whose version has
+# since moved on (the user wrote while the job ran) is never served and is deleted
+# after each flush, so a slow run can't put back insights a save just cleared.
+#
+# Incremental runs pick up users with entries dated on/after the last run's watermark,
+# plus users whose precomputed row was cleared or outdated by a write. Run a full pass once a day
+# so everyone's window moves forward. With DB_SHARDS set, each shard is processed in
+# turn and keeps its own watermark.
+
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from itertools import groupby, islice
+
+from app import INSIGHTS_WINDOW_DAYS, get_db, shard_names
+import insights
+
+JOB_NAME = 'precompute_insights'
+
+
+def read_watermark(cursor):
+    cursor.execute("SELECT watermark FROM job_watermarks WHERE job = %s", (JOB_NAME,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def write_watermark(cursor, watermark):
+    cursor.execute("""
+    INSERT INTO job_watermarks (job, watermark, finished_at) VALUES (%s, %s, NOW())
+    ON DUPLICATE KEY UPDATE watermark = VALUES(watermark), finished_at = VALUES(finished_at)
+    """, (JOB_NAME, watermark))
+
+
+def changed_users(cursor, watermark):
+    """Users with new entries since the watermark, or whose precomputed row was cleared or is outdated"""
+    cursor.execute("""
+    SELECT DISTINCT m.user_id FROM mood_entries m
+    WHERE m.entry_date >= %s
+    UNION
+    SELECT DISTINCT m.user_id FROM mood_entries m
+    JOIN users u ON u.id = m.user_id
+    LEFT JOIN precomputed_insights p ON p.user_id = m.user_id
+    WHERE m.entry_date >= DATE_SUB(CURDATE(), INTERVAL %s DAY)
+    AND (p.user_id IS NULL OR p.data_version <> u.data_version)
+    """, (watermark, INSIGHTS_WINDOW_DAYS))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def window_rows(cursor, user_ids=None):
+    """Yield (user_id, data_version, rows) groups from one ordered scan of the window"""
+    user_filter = ''
+    params = [INSIGHTS_WINDOW_DAYS]
+    if user_ids is not None:
+        user_filter = f"AND m.user_id IN ({', '.join(['%s'] * len(user_ids))})"
+        params += user_ids
+
+    cursor.execute(f"""
+    SELECT m.user_id, u.data_version, m.entry_date, m.mood_value,
+           a.sleep_hours, a.exercise_minutes, a.social_interaction, a.caffeine_intake, a.work_stress_level
+    FROM mood_entries m
+    JOIN users u ON u.id = m.user_id
+    LEFT JOIN activities a ON m.user_id = a.user_id AND m.entry_date = a.entry_date
+    WHERE m.entry_date >= DATE_SUB(CURDATE(), INTERVAL %s DAY) {user_filter}
+    ORDER BY m.user_id, m.entry_date
+    """, params)
+
+    for (user_id, version), group in groupby(cursor, key=lambda row: row[:2]):
+        yield user_id, version, [row[2:] for row in group]
+
+
+def batches(groups, size):
+    while True:
+        batch = list(islice(groups, size))
+        if not batch:
+            return
+        yield batch
+
+
+def evaluate_batch(batch, day):
+    """Runs in a worker process: top insights for each (user_id, data_version, rows) in the batch"""
+    return [(user_id, version, insights.evaluate_user(user_id, rows, day)[:3]) for user_id, version, rows in batch]
+
+
+def run(incremental=False, workers=None, batch_size=500, shard=None):
+    today = date.today()
+    started = time.perf_counter()
+
+    db = get_db(shard=shard)
+    if not db:
+        raise SystemExit('Database connection failed')
+    read_cursor = db.cursor()
+
+    # Results are written on a second connection while the scan is still streaming
+    write_db = get_db(shard=shard)
+    if not write_db:
+        raise SystemExit('Database connection failed')
+    write_cursor = write_db.cursor()
+
+    try:
+        user_ids = None
+        if incremental:
+            watermark = read_watermark(write_cursor)
+            if watermark is not None:
+                user_ids = changed_users(write_cursor, watermark)
+                if not user_ids:
+                    print(f"No users changed since the last run{f' on shard {shard}' if shard else ''}")
+                    write_watermark(write_cursor, today)
+                    return
+
+        users = 0
+        pending = []
+
+        def flush():
+            # Never replace a row computed from a newer version, then drop what a write
+            # made stale while this batch was being evaluated
+            write_db.start_transaction()
+            write_cursor.executemany("""
+            INSERT INTO precomputed_insights (user_id, insights, window_end, computed_at, data_version)
+            VALUES (%s, %s, %s, NOW(), %s)
+            ON DUPLICATE KEY UPDATE
+            insights = IF(VALUES(data_version) >= data_version, VALUES(insights), insights),
+            window_end = IF(VALUES(data_version) >= data_version, VALUES(window_end), window_end),
+            computed_at = IF(VALUES(data_version) >= data_version, VALUES(computed_at), computed_at),
+            data_version = GREATEST(data_version, VALUES(data_version))
+            """, pending)
+            write_cursor.execute(f"""
+            DELETE p FROM precomputed_insights p JOIN users u ON u.id = p.user_id
+            WHERE p.user_id IN ({', '.join(['%s'] * len(pending))}) AND p.data_version <> u.data_version
+            """, [row[0] for row in pending])
+            write_db.commit()
+            pending.clear()
+
+        def collect(future):
+            nonlocal users
+            for user_id, version, results in future.result():
+                pending.append((user_id, json.dumps(results), today, version))
+                users += 1
+            if len(pending) >= batch_size:
+                flush()
+
+        # Keep only a few batches in flight so memory stays flat however many users there are
+        workers = workers or os.cpu_count() or 1
+        in_flight = deque()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for batch in batches(window_rows(read_cursor, user_ids), 64):
+                in_flight.append(pool.submit(evaluate_batch, batch, today))
+                if len(in_flight) >= workers * 2:
+                    collect(in_flight.popleft())
+            while in_flight:
+                collect(in_flight.popleft())
+        if pending:
+            flush()
+
+        write_watermark(write_cursor, today)
+        elapsed = time.perf_counter() - started
+        print(f"Precomputed insights for {users} users{f' on shard {shard}' if shard else ''} in {elapsed:.1f}s "
+              f"({'incremental' if user_ids is not None else 'full'} run)")
+    finally:
+        read_cursor.close()
+        write_cursor.close()
+        db.close()
+        write_db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute insights for all users')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only users with changes since the last watermark')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='evaluation processes (default: CPU count)')
+    parser.add_argument('--batch-size', type=int, default=500,
+                        help='results per multi-row upsert')
+    args = parser.parse_args()
+    for shard in shard_names():
+        run(incremental=args.incremental, workers=args.workers, batch_size=args.batch_size, shard=shard)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+# Online shard rebalancing
+# After a shard is added to DB_SHARDS, the hash ring places some users on it; this
+# moves them (or one user to a named shard) while the app keeps serving. Reads work
+# throughout, and a user's writes are refused with 503 + Retry-After only while their
+# own rows are being copied.
+#
+#   python rebalance_shards.py --adopt           # once, before turning sharding on
+#   python rebalance_shards.py --plan            # how many users would move, per shard pair
+#   python rebalance_shards.py                   # move them, --batch users at a time
+#   python rebalance_shards.py --user 42 --to b  # move one user
+#
+# --adopt records the users already in the default shard's users table in the directory,
+# so the directory keeps allocating IDs above theirs.
+#
+# Each batch of moves:
+#   1. freezes the users in the directory (writes re-read it, so new ones are refused)
+#   2. waits --grace seconds for writes that got past that check to finish
+#   3. per user: copies their rows in one transaction on the target (replacing anything
+#      left there by an earlier attempt), then points the directory at the target
+#   4. waits --grace again so other workers' cached routes (SHARD_CACHE_TTL) expire,
+#      then deletes the rows from the source shard
+# A user whose copy fails is unfrozen on the source and left as they were.
+
+import argparse
+import time
+from collections import Counter
+
+import app
+from app import SHARD_CACHE_TTL, archived_until, get_db
+
+# Tables holding a user's rows, parents first, with the column naming the user
+USER_TABLES = [
+    ('users', 'id'),
+    ('mood_entries', 'user_id'),
+    ('activities', 'user_id'),
+    ('mood_aggregates', 'user_id'),
+    ('user_streaks', 'user_id'),
+    ('precomputed_insights', 'user_id'),
+    ('mood_archive', 'user_id'),
+    ('sentiment_jobs', 'user_id'),
+]
+
+
+def connect(shard=None):
+    db = get_db(shard=shard)
+    if not db:
+        raise SystemExit(f"Database connection failed ({f'shard {shard}' if shard else 'directory'})")
+    return db
+
+
+def located(cursor):
+    """(user_id, current shard) for every user in the directory"""
+    cursor.execute("SELECT user_id, shard FROM user_directory WHERE state = 'active'")
+    for user_id, shard in cursor.fetchall():
+        yield user_id, shard or app.shard_router.default
+
+
+def plan(cursor):
+    """(user_id, from, to) for users the ring places somewhere else"""
+    return [(user_id, shard, app.shard_router.place(user_id))
+            for user_id, shard in located(cursor) if shard != app.shard_router.place(user_id)]
+
+
+def copy_user(source, target, user_id):
+    """Replace the user's rows on target with the ones on source; returns the row count"""
+    read_cursor = source.cursor()
+    write_cursor = target.cursor()
+    copied = 0
+    try:
+        # Archived days only read right if both shards split live and archive at the same date
+        if archived_until(read_cursor) != archived_until(write_cursor):
+            raise RuntimeError('archive watermarks differ between the shards - run archive_entries.py first')
+        target.start_transaction()
+        for table, column in reversed(USER_TABLES):
+            write_cursor.execute(f"DELETE FROM {table} WHERE {column} = %s", (user_id,))
+        for table, column in USER_TABLES:
+            read_cursor.execute(f"SELECT * FROM {table} WHERE {column} = %s", (user_id,))
+            rows = read_cursor.fetchall()
+            # Entry IDs are per database; (user_id, entry_date) is the real key
+            keep = [i for i, name in enumerate(read_cursor.column_names) if not (name == 'id' and column != 'id')]
+            if rows:
+                names = ', '.join(read_cursor.column_names[i] for i in keep)
+                write_cursor.executemany(
+                    f"INSERT INTO {table} ({names}) VALUES ({', '.join(['%s'] * len(keep))})",
+                    [tuple(row[i] for i in keep) for row in rows])
+                copied += len(rows)
+        target.commit()
+    except Exception:
+        target.rollback()
+        raise
+    finally:
+        read_cursor.close()
+        write_cursor.close()
+    return copied
+
+
+def delete_user(db, user_id):
+    cursor = db.cursor()
+    try:
+        db.start_transaction()
+        for table, column in reversed(USER_TABLES):
+            cursor.execute(f"DELETE FROM {table} WHERE {column} = %s", (user_id,))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def move_batch(directory, moves, grace):
+    """Move (user_id, from, to) triples; returns how many moved"""
+    cursor = directory.cursor()
+    frozen = []
+    moved = []
+    try:
+        for move in moves:
+            cursor.execute("UPDATE user_directory SET state = 'frozen' WHERE user_id = %s AND state = 'active'",
+                           (move[0],))
+            if cursor.rowcount == 1:
+                frozen.append(move)
+            else:
+                print(f"Skipping user {move[0]}: already being moved")
+        if not frozen:
+            return 0
+        time.sleep(grace)
+
+        while frozen:
+            user_id, source, target = frozen[0]
+            source_db, target_db = connect(source), connect(target)
+            try:
+                rows = copy_user(source_db, target_db, user_id)
+                cursor.execute("""
+                UPDATE user_directory SET shard = %s, state = 'active', moved_at = NOW() WHERE user_id = %s
+                """, (target, user_id))
+                moved.append(frozen.pop(0))
+                print(f"User {user_id}: {source} -> {target} ({rows} rows)")
+            except Exception as e:
+                app.instrumentation.report_error(f'Moving user {user_id}', e)
+                cursor.execute("UPDATE user_directory SET state = 'active' WHERE user_id = %s", (user_id,))
+                frozen.pop(0)
+            finally:
+                source_db.close()
+                target_db.close()
+    finally:
+        # Never leave anyone frozen, even on Ctrl-C
+        for user_id, _, _ in frozen:
+            cursor.execute("UPDATE user_directory SET state = 'active' WHERE user_id = %s", (user_id,))
+        cursor.close()
+
+    # Only now can no worker still be routing these users to the old shard
+    time.sleep(grace)
+    for user_id, source, _ in moved:
+        source_db = connect(source)
+        try:
+            delete_user(source_db, user_id)
+        except Exception as e:
+            app.instrumentation.report_error(f'Cleaning up user {user_id} on {source}', e)
+        finally:
+            source_db.close()
+    return len(moved)
+
+
+def adopt(directory, shard, chunk=1000):
+    """Add directory rows for the users already on a shard; returns how many were new"""
+    db = connect(shard)
+    read_cursor = db.cursor()
+    write_cursor = directory.cursor()
+    added = 0
+    try:
+        read_cursor.execute("SELECT id, username, email FROM users ORDER BY id")
+        while True:
+            rows = read_cursor.fetchmany(chunk)
+            if not rows:
+                break
+            write_cursor.executemany("""
+            INSERT IGNORE INTO user_directory (user_id, username, email, shard) VALUES (%s, %s, %s, %s)
+            """, [row + (shard,) for row in rows])
+            added += write_cursor.rowcount
+    finally:
+        read_cursor.close()
+        write_cursor.close()
+        db.close()
+    return added
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Move users between shards without downtime')
+    parser.add_argument('--plan', action='store_true', help='only report the moves the ring asks for')
+    parser.add_argument('--adopt', action='store_true', help="add directory rows for the default shard's users")
+    parser.add_argument('--user', type=int, help='move this user (with --to)')
+    parser.add_argument('--to', help='target shard for --user')
+    parser.add_argument('--batch', type=int, default=50, help='users frozen and moved together')
+    parser.add_argument('--limit', type=int, help='stop after this many users')
+    parser.add_argument('--grace', type=float, default=SHARD_CACHE_TTL + 2,
+                        help='seconds to wait for in-flight writes and cached routes (default: SHARD_CACHE_TTL + 2)')
+    args = parser.parse_args()
+
+    if not app.shard_router:
+        raise SystemExit('DB_SHARDS is not set')
+    router = app.shard_router
+
+    directory = connect()
+    cursor = directory.cursor()
+    try:
+        if args.adopt:
+            added = adopt(directory, router.default)
+            print(f"Added {added} users from shard {router.default} to the directory")
+            return
+
+        if args.user is not None:
+            if args.to not in router.shards:
+                raise SystemExit(f"--to must be one of {', '.join(sorted(router.shards))}")
+            cursor.execute("SELECT shard FROM user_directory WHERE user_id = %s", (args.user,))
+            row = cursor.fetchone()
+            if not row:
+                raise SystemExit(f'User {args.user} is not in the directory (run --adopt first)')
+            moves = [(args.user, row[0] or router.default, args.to)]
+            if moves[0][1] == args.to:
+                print(f"User {args.user} is already on {args.to}")
+                return
+        else:
+            moves = plan(cursor)[:args.limit]
+
+        if args.plan:
+            for (source, target), count in sorted(Counter((m[1], m[2]) for m in moves).items()):
+                print(f"{source} -> {target}: {count} users")
+            print(f"{len(moves)} users to move")
+            return
+
+        started = time.perf_counter()
+        moved = 0
+        for i in range(0, len(moves), args.batch):
+            moved += move_batch(directory, moves[i:i + args.batch], args.grace)
+        print(f"Moved {moved} of {len(moves)} users in {time.perf_counter() - started:.1f}s")
+    finally:
+        cursor.close()
+        directory.close()
+
+
+if __name__ == '__main__':
+    main()
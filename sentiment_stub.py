@@ -0,0 +1,89 @@
+# Local stand-in for the Hugging Face sentiment endpoint
+# Run it and point the app at it:
+#   python sentiment_stub.py --port 8081 --latency-ms 200
+#   AI_URL=http://127.0.0.1:8081/ HUGGING_FACE_API_KEY=stub python app.py
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+POSITIVE = {'good', 'great', 'happy', 'amazing', 'best', 'love', 'productive', 'friends', 'fun'}
+NEGATIVE = {'bad', 'sad', 'stress', 'tired', 'awful', 'blues', 'hate', 'angry', 'anxious'}
+
+stats = {'requests': 0, 'inputs': 0}
+stats_lock = threading.Lock()
+
+
+def score_text(text):
+    """Fake model output in the same shape as the real API"""
+    words = set(text.lower().split())
+    pos = len(words & POSITIVE)
+    neg = len(words & NEGATIVE)
+    if pos > neg:
+        best = 'LABEL_2'
+    elif neg > pos:
+        best = 'LABEL_0'
+    else:
+        best = 'LABEL_1'
+    return [{'label': label, 'score': 0.8 if label == best else 0.1}
+            for label in ('LABEL_0', 'LABEL_1', 'LABEL_2')]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    error_rate = 0.0
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        with stats_lock:
+            self._send_json(200, dict(stats))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        inputs = payload.get('inputs', '')
+        texts = inputs if isinstance(inputs, list) else [inputs]
+
+        with stats_lock:
+            stats['requests'] += 1
+            stats['inputs'] += len(texts)
+
+        time.sleep(self.latency)
+        if random.random() < self.error_rate:
+            self._send_json(503, {'error': 'Model is currently loading', 'estimated_time': 20.0})
+            return
+
+        self._send_json(200, [score_text(text) for text in texts])
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stub sentiment inference server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    StubHandler.latency = args.latency_ms / 1000
+    StubHandler.error_rate = args.error_rate
+
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    print(f"Stub sentiment server on http://{args.host}:{args.port}/ (GET for request counts)")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
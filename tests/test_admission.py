@@ -0,0 +1,111 @@
+import asyncio
+import threading
+
+import pytest
+
+import app
+import async_app
+from admission import AdmissionController, MemoryStore, Rejected
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def test_bucket_starts_full_then_empties(clock):
+    store = MemoryStore(clock=clock)
+    assert [store.take('k', rate=1.0, burst=3) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert store.take('k', rate=1.0, burst=3) == pytest.approx(1.0)
+
+
+def test_bucket_refills_at_rate_up_to_burst(clock):
+    store = MemoryStore(clock=clock)
+    for _ in range(3):
+        store.take('k', rate=2.0, burst=3)
+    clock.now += 0.5
+    assert store.take('k', rate=2.0, burst=3) == 0.0
+    assert store.take('k', rate=2.0, burst=3) == pytest.approx(0.5)
+    clock.now += 100
+    assert [store.take('k', rate=2.0, burst=3) for _ in range(3)] == [0.0, 0.0, 0.0]
+
+
+def test_buckets_are_per_key(clock):
+    store = MemoryStore(clock=clock)
+    store.take('a', rate=1.0, burst=1)
+    assert store.take('a', rate=1.0, burst=1) > 0
+    assert store.take('b', rate=1.0, burst=1) == 0.0
+
+
+def test_store_evicts_least_recent_keys(clock):
+    store = MemoryStore(max_keys=2, clock=clock)
+    store.take('a', rate=1.0, burst=1)
+    store.take('b', rate=1.0, burst=1)
+    store.take('c', rate=1.0, burst=1)
+    # 'a' was dropped, so it starts with a full bucket again
+    assert store.take('a', rate=1.0, burst=1) == 0.0
+
+
+def test_controller_throttles_per_user(clock):
+    limits = {'cheap': {'share': 1.0, 'user': (1.0, 2), 'ip': None}}
+    controller = AdmissionController(MemoryStore(clock=clock), max_inflight=10, limits=limits, classes={})
+    for _ in range(2):
+        controller.admit('anything', user_id=1)
+        controller.release()
+    with pytest.raises(Rejected) as rejected:
+        controller.admit('anything', user_id=1)
+    assert rejected.value.status == 429
+    assert rejected.value.retry_after == 1
+    controller.admit('anything', user_id=2)
+    controller.release()
+
+
+def test_controller_sheds_low_priority_classes_first(clock):
+    limits = {
+        'write': {'share': 1.0, 'user': None, 'ip': None},
+        'expensive': {'share': 0.5, 'user': None, 'ip': None},
+    }
+    classes = {'save_mood': 'write', 'export_entries': 'expensive'}
+    controller = AdmissionController(MemoryStore(clock=clock), max_inflight=4, limits=limits, classes=classes)
+    controller.admit('save_mood')
+    controller.admit('save_mood')
+    with pytest.raises(Rejected) as rejected:
+        controller.admit('export_entries')
+    assert rejected.value.status == 503
+    controller.admit('save_mood')
+    assert controller.metrics()['shed'] == 1
+
+
+def test_async_app_admits_off_the_event_loop(monkeypatch):
+    threads = []
+
+    class RecordingController(AdmissionController):
+        def admit(self, *args, **kwargs):
+            threads.append(('admit', threading.current_thread()))
+            return super().admit(*args, **kwargs)
+
+        def release(self):
+            threads.append(('release', threading.current_thread()))
+            return super().release()
+
+    limits = {'cheap': {'share': 1.0, 'user': None, 'ip': None}}
+    monkeypatch.setattr(app, 'admission_controller',
+                        RecordingController(MemoryStore(), max_inflight=10, limits=limits, classes={}))
+
+    async def request():
+        loop_thread = threading.current_thread()
+        response = await async_app.quart_app.test_client().get('/no-such-page')
+        return loop_thread, response.status_code
+
+    loop_thread, status = asyncio.run(request())
+    assert status == 404
+    assert [name for name, _ in threads] == ['admit', 'release']
+    assert all(thread is not loop_thread for _, thread in threads)
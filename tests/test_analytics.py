@@ -0,0 +1,57 @@
+from datetime import date, timedelta
+
+import pytest
+
+import analytics
+
+
+def row(day, mood, sleep=None, exercise=None, social=None, caffeine=None, stress=None):
+    return (day, mood, sleep, exercise, social, caffeine, stress)
+
+
+def test_no_rows():
+    result = analytics.summarize([])
+    assert result['entries'] == 0
+    assert result['average_mood'] is None
+    assert [day['entries'] for day in result['day_of_week']] == [0] * 7
+
+
+def test_weekly_and_monthly_averages():
+    # 2024-01-29 is a Monday; the week runs into February
+    rows = [row(date(2024, 1, 29), 4), row(date(2024, 1, 31), 6), row(date(2024, 2, 1), 8), row(date(2024, 2, 5), 2)]
+    result = analytics.summarize(rows)
+    assert result['entries'] == 4
+    assert result['average_mood'] == 5.0
+    assert result['weekly'] == [
+        {'period': '2024-01-29', 'average_mood': 6.0, 'entries': 3},
+        {'period': '2024-02-05', 'average_mood': 2.0, 'entries': 1},
+    ]
+    assert result['monthly'] == [
+        {'period': '2024-01', 'average_mood': 5.0, 'entries': 2},
+        {'period': '2024-02', 'average_mood': 5.0, 'entries': 2},
+    ]
+
+
+def test_rolling_window_is_in_calendar_days():
+    start = date(2024, 3, 1)
+    rows = [row(start, 2), row(start + timedelta(days=1), 4), row(start + timedelta(days=9), 10)]
+    rolling = analytics.summarize(rows, window=3)['rolling']
+    assert [point['rolling_mean'] for point in rolling] == [2.0, 3.0, 10.0]
+
+
+def test_weekday_profile():
+    rows = [row(date(2024, 1, 1), 4), row(date(2024, 1, 7), 9), row(date(2024, 1, 8), 6)]
+    profile = analytics.summarize(rows)['day_of_week']
+    assert profile[0] == {'day_name': 'Monday', 'average_mood': 5.0, 'entries': 2}
+    assert profile[6] == {'day_name': 'Sunday', 'average_mood': 9.0, 'entries': 1}
+    assert profile[2]['average_mood'] is None
+
+
+def test_correlations_skip_missing_values():
+    start = date(2024, 5, 1)
+    rows = [row(start + timedelta(days=i), mood, sleep=sleep)
+            for i, (mood, sleep) in enumerate([(3, 5), (5, 6), (7, 7), (9, 8), (6, None)])]
+    correlations = {item['activity']: item for item in analytics.summarize(rows)['correlations']}
+    assert correlations['sleep_hours'] == {'activity': 'sleep_hours', 'correlation': pytest.approx(1.0), 'days': 4}
+    assert correlations['exercise_minutes']['correlation'] is None
+    assert correlations['exercise_minutes']['days'] == 0
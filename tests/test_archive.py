@@ -0,0 +1,171 @@
+import re
+from datetime import date, time
+
+import pytest
+
+import admission
+import app
+import archive_entries
+from app import ANALYTICS_ARCHIVE_QUERY, ANALYTICS_LIVE_QUERY, write_entries
+
+WATERMARK = date(2024, 2, 1)
+
+
+class RecordingCursor:
+    """Records every statement; the archive watermark is the only thing it knows"""
+
+    def __init__(self, watermark=None, rowcounts=()):
+        self.watermark = watermark
+        self.rowcounts = list(rowcounts)
+        self.rowcount = 0
+        self.statements = []
+        self.rows = []
+
+    def execute(self, sql, params=None):
+        self.statements.append((sql, params))
+        if sql.startswith('SELECT watermark FROM job_watermarks'):
+            self.rows = [(self.watermark,)] if self.watermark else []
+        else:
+            self.rows = []
+        self.rowcount = self.rowcounts.pop(0) if self.rowcounts else 0
+
+    def executemany(self, sql, seq_params):
+        self.statements.append((sql, list(seq_params)))
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return list(self.rows)
+
+    def close(self):
+        pass
+
+    def writes(self, table):
+        return [(sql, params) for sql, params in self.statements if re.search(rf'INTO {table} ', sql)]
+
+
+def row(day, activities=None):
+    return {'entry_date': day, 'entry_time': time(12), 'mood_value': 6, 'mood_label': 'Okay',
+            'quick_note': '', 'activities': activities}
+
+
+ACTIVITIES = {'sleep_hours': 7.0, 'exercise_minutes': 20, 'social_interaction': True,
+              'caffeine_intake': 1, 'work_stress_level': 3}
+
+
+@pytest.fixture(autouse=True)
+def statistical_insights(monkeypatch):
+    monkeypatch.setattr(app, 'INSIGHT_ENGINE', 'statistical')
+
+
+def test_days_before_the_watermark_go_to_the_archive():
+    cursor = RecordingCursor(WATERMARK)
+    write_entries(cursor, 1, [row(date(2024, 1, 30), ACTIVITIES), row(date(2024, 1, 31)), row(date(2024, 2, 2))])
+
+    archived = cursor.writes('mood_archive')
+    assert [[values[1] for values in params] for _, params in archived] == [[date(2024, 1, 30)], [date(2024, 1, 31)]]
+    # A day without activities doesn't clear the archived activity columns
+    assert 'sleep_hours = VALUES(sleep_hours)' in archived[0][0]
+    assert 'sleep_hours = VALUES(sleep_hours)' not in archived[1][0]
+
+    [(_, live)] = cursor.writes('mood_entries')
+    assert [values[3] for values in live] == [date(2024, 2, 2)]
+    assert cursor.writes('activities') == []
+
+
+def test_a_fully_archived_import_leaves_the_live_tables_alone():
+    cursor = RecordingCursor(WATERMARK)
+    write_entries(cursor, 1, [row(date(2024, 1, 30), ACTIVITIES)])
+    assert len(cursor.writes('mood_archive')) == 1
+    assert cursor.writes('mood_entries') == [] and cursor.writes('activities') == []
+
+
+def test_without_a_watermark_everything_is_live():
+    cursor = RecordingCursor()
+    write_entries(cursor, 1, [row(date(2024, 1, 30), ACTIVITIES), row(date(2024, 2, 2))])
+    assert cursor.writes('mood_archive') == []
+    assert [values[3] for values in cursor.writes('mood_entries')[0][1]] == [date(2024, 1, 30), date(2024, 2, 2)]
+    assert [values[1] for values in cursor.writes('activities')[0][1]] == [date(2024, 1, 30)]
+
+
+def test_keeping_existing_days_applies_to_the_archive_too():
+    cursor = RecordingCursor(WATERMARK)
+    write_entries(cursor, 1, [row(date(2024, 1, 30), ACTIVITIES)], overwrite=False)
+    [(sql, _)] = cursor.writes('mood_archive')
+    assert 'INSERT IGNORE' in sql and 'ON DUPLICATE KEY UPDATE' not in sql
+
+
+class RecordingDb:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cursor(self):
+        return self._cursor
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def analytics_cursor(monkeypatch):
+    def use(watermark):
+        cursor = RecordingCursor(watermark)
+        monkeypatch.setattr(app, 'get_db', lambda **kwargs: RecordingDb(cursor))
+        return cursor
+    if app.admission_controller:
+        monkeypatch.setattr(app.admission_controller, 'store', admission.MemoryStore())
+    return use
+
+
+def get_analytics(start, end):
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+    return client.get(f'/api/analytics?start={start}&end={end}')
+
+
+def test_analytics_reaching_before_the_watermark_reads_the_archive(analytics_cursor):
+    cursor = analytics_cursor(WATERMARK)
+    assert get_analytics('2024-01-01', '2024-02-15').status_code == 200
+    sql, params = cursor.statements[-1]
+    assert sql == ANALYTICS_ARCHIVE_QUERY
+    assert params == (1, date(2024, 1, 1), date(2024, 2, 15), WATERMARK) * 2
+
+
+@pytest.mark.parametrize('watermark', [None, WATERMARK])
+def test_analytics_after_the_watermark_reads_only_the_live_tables(analytics_cursor, watermark):
+    cursor = analytics_cursor(watermark)
+    assert get_analytics('2024-02-01', '2024-02-15').status_code == 200
+    sql, params = cursor.statements[-1]
+    assert sql.startswith(ANALYTICS_LIVE_QUERY) and 'mood_archive' not in sql
+    assert params == (1, date(2024, 2, 1), date(2024, 2, 15))
+
+
+def insert_columns(sql):
+    return [column.strip() for column in re.search(r'mood_archive \(([^)]*)\)', sql).group(1).split(',')]
+
+
+def updated_columns(sql):
+    return re.findall(r'(\w+) = VALUES\(\1\)', sql)
+
+
+def test_first_copy_keeps_archived_days():
+    cursor = RecordingCursor(rowcounts=[3, 1])
+    assert archive_entries.copy_range(cursor, date(2024, 1, 1), date(2024, 2, 1)) == 4
+    for sql, params in cursor.statements:
+        assert 'INSERT IGNORE INTO mood_archive' in sql and 'ON DUPLICATE KEY UPDATE' not in sql
+        assert params == (date(2024, 1, 1), date(2024, 2, 1))
+
+
+def test_second_copy_overwrites_every_copied_column():
+    cursor = RecordingCursor(rowcounts=[4, 0])
+    assert archive_entries.copy_range(cursor, date(2024, 1, 1), date(2024, 2, 1), overwrite=True) == 4
+
+    moods, activity_only = [sql for sql, _ in cursor.statements]
+    for sql in (moods, activity_only):
+        assert re.search(r'INSERT\s+INTO mood_archive', sql)
+        # Everything but the (user_id, entry_date) key is replaced by the live row
+        assert updated_columns(sql) == [column for column in insert_columns(sql)
+                                        if column not in ('user_id', 'entry_date')]
+    assert 'm.user_id IS NULL' in activity_only
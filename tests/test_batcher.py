@@ -0,0 +1,125 @@
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import app
+import sentiment_stub
+from app import CircuitBreaker, LocalSentimentBackend, RemoteSentimentBackend, SentimentBatcher, SentimentCache
+
+
+@pytest.fixture
+def stub():
+    """sentiment_stub on a free port; set latency/error_rate on the returned handler class"""
+    handler = type('Handler', (sentiment_stub.StubHandler,), {})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    # Timed-out requests hang up before the stub answers; that's expected here
+    server.handle_error = lambda request, client_address: None
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    sentiment_stub.stats.update(requests=0, inputs=0)
+    handler.url = f'http://127.0.0.1:{server.server_address[1]}/'
+    yield handler
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_batcher(stub):
+    batchers = []
+
+    def make(**kwargs):
+        options = dict(max_batch=16, window=0.05, concurrency=2, timeout=5.0, retries=0)
+        options.update(kwargs)
+        batcher = SentimentBatcher(stub.url, 'stub', **options)
+        batchers.append(batcher)
+        return batcher
+
+    yield make
+    for batcher in batchers:
+        batcher.shutdown()
+
+
+def label(scores):
+    return app.format_sentiment(scores)['label']
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_concurrent_submits_share_one_request(make_batcher):
+    batcher = make_batcher(window=0.2)
+    futures = [batcher.submit(f'note {i}') for i in range(5)]
+    assert all(future.result(timeout=5) for future in futures)
+    assert sentiment_stub.stats == {'requests': 1, 'inputs': 5}
+    assert batcher.metrics()['largest_batch'] == 5
+
+
+def test_full_batch_is_sent_before_the_window_closes(make_batcher):
+    batcher = make_batcher(max_batch=3, window=5.0)
+    started = time.monotonic()
+    futures = [batcher.submit(f'note {i}') for i in range(3)]
+    for future in futures:
+        future.result(timeout=5)
+    assert time.monotonic() - started < 2.0
+    assert sentiment_stub.stats == {'requests': 1, 'inputs': 3}
+
+
+def test_window_closes_a_partial_batch(make_batcher):
+    batcher = make_batcher(max_batch=16, window=0.1)
+    started = time.monotonic()
+    batcher.submit('just one note').result(timeout=5)
+    assert time.monotonic() - started >= 0.1
+    assert sentiment_stub.stats == {'requests': 1, 'inputs': 1}
+
+
+def test_each_waiter_gets_its_own_result(make_batcher):
+    batcher = make_batcher(window=0.2)
+    notes = ['a happy great day', 'sad and tired', 'went to work', 'a happy great day']
+    futures = [batcher.submit(note) for note in notes]
+    assert [label(future.result(timeout=5)) for future in futures] == ['positive', 'negative', 'neutral', 'positive']
+    # The repeated note is sent once and answered to both waiters
+    assert sentiment_stub.stats == {'requests': 1, 'inputs': 3}
+    assert batcher.metrics()['coalesced'] == 1
+
+
+def fall_back_to_local(monkeypatch, batcher):
+    monkeypatch.setattr(app, 'sentiment_cache', SentimentCache())
+    monkeypatch.setattr(app, 'sentiment_engines', [RemoteSentimentBackend(batcher, 'stub'), LocalSentimentBackend()])
+    return app.submit_sentiment('a wonderful happy day').result(timeout=5)
+
+
+def test_stub_errors_open_the_breaker_and_fall_back(monkeypatch, stub, make_batcher):
+    stub.error_rate = 1.0
+    breaker = CircuitBreaker(min_calls=2, failure_rate=0.5, cooldown=60.0)
+    batcher = make_batcher(window=0.01, breaker=breaker)
+    for i in range(2):
+        with pytest.raises(RuntimeError):
+            batcher.submit(f'note {i}').result(timeout=5)
+    assert breaker.state == 'open'
+
+    requests_sent = sentiment_stub.stats['requests']
+    analysis = fall_back_to_local(monkeypatch, batcher)
+    assert analysis['engine'] == 'local'
+    assert analysis['label'] == 'positive'
+    # The open breaker answers without another request to the model
+    assert sentiment_stub.stats['requests'] == requests_sent
+
+
+def test_stub_timeouts_open_the_breaker_and_fall_back(monkeypatch, stub, make_batcher):
+    stub.latency = 0.5
+    breaker = CircuitBreaker(min_calls=2, failure_rate=0.5, cooldown=60.0)
+    batcher = make_batcher(window=0.01, timeout=0.1, breaker=breaker)
+    for i in range(2):
+        with pytest.raises(Exception):
+            batcher.submit(f'note {i}').result(timeout=5)
+    wait_for(lambda: breaker.state == 'open')
+
+    analysis = fall_back_to_local(monkeypatch, batcher)
+    assert analysis['engine'] == 'local'
+    assert analysis['label'] == 'positive'
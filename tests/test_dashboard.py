@@ -0,0 +1,200 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from datetime import date
+
+import pytest
+
+import admission
+import app
+import async_app
+from app import DashboardCache
+
+
+class FakeDb:
+    """Answers the dashboard's two queries; `version` and `mood` stand in for the user's data"""
+    role = 'primary'
+
+    def __init__(self):
+        self.version = 1
+        self.mood = 5
+        self.opened = 0
+        self.queries = []
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self)
+
+    def close(self):
+        pass
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.rows = []
+
+    def execute(self, sql, params=None):
+        self.db.queries.append(sql)
+        if sql == app.DATA_VERSION_QUERY:
+            self.rows = [{'data_version': self.db.version}]
+        elif sql == app.DASHBOARD_QUERY:
+            self.rows = [{'entry_date': date(2024, 6, 3), 'mood_value': self.db.mood, 'mood_label': 'ok',
+                          'quick_note': None, 'sleep_hours': None, 'exercise_minutes': None,
+                          'social_interaction': None, 'work_stress_level': None,
+                          'current_streak': 1, 'longest_streak': 1}]
+        else:
+            raise AssertionError(f'unexpected query: {sql}')
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return list(self.rows)
+
+    def close(self):
+        pass
+
+
+class AsyncCursor(FakeCursor):
+    async def execute(self, sql, params=None):
+        FakeCursor.execute(self, sql, params)
+
+    async def fetchone(self):
+        return FakeCursor.fetchone(self)
+
+    async def fetchall(self):
+        return FakeCursor.fetchall(self)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+
+class FakePool:
+    def __init__(self, db):
+        self.db = db
+
+    @asynccontextmanager
+    async def acquire(self):
+        self.db.opened += 1
+        yield self
+
+    def cursor(self, cursor_class=None):
+        return AsyncCursor(self.db)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = FakeDb()
+
+    def get_db(**kwargs):
+        db.opened += 1
+        return db
+
+    async def no_insights(user_id, cursor):
+        return []
+
+    monkeypatch.setattr(app, 'get_db', get_db)
+    monkeypatch.setattr(app, 'generate_insights', lambda *args, **kwargs: [])
+    monkeypatch.setattr(async_app, 'db_pool', FakePool(db))
+    monkeypatch.setattr(async_app, 'generate_insights', no_insights)
+    # Fresh rate-limit buckets, so one test's requests don't throttle the next
+    if app.admission_controller:
+        monkeypatch.setattr(app.admission_controller, 'store', admission.MemoryStore())
+    return db
+
+
+@pytest.fixture(params=['mysql', 'shared'])
+def cache(request, monkeypatch, tmp_path):
+    if request.param == 'shared':
+        cache = DashboardCache(db_path=str(tmp_path / 'dashboards.db'), shared_stamps=True)
+    else:
+        cache = DashboardCache()
+    monkeypatch.setattr(app, 'dashboard_cache', cache)
+    return cache
+
+
+def sync_get():
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    def get(etag=None):
+        response = client.get('/api/dashboard', headers={'If-None-Match': etag} if etag else {})
+        return response.status_code, response.headers.get('ETag'), response.get_data()
+    return get
+
+
+def async_get():
+    client = async_app.quart_app.test_client()
+
+    def get(etag=None):
+        async def request():
+            async with client.session_transaction() as sess:
+                sess['user_id'] = 1
+            response = await client.get('/api/dashboard', headers={'If-None-Match': etag} if etag else {})
+            return response.status_code, response.headers.get('ETag'), await response.get_data()
+        return asyncio.run(request())
+    return get
+
+
+@pytest.fixture(params=['sync', 'async'])
+def get(request):
+    return sync_get() if request.param == 'sync' else async_get()
+
+
+def test_unchanged_dashboard_revalidates_to_304(db, cache, get):
+    status, etag, body = get()
+    assert status == 200 and etag and body
+
+    db.queries.clear()
+    status, same_etag, body = get(etag)
+    assert status == 304
+    assert same_etag == etag
+    assert body == b''
+    # Only the version check, never the dashboard query
+    assert app.DASHBOARD_QUERY not in db.queries
+
+
+def test_write_gives_a_new_etag(db, cache, get):
+    _, etag, _ = get()
+    db.version, db.mood = 2, 8
+    cache.invalidate(1)
+
+    status, new_etag, body = get(etag)
+    assert status == 200
+    assert new_etag != etag
+    assert json.loads(body)['mood_data'][0]['mood_value'] == 8
+
+
+def test_shared_stamps_answer_304_without_mysql(db, tmp_path, monkeypatch, get):
+    path = str(tmp_path / 'dashboards.db')
+    monkeypatch.setattr(app, 'dashboard_cache', DashboardCache(db_path=path, shared_stamps=True))
+    _, etag, _ = get()
+
+    db.opened = 0
+    assert get(etag)[0] == 304
+    assert db.opened == 0
+
+    # A write handled by another worker bumps the stamp this one checks
+    db.mood = 8
+    DashboardCache(db_path=path, shared_stamps=True).invalidate(1)
+    status, new_etag, _ = get(etag)
+    assert status == 200
+    assert new_etag != etag
+    assert db.opened == 1
+
+
+def test_build_that_raced_a_write_is_not_served(tmp_path):
+    cache = DashboardCache(db_path=str(tmp_path / 'dashboards.db'), shared_stamps=True)
+    stamp = cache.stamp(1)
+    cache.invalidate(1)  # the write commits while the old data is being rendered
+    cache.put(1, stamp, '{"old": true}')
+    assert cache.get(1, cache.stamp(1)) is None
+
+
+def test_shared_stamps_need_a_file():
+    with pytest.raises(ValueError):
+        DashboardCache(shared_stamps=True)
@@ -0,0 +1,150 @@
+import csv
+import io
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+
+import admission
+import app
+from app import EXPORT_ARCHIVE_QUERY, EXPORT_LIVE_QUERY, export_pages
+
+
+def entry(day, mood=5):
+    """A row as the export queries select it"""
+    return (day, timedelta(hours=12), mood, 'Okay', 'note', Decimal('0.25'),
+            Decimal('7.5'), 30, 1, 2, 4)
+
+
+class ExportDb:
+    """mood_archive and the live tables as lists of rows; the cursor answers the keyset queries"""
+
+    def __init__(self, archive=(), live=(), watermark=None):
+        self.archive = list(archive)
+        self.live = list(live)
+        self.watermark = watermark
+        self.queries = []
+
+    def cursor(self):
+        return ExportCursor(self)
+
+    def close(self):
+        pass
+
+
+class ExportCursor:
+    def __init__(self, db):
+        self.db = db
+        self.rows = []
+
+    def execute(self, sql, params=None):
+        self.db.queries.append((sql, params))
+        if sql.startswith('SELECT watermark FROM job_watermarks'):
+            self.rows = [(self.db.watermark,)] if self.db.watermark else []
+            return
+        user_id, after, bound, limit = params
+        if sql == EXPORT_ARCHIVE_QUERY:
+            rows = [row for row in self.db.archive if after < row[0] < bound]
+        elif sql == EXPORT_LIVE_QUERY:
+            rows = [row for row in self.db.live if row[0] > after and row[0] >= bound]
+        else:
+            raise AssertionError(f'unexpected query: {sql}')
+        self.rows = sorted(rows)[:limit]
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def use_db(monkeypatch):
+    def use(db):
+        monkeypatch.setattr(app, 'get_db', lambda **kwargs: db)
+        return db
+    return use
+
+
+def days(start, count):
+    return [start + timedelta(days=i) for i in range(count)]
+
+
+def exported_dates(pages):
+    return [row['entry_date'] for page in pages for row in page]
+
+
+def test_pages_follow_the_keyset_without_gaps_or_repeats(use_db):
+    db = use_db(ExportDb(live=[entry(day) for day in days(date(2024, 1, 1), 5)]))
+    pages = list(export_pages(1, page_size=2))
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert exported_dates(pages) == [day.isoformat() for day in days(date(2024, 1, 1), 5)]
+    # Each page starts after the last date of the one before
+    assert [params[1] for sql, params in db.queries if sql == EXPORT_LIVE_QUERY] == \
+        [date.min, date(2024, 1, 2), date(2024, 1, 4)]
+
+
+def test_full_last_page_costs_one_empty_query(use_db):
+    db = use_db(ExportDb(live=[entry(day) for day in days(date(2024, 1, 1), 4)]))
+    assert [len(page) for page in export_pages(1, page_size=2)] == [2, 2]
+    assert len([sql for sql, _ in db.queries if sql == EXPORT_LIVE_QUERY]) == 3
+
+
+def test_archive_comes_first_and_stragglers_below_the_watermark_are_skipped(use_db):
+    watermark = date(2024, 2, 1)
+    archive = [entry(day, mood=3) for day in days(date(2024, 1, 29), 3)]
+    # Jan 31 is still in the live tables during the archiver's grace period
+    live = [entry(date(2024, 1, 31), mood=9)] + [entry(day, mood=7) for day in days(watermark, 3)]
+    use_db(ExportDb(archive, live, watermark))
+
+    pages = list(export_pages(1, page_size=2))
+    assert exported_dates(pages) == ['2024-01-29', '2024-01-30', '2024-01-31',
+                                     '2024-02-01', '2024-02-02', '2024-02-03']
+    rows = [row for page in pages for row in page]
+    assert [row['mood_value'] for row in rows] == [3, 3, 3, 7, 7, 7]
+    # Pages don't span the two sources
+    assert [len(page) for page in pages] == [2, 1, 2, 1]
+
+
+def test_values_are_json_ready(use_db):
+    use_db(ExportDb(live=[entry(date(2024, 1, 1))]))
+    row = next(export_pages(1))[0]
+    assert row['entry_time'] == '12:00:00'
+    assert row['sentiment_score'] == 0.25 and row['sleep_hours'] == 7.5
+    assert json.loads(json.dumps(row)) == row
+
+
+@pytest.fixture
+def client(monkeypatch):
+    if app.admission_controller:
+        monkeypatch.setattr(app.admission_controller, 'store', admission.MemoryStore())
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+    return client
+
+
+def test_export_streams_ndjson_and_csv(use_db, client):
+    watermark = date(2024, 2, 1)
+    use_db(ExportDb([entry(date(2024, 1, 31))], [entry(day) for day in days(watermark, 3)], watermark))
+    expected = ['2024-01-31', '2024-02-01', '2024-02-02', '2024-02-03']
+
+    response = client.get('/api/export')
+    assert response.status_code == 200
+    assert response.headers['Content-Disposition'] == 'attachment; filename=mood-history.ndjson'
+    lines = response.get_data(as_text=True).splitlines()
+    assert [json.loads(line)['entry_date'] for line in lines] == expected
+
+    response = client.get('/api/export?format=csv')
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [row['entry_date'] for row in rows] == expected
+    assert list(rows[0]) == app.EXPORT_COLUMNS
+
+
+def test_unknown_format_is_rejected(client):
+    response = client.get('/api/export?format=xml')
+    assert response.status_code == 400
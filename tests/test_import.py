@@ -0,0 +1,152 @@
+import io
+from datetime import date, time, timedelta
+
+import pytest
+
+import admission
+import app
+from app import QUICK_NOTE_MAX_BYTES, UnreadableUpload, parse_import_row, read_import_rows
+
+
+def test_minimal_row():
+    row = parse_import_row({'entry_date': '2024-03-01', 'mood_value': '7'})
+    assert row == {
+        'entry_date': date(2024, 3, 1),
+        'entry_time': time(12, 0),
+        'mood_value': 7,
+        'mood_label': '',
+        'quick_note': '',
+        'activities': None
+    }
+
+
+def test_full_row():
+    row = parse_import_row({
+        'entry_date': '2024-03-01', 'entry_time': '08:30', 'mood_value': 6, 'mood_label': 'Okay',
+        'quick_note': 'fine', 'sleep_hours': '7.5', 'exercise_minutes': '30', 'social_interaction': 'yes',
+        'caffeine_intake': '2', 'work_stress_level': '4'
+    })
+    assert row['entry_time'] == time(8, 30)
+    assert row['activities'] == {'sleep_hours': 7.5, 'exercise_minutes': 30, 'social_interaction': True,
+                                 'caffeine_intake': 2, 'work_stress_level': 4}
+
+
+@pytest.mark.parametrize('mood_value', ['7', '7.0', 7, 7.0, ' 7 '])
+def test_whole_mood_values_in_any_spelling(mood_value):
+    assert parse_import_row({'entry_date': '2024-03-01', 'mood_value': mood_value})['mood_value'] == 7
+
+
+def test_empty_values_count_as_missing():
+    row = parse_import_row({'entry_date': '2024-03-01', 'mood_value': '5', 'sleep_hours': '', 'entry_time': None})
+    assert row['activities'] is None
+    assert row['entry_time'] == time(12, 0)
+
+
+@pytest.mark.parametrize('raw, error', [
+    ([1, 2], 'row must be an object'),
+    ({'mood_value': 5}, 'entry_date is required'),
+    ({'entry_date': '01/03/2024', 'mood_value': 5}, 'entry_date must be YYYY-MM-DD'),
+    ({'entry_date': (date.today() + timedelta(days=1)).isoformat(), 'mood_value': 5}, 'entry_date is in the future'),
+    ({'entry_date': '2024-03-01'}, 'mood_value is required'),
+    ({'entry_date': '2024-03-01', 'mood_value': 'great'}, 'mood_value must be a whole number'),
+    ({'entry_date': '2024-03-01', 'mood_value': 7.5}, 'mood_value must be a whole number'),
+    ({'entry_date': '2024-03-01', 'mood_value': '7.5'}, 'mood_value must be a whole number'),
+    ({'entry_date': '2024-03-01', 'mood_value': True}, 'mood_value must be a whole number'),
+    ({'entry_date': '2024-03-01', 'mood_value': [7]}, 'mood_value must be a whole number'),
+    ({'entry_date': '2024-03-01', 'mood_value': 'nan'}, 'mood_value must be a whole number'),
+    ({'entry_date': '2024-03-01', 'mood_value': 11}, 'mood_value must be between 1 and 10'),
+    ({'entry_date': '2024-03-01', 'mood_value': 5, 'entry_time': '25:00'}, 'entry_time must be HH:MM or HH:MM:SS'),
+    ({'entry_date': '2024-03-01', 'mood_value': 5, 'entry_time': 'noon'}, 'entry_time must be HH:MM or HH:MM:SS'),
+    ({'entry_date': '2024-03-01', 'mood_value': 5, 'entry_time': '08:00+02:00'},
+     'entry_time must not have a time zone'),
+    ({'entry_date': '2024-03-01', 'mood_value': 5, 'quick_note': 'x' * (QUICK_NOTE_MAX_BYTES + 1)},
+     'quick_note is too long'),
+    ({'entry_date': '2024-03-01', 'mood_value': 5, 'sleep_hours': 'lots'}, 'activity fields must be numbers'),
+    ({'entry_date': '2024-03-01', 'mood_value': 5, 'sleep_hours': '30'}, 'sleep_hours must be between 0 and 24'),
+    ({'entry_date': '2024-03-01', 'mood_value': 5, 'exercise_minutes': '-5'},
+     'exercise_minutes must be between 0 and 1440'),
+    ({'entry_date': '2024-03-01', 'mood_value': 5, 'caffeine_intake': '500'},
+     'caffeine_intake must be between 0 and 50'),
+    ({'entry_date': '2024-03-01', 'mood_value': 5, 'work_stress_level': '0'},
+     'work_stress_level must be between 1 and 10'),
+])
+def test_bad_rows_raise_a_readable_error(raw, error):
+    with pytest.raises(ValueError) as raised:
+        parse_import_row(raw)
+    assert str(raised.value) == error
+
+
+def test_long_labels_are_truncated():
+    row = parse_import_row({'entry_date': '2024-03-01', 'mood_value': 5, 'mood_label': 'x' * 80})
+    assert len(row['mood_label']) == 50
+
+
+def rows(body, fmt):
+    return list(read_import_rows(io.BytesIO(body), fmt))
+
+
+def test_bad_json_lines_are_row_errors():
+    read = rows(b'{"entry_date": "2024-03-01", "mood_value": 5}\n\n{oops\n' + b'[' * 100000 + b'\n', 'ndjson')
+    assert [line for line, _ in read] == [1, 3, 4]
+    assert isinstance(read[0][1], dict)
+    assert all(isinstance(raw, ValueError) for _, raw in read[1:])
+
+
+@pytest.mark.parametrize('body, fmt, error', [
+    (b'{"entry_date": "2024-03-01", "mood_value": 5}\n{"quick_note": "\xff"}\n', 'ndjson', 'not valid UTF-8'),
+    (b'entry_date,mood_value\n2024-03-01,5\n2024-03-02,\xe9\n', 'csv', 'not valid UTF-8'),
+    (b'entry_date,mood_value,quick_note\n2024-03-01,5,\n2024-03-02,6,' + b'x' * 200000 + b'\n', 'csv',
+     'invalid CSV after line 2: field larger than field limit'),
+])
+def test_unreadable_uploads_raise(body, fmt, error):
+    with pytest.raises(UnreadableUpload) as raised:
+        rows(body, fmt)
+    assert error in str(raised.value)
+
+
+class ImportDb:
+    in_transaction = False
+
+    def cursor(self):
+        return self
+
+    def close(self):
+        pass
+
+    def start_transaction(self):
+        pass
+
+    def commit(self):
+        pass
+
+
+@pytest.fixture
+def client(monkeypatch):
+    written = []
+    monkeypatch.setattr(app, 'get_db', lambda **kwargs: ImportDb())
+    monkeypatch.setattr(app, 'write_entries', lambda cursor, user_id, chunk: written.extend(chunk))
+    monkeypatch.setattr(app, 'rebuild_streak', lambda cursor, user_id: None)
+    monkeypatch.setattr(app, 'invalidate_user_caches', lambda user_id: None)
+    if app.admission_controller:
+        monkeypatch.setattr(app.admission_controller, 'store', admission.MemoryStore())
+    client = app.app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+    client.written = written
+    return client
+
+
+def test_import_reports_row_errors(client):
+    body = b'{"entry_date": "2024-03-01", "mood_value": "7.0"}\n{"entry_date": "2024-03-02", "mood_value": 7.5}\n'
+    response = client.post('/api/import', data=body)
+    assert response.status_code == 200
+    assert response.json['rows_imported'] == 1
+    assert response.json['errors'] == [{'line': 2, 'error': 'mood_value must be a whole number'}]
+    assert [row['mood_value'] for row in client.written] == [7]
+
+
+def test_undecodable_upload_is_a_bad_request(client):
+    response = client.post('/api/import?format=csv', data=b'entry_date,mood_value\n2024-03-01,\xff\n')
+    assert response.status_code == 400
+    assert not response.json['success']
+    assert 'not valid UTF-8' in response.json['error']
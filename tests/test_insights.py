@@ -0,0 +1,44 @@
+from datetime import date, timedelta
+
+import insights
+
+
+def window(days=30, start=date(2024, 6, 1)):
+    """Mood two points higher on workout days; sleep and stress are noise"""
+    rows = []
+    for i in range(days):
+        exercise = 30 if i % 2 else 0
+        mood = 7 + (i % 3 == 0) if exercise else 5 - (i % 3 == 0)
+        rows.append((start + timedelta(days=i), mood, 7.0 + (i % 4) / 2, exercise, 0, 1, 1 + (i * 7) % 10))
+    return rows
+
+
+def test_too_few_days_gives_no_insights():
+    assert insights.evaluate(window(days=insights.MIN_DAYS - 1)) == []
+
+
+def test_finds_the_exercise_effect():
+    results = insights.evaluate(window())
+    assert results
+    top = results[0]
+    assert top['title'] == 'Exercise Mood Boost'
+    assert top['confidence_level'] == 'high'
+    assert top['days'] == 30
+    low, high = top['interval']
+    assert 0 < low <= high
+
+
+def test_same_seed_gives_the_same_results():
+    assert insights.evaluate(window(), seed=3) == insights.evaluate(window(), seed=3)
+
+
+def test_unrecorded_activities_are_skipped():
+    rows = [(day, mood, None, exercise, None, None, None) for day, mood, _, exercise, *_ in window()]
+    titles = [result['title'] for result in insights.evaluate(rows)]
+    assert titles == ['Exercise Mood Boost']
+
+
+def test_evaluate_user_is_deterministic_per_user_and_day():
+    rows, day = window(), date(2024, 7, 1)
+    assert insights.evaluate_user(7, rows, day) == insights.evaluate_user(7, rows, day)
+    assert insights.evaluate_user(7, rows, day) == insights.evaluate(rows, seed=[7, len(rows), day.toordinal()])
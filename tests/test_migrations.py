@@ -0,0 +1,79 @@
+import os
+import re
+import runpy
+import sys
+import types
+
+import pytest
+
+import app
+import migrations
+
+
+class FakeCursor:
+    """An empty database: no tables, columns or partitions; records every statement"""
+
+    def __init__(self, applied=()):
+        self.applied = list(applied)
+        self.statements = []
+        self.last = ''
+        self.params = ()
+
+    def execute(self, sql, params=None):
+        self.statements.append(sql)
+        self.last = sql
+        self.params = params or ()
+
+    def fetchone(self):
+        if 'GET_LOCK' in self.last:
+            return (1,)
+        if 'schema_migrations' in self.params:
+            return (1,) if self.applied else (0,)
+        return (0,)
+
+    def fetchall(self):
+        if self.last.startswith('SELECT version FROM schema_migrations'):
+            return [(version,) for version in self.applied]
+        return []
+
+
+def procedures(cursor):
+    return [sql for sql in cursor.statements if 'CREATE PROCEDURE' in sql]
+
+
+def test_every_migration_has_its_own_code():
+    functions = [apply for _, _, apply in migrations.MIGRATIONS]
+    assert len(set(functions)) == len(functions)
+
+
+def test_migrations_run_without_the_app(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'app', None)  # any `import app` now fails
+    cursor = FakeCursor()
+    migrations.migrate(cursor)
+    assert procedures(cursor) == [migrations.SAVE_MOOD_ENTRY_V7, migrations.SAVE_MOOD_ENTRY_V12,
+                                  migrations.SAVE_MOOD_ENTRY_V14, migrations.SAVE_MOOD_ENTRY_V17]
+
+
+def test_latest_procedure_takes_the_apps_call_arguments():
+    cursor = FakeCursor()
+    migrations.migrate(cursor)
+    parameters = re.findall(r'\bIN p_\w+', procedures(cursor)[-1])
+    assert len(parameters) == app.SAVE_MOOD_CALL.count('%s')
+
+
+def test_pending_versions():
+    everything = [version for version, _, _ in migrations.MIGRATIONS]
+    assert migrations.pending_versions(FakeCursor()) == everything
+    assert migrations.pending_versions(FakeCursor(applied=everything)) == []
+    assert migrations.pending_versions(FakeCursor(applied=everything[:-1])) == [migrations.LATEST_VERSION]
+
+
+def test_gunicorn_refuses_to_start_on_an_old_schema(monkeypatch):
+    monkeypatch.setattr(os, 'environ', dict(os.environ))  # the config sets pool sizes with setdefault
+    config = runpy.run_path(os.path.join(os.path.dirname(__file__), '..', 'gunicorn.conf.py'))
+    monkeypatch.setattr(app, 'pending_migrations', lambda: [('localhost/mood_journal_db', [17])])
+    errors = []
+    server = types.SimpleNamespace(log=types.SimpleNamespace(error=errors.append, warning=errors.append))
+    with pytest.raises(SystemExit):
+        config['when_ready'](server)
+    assert 'python migrations.py' in errors[0]
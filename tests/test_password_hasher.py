@@ -0,0 +1,114 @@
+import pytest
+
+import app
+from app import HasherBusy, PasswordHasher
+
+
+class SettingsCursor:
+    """app_settings as a dict; `racing` is stored by another process just before our INSERT lands"""
+
+    def __init__(self, settings, racing=None):
+        self.settings = settings
+        self.racing = racing
+        self.row = None
+        self.inserts = 0
+
+    def execute(self, sql, params=None):
+        if sql.startswith('SELECT value FROM app_settings'):
+            value = self.settings.get('bcrypt_rounds')
+            self.row = None if value is None else (value,)
+        elif sql.startswith('INSERT IGNORE INTO app_settings'):
+            self.inserts += 1
+            if self.racing is not None:
+                self.settings['bcrypt_rounds'] = self.racing
+            self.settings.setdefault('bcrypt_rounds', params[0])
+        else:
+            raise AssertionError(f'unexpected query: {sql}')
+
+    def fetchone(self):
+        return self.row
+
+    def close(self):
+        pass
+
+
+class SettingsDb:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cursor(self):
+        return self._cursor
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    """Runs stored_rounds() against a fake app_settings; returns (settings dict, cursor, calibrations)"""
+    def use(stored=None, racing=None, measured=12):
+        values = {} if stored is None else {'bcrypt_rounds': stored}
+        cursor = SettingsCursor(values, racing)
+        calibrations = []
+        monkeypatch.setattr(app, 'get_db', lambda **kwargs: SettingsDb(cursor))
+        monkeypatch.setattr(app, 'calibrate_rounds', lambda target_ms: calibrations.append(target_ms) or measured)
+        return values, cursor, calibrations
+    return use
+
+
+def test_stored_cost_is_used_without_calibrating(settings):
+    _, cursor, calibrations = settings(stored='13')
+    assert app.stored_rounds(250) == 13
+    assert calibrations == [] and cursor.inserts == 0
+
+
+def test_first_process_calibrates_and_stores_the_cost(settings):
+    values, _, calibrations = settings()
+    assert app.stored_rounds(250) == 12
+    assert calibrations == [250]
+    assert values == {'bcrypt_rounds': '12'}
+
+
+def test_process_that_loses_the_race_uses_the_stored_cost(settings):
+    values, _, _ = settings(racing='11', measured=12)
+    assert app.stored_rounds(250) == 11
+    assert values == {'bcrypt_rounds': '11'}
+
+
+def test_cost_is_calibrated_once_and_lazily(caplog):
+    calls = []
+    hasher = PasswordHasher(calibrate=lambda target_ms: calls.append(target_ms) or 11, target_ms=100)
+    assert hasher.metrics()['rounds'] is None
+    with caplog.at_level('INFO', logger=app.app.logger.name):
+        assert hasher.rounds == 11
+        assert hasher.rounds == 11
+    assert calls == [100]
+    assert [record.getMessage() for record in caplog.records] == ['bcrypt cost calibrated to 11 rounds (target 100ms)']
+
+
+def test_needs_rehash_only_upgrades():
+    hasher = PasswordHasher(rounds=12)
+    assert hasher.needs_rehash('$2b$10$' + 'x' * 53)
+    assert not hasher.needs_rehash('$2b$12$' + 'x' * 53)
+    assert not hasher.needs_rehash('$2b$14$' + 'x' * 53)
+    assert hasher.needs_rehash('not a bcrypt hash')
+
+
+def test_hash_and_check_round_trip():
+    hasher = PasswordHasher(rounds=4, workers=1)
+    try:
+        password_hash = hasher.hash('secret')
+        assert password_hash.startswith('$2b$04$')
+        assert hasher.check('secret', password_hash)
+        assert not hasher.check('wrong', password_hash)
+    finally:
+        hasher.shutdown()
+
+
+def test_full_queue_is_rejected_with_hasher_busy():
+    hasher = PasswordHasher(rounds=4, workers=1, max_queue=0)
+    with pytest.raises(HasherBusy):
+        hasher.hash('secret')
+    with pytest.raises(HasherBusy):
+        hasher.check('secret', '$2b$04$' + 'x' * 53)
+    assert hasher.metrics()['rejected'] == 2
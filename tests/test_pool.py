@@ -0,0 +1,122 @@
+import mysql.connector
+import pytest
+
+from app import ConnectionPool
+
+
+class FakeConnection:
+    def __init__(self):
+        self.alive = True
+        self.in_transaction = False
+        self.rolled_back = 0
+        self.closed = False
+        self.broken = False
+
+    def is_connected(self):
+        return self.alive
+
+    def rollback(self):
+        if self.broken:
+            raise mysql.connector.errors.OperationalError('connection lost')
+        self.rolled_back += 1
+        self.in_transaction = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakePool(ConnectionPool):
+    """A pool whose connections are FakeConnections, in the order they were opened"""
+
+    def __init__(self, **kwargs):
+        super().__init__({'host': 'fake', 'database': 'fake'}, **kwargs)
+        self.opened = []
+
+    def _connect(self):
+        conn = FakeConnection()
+        self.opened.append(conn)
+        with self._lock:
+            self.stats['created'] += 1
+        return conn
+
+
+def test_idle_connections_are_reused():
+    pool = FakePool(size=2)
+    first = pool.acquire()
+    first.close()
+    second = pool.acquire()
+    assert second._conn is pool.opened[0]
+    assert pool.metrics()['created'] == 1
+
+
+def test_acquire_times_out_when_every_connection_is_out():
+    pool = FakePool(size=1, timeout=0.05)
+    held = pool.acquire()
+    with pytest.raises(mysql.connector.errors.PoolError):
+        pool.acquire()
+    assert pool.metrics()['timeouts'] == 1
+
+    held.close()
+    pool.acquire().close()
+    assert pool.metrics()['in_use'] == 0
+
+
+def test_closing_twice_returns_the_connection_once():
+    pool = FakePool(size=1, timeout=0.05)
+    conn = pool.acquire()
+    conn.close()
+    conn.close()
+    pool.acquire()
+    with pytest.raises(mysql.connector.errors.PoolError):
+        pool.acquire()
+
+
+def test_dead_connection_is_replaced_on_borrow():
+    pool = FakePool(size=1)
+    pool.acquire().close()
+    pool.opened[0].alive = False
+
+    conn = pool.acquire()
+    assert conn._conn is pool.opened[1]
+    assert pool.opened[0].closed
+    assert pool.metrics()['dead_on_borrow'] == 1
+
+
+def test_release_rolls_back_an_open_transaction():
+    pool = FakePool(size=1)
+    conn = pool.acquire()
+    conn._conn.in_transaction = True
+    conn.close()
+
+    assert pool.opened[0].rolled_back == 1
+    assert pool.acquire()._conn is pool.opened[0]
+
+
+def test_connection_that_fails_to_roll_back_is_dropped():
+    pool = FakePool(size=1, timeout=0.05)
+    conn = pool.acquire()
+    conn._conn.in_transaction = True
+    conn._conn.broken = True
+    conn.close()
+
+    assert pool.opened[0].closed
+    # The slot came back even though the connection didn't
+    assert pool.acquire()._conn is pool.opened[1]
+
+
+def test_old_connections_are_recycled():
+    pool = FakePool(size=1, max_lifetime=60)
+    conn = pool.acquire()
+    conn.created_at -= 120
+    conn.close()
+
+    assert pool.opened[0].closed
+    assert pool.metrics()['recycled'] == 1
+    assert pool.acquire()._conn is pool.opened[1]
+
+
+def test_warm_opens_idle_connections_up_to_the_pool_size():
+    pool = FakePool(size=3)
+    assert pool.warm(5) == 3
+    assert pool.metrics()['in_use'] == 0
+    assert len(pool.opened) == 3
@@ -0,0 +1,124 @@
+import mysql.connector
+
+from app import ReplicaRouter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class HeartbeatPool:
+    """The primary keeps the heartbeat it was sent; a replica answers with `applied` (how far it has replayed)"""
+
+    def __init__(self, host, applied=None):
+        self.config = {'host': host}
+        self.applied = applied
+        self.heartbeat = None
+        self.down = False
+
+    def acquire(self):
+        if self.down:
+            raise mysql.connector.errors.InterfaceError('connection refused')
+        return self
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        if sql.strip().startswith('INSERT INTO replication_heartbeat'):
+            self.heartbeat = params[0]
+
+    def fetchone(self):
+        return None if self.applied is None else (self.applied,)
+
+    def close(self):
+        pass
+
+
+class Router(ReplicaRouter):
+    """No monitor thread: tests call check() themselves"""
+
+    def _start(self):
+        pass
+
+
+def make_router(clock, *applied, max_lag=5.0):
+    primary = HeartbeatPool('primary')
+    replicas = [HeartbeatPool(f'replica{i}', ts) for i, ts in enumerate(applied)]
+    return Router(primary, replicas, max_lag=max_lag, clock=clock), primary, replicas
+
+
+def test_no_reads_go_to_replicas_before_the_first_check():
+    router, _, _ = make_router(Clock(), 1000.0)
+    assert router.choose() is None
+    assert router.metrics()['primary_fallbacks'] == 1
+
+
+def test_check_stamps_the_primary_and_measures_lag():
+    clock = Clock()
+    router, primary, _ = make_router(clock, 998.0)
+    router.check()
+    assert primary.heartbeat == 1000.0
+    assert router.metrics()['replicas'] == {'replica0:3306': {'lag': 2.0, 'healthy': True, 'error': None}}
+
+
+def test_replicas_behind_the_lag_cutoff_are_skipped():
+    clock = Clock()
+    router, _, replicas = make_router(clock, 999.0, 990.0)
+    router.check()
+    assert {router.choose() for _ in range(4)} == {replicas[0]}
+
+    replicas[0].applied = 994.0
+    router.check()
+    assert router.choose() is None
+    assert router.metrics()['read_your_writes'] == 0  # nothing usable, so not a read-your-writes fallback
+
+
+def test_reads_rotate_over_fresh_replicas():
+    router, _, replicas = make_router(Clock(), 999.0, 999.5)
+    router.check()
+    assert {router.choose() for _ in range(4)} == set(replicas)
+    assert router.metrics()['replica_reads'] == 4
+
+
+def test_read_your_writes_waits_for_a_replica_that_has_the_write():
+    clock = Clock()
+    router, _, replicas = make_router(clock, 999.0)
+    router.check()
+    written = router.note_write(7)
+    assert router.last_write(7) == written == 1000.0
+    assert router.last_write(8) == 0.0
+
+    # The replica is within the lag cutoff but hasn't replayed the write yet
+    assert router.choose(since=written) is None
+    assert router.choose() is replicas[0]
+    assert router.metrics()['read_your_writes'] == 1
+
+    clock.now += 1
+    replicas[0].applied = 1000.5
+    router.check()
+    assert router.choose(since=written) is replicas[0]
+
+
+def test_unreachable_replica_is_unusable_until_it_answers_again():
+    router, _, replicas = make_router(Clock(), 999.0)
+    replicas[0].down = True
+    router.check()
+    assert router.choose() is None
+    assert router.metrics()['replicas']['replica0:3306']['error'] == 'connection refused'
+
+    replicas[0].down = False
+    router.check()
+    assert router.choose() is replicas[0]
+
+
+def test_write_history_is_bounded():
+    router = Router(HeartbeatPool('primary'), [], max_users=2, clock=Clock())
+    for user_id in (1, 2, 3):
+        router.note_write(user_id)
+    assert router.last_write(1) == 0.0
+    assert router.last_write(3) == 1000.0
@@ -0,0 +1,129 @@
+import app
+import local_sentiment
+from app import CircuitBreaker
+
+
+def test_local_sentiment_labels():
+    assert local_sentiment.score_text('I had a wonderful, happy day')[1] == 'positive'
+    assert local_sentiment.score_text('I feel awful and sad')[1] == 'negative'
+    assert local_sentiment.score_text('I went to the shop')[1] == 'neutral'
+    assert local_sentiment.score_text('')[:2] == (0.0, 'neutral')
+
+
+def test_local_sentiment_negation_flips_the_score():
+    happy = local_sentiment.score_text('I am happy')[0]
+    not_happy = local_sentiment.score_text('I am not happy')[0]
+    assert happy > 0 > not_happy
+
+
+def test_local_sentiment_scores_stay_in_range():
+    notes = ['great great great amazing wonderful', 'terrible awful horrible', 'meh', None]
+    for score, label, confidence in local_sentiment.score_batch(notes):
+        assert -1.0 <= score <= 1.0
+        assert label in ('positive', 'negative', 'neutral')
+        assert 0.5 <= confidence <= 0.95
+
+
+def test_local_sentiment_batch_matches_single_notes():
+    notes = ['so happy today', 'tired and stressed', 'nothing much']
+    assert local_sentiment.score_batch(notes) == [local_sentiment.score_text(note) for note in notes]
+
+
+def test_local_backend_message_follows_label():
+    notes = ['wonderful happy day', 'awful sad day', 'went to work']
+    for analysis in app.LocalSentimentBackend().analyze_batch(notes):
+        assert analysis['message'] == app.sentiment_message(analysis['label'])
+    labels = [analysis['label'] for analysis in app.LocalSentimentBackend().analyze_batch(notes)]
+    assert labels == ['positive', 'negative', 'neutral']
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def breaker(**kwargs):
+    clock = Clock()
+    options = dict(window=30.0, min_calls=4, failure_rate=0.5, slow_ms=1000.0, slow_rate=0.5, cooldown=10.0)
+    options.update(kwargs)
+    return CircuitBreaker(clock=clock, **options), clock
+
+
+def test_breaker_stays_closed_below_min_calls():
+    cb, _ = breaker()
+    for _ in range(3):
+        cb.record(False, 0.1)
+    assert cb.state == 'closed'
+    assert cb.allow()
+
+
+def test_breaker_opens_on_failure_rate():
+    cb, _ = breaker()
+    for ok in (True, False, True, False):
+        cb.record(ok, 0.1)
+    assert cb.state == 'open'
+    assert not cb.allow()
+    assert cb.is_open()
+    assert cb.metrics()['opened'] == 1
+
+
+def test_breaker_opens_on_slow_calls():
+    cb, _ = breaker()
+    for seconds in (0.1, 2.0, 0.1, 2.0):
+        cb.record(True, seconds)
+    assert cb.state == 'open'
+
+
+def test_breaker_forgets_calls_outside_the_window():
+    cb, clock = breaker()
+    cb.record(False, 0.1)
+    cb.record(False, 0.1)
+    clock.now += 31
+    for _ in range(3):
+        cb.record(True, 0.1)
+    cb.record(False, 0.1)
+    assert cb.state == 'closed'
+
+
+def test_half_open_allows_one_probe_then_closes():
+    cb, clock = breaker()
+    for _ in range(4):
+        cb.record(False, 0.1)
+    clock.now += 10
+    assert not cb.is_open()
+    assert cb.allow()
+    assert cb.state == 'half_open'
+    assert not cb.allow()
+    cb.record(True, 0.1)
+    assert cb.state == 'closed'
+    assert cb.allow()
+
+
+def test_failed_probe_reopens():
+    cb, clock = breaker()
+    for _ in range(4):
+        cb.record(False, 0.1)
+    clock.now += 10
+    assert cb.allow()
+    cb.record(False, 0.1)
+    assert cb.state == 'open'
+    assert not cb.allow()
+
+
+def test_shutdown_logs_jobs_that_did_not_finish(monkeypatch, caplog):
+    class Stopped:
+        def drain(self, timeout):
+            return 2
+
+        def shutdown(self):
+            pass
+
+    monkeypatch.setattr(app, 'sentiment_jobs', Stopped())
+    monkeypatch.setattr(app, 'sentiment_batcher', Stopped())
+    monkeypatch.setattr(app, 'password_hasher', Stopped())
+    monkeypatch.setattr(app, 'all_pools', lambda: [])
+    with caplog.at_level('WARNING', logger=app.app.logger.name):
+        app.shutdown(timeout=5)
+    assert [record.getMessage() for record in caplog.records] == ['Shutdown: 2 sentiment jobs did not finish in 5s']
@@ -0,0 +1,65 @@
+from app import SentimentCache
+
+RESULT = {'score': 0.7, 'label': 'positive', 'confidence': 0.8, 'message': 'Your writing shows positive vibes!'}
+
+
+def test_near_identical_notes_share_a_key():
+    cache = SentimentCache()
+    assert cache.normalize('  Great day!!  Really great. ') == 'great day really great'
+    assert cache.key('Great day!') == cache.key('great   day')
+    assert cache.key("didn't sleep") != cache.key('didnt sleep')
+    assert cache.key('great day') != cache.key('great night')
+
+
+def test_hit_after_put_under_a_normalized_key():
+    cache = SentimentCache()
+    cache.put('Feeling happy!', RESULT)
+    assert cache.get('feeling   HAPPY') == RESULT
+    assert cache.get('feeling sad') is None
+    assert cache.metrics()['hits'] == 1
+    assert cache.metrics()['misses'] == 1
+
+
+def test_callers_get_their_own_copy():
+    cache = SentimentCache()
+    cache.put('note', RESULT)
+    cache.get('note')['label'] = 'changed'
+    assert cache.get('note')['label'] == 'positive'
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SentimentCache(max_size=2)
+    cache.put('a', RESULT)
+    cache.put('b', RESULT)
+    cache.get('a')
+    cache.put('c', RESULT)
+    assert cache.get('b') is None
+    assert cache.get('a') and cache.get('c')
+    assert cache.metrics()['evictions'] == 1
+
+
+def test_disk_tier_survives_a_new_process(tmp_path):
+    path = str(tmp_path / 'sentiment.db')
+    SentimentCache(db_path=path).put('Slept well', RESULT)
+
+    restarted = SentimentCache(db_path=path)
+    assert restarted.get('slept well') == RESULT
+    assert restarted.get('slept well') == RESULT
+    stats = restarted.metrics()
+    assert (stats['disk_hits'], stats['hits']) == (1, 1)  # the second read came from memory
+
+
+def test_disk_tier_refills_memory_after_eviction(tmp_path):
+    cache = SentimentCache(max_size=1, db_path=str(tmp_path / 'sentiment.db'))
+    cache.put('first', RESULT)
+    cache.put('second', RESULT)
+    assert cache.get('first') == RESULT
+    assert cache.metrics()['disk_hits'] == 1
+
+
+def test_expired_entries_are_misses_in_both_tiers(tmp_path):
+    path = str(tmp_path / 'sentiment.db')
+    cache = SentimentCache(ttl=-1, db_path=path)
+    cache.put('old note', RESULT)
+    assert cache.get('old note') is None
+    assert SentimentCache(db_path=path).get('old note') is None
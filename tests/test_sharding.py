@@ -0,0 +1,34 @@
+from collections import Counter
+
+from app import HashRing
+
+
+def test_lookup_is_stable():
+    ring = HashRing(['a', 'b', 'c'])
+    assert [ring.lookup(user_id) for user_id in range(500)] == [ring.lookup(user_id) for user_id in range(500)]
+
+
+def test_order_of_names_does_not_matter():
+    first, second = HashRing(['a', 'b', 'c']), HashRing(['c', 'a', 'b'])
+    assert all(first.lookup(user_id) == second.lookup(user_id) for user_id in range(500))
+
+
+def test_keys_spread_over_every_shard():
+    ring = HashRing(['a', 'b', 'c', 'd'])
+    counts = Counter(ring.lookup(user_id) for user_id in range(10000))
+    assert set(counts) == {'a', 'b', 'c', 'd'}
+    assert min(counts.values()) > 10000 / 4 / 2
+
+
+def test_adding_a_shard_only_moves_keys_onto_it():
+    before = HashRing(['a', 'b', 'c'])
+    after = HashRing(['a', 'b', 'c', 'd'])
+    moved = [user_id for user_id in range(10000) if before.lookup(user_id) != after.lookup(user_id)]
+    assert moved
+    assert all(after.lookup(user_id) == 'd' for user_id in moved)
+    assert len(moved) < 10000 / 2
+
+
+def test_single_shard_takes_everything():
+    ring = HashRing(['only'])
+    assert {ring.lookup(user_id) for user_id in range(100)} == {'only'}
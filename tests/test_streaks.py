@@ -0,0 +1,49 @@
+import random
+from datetime import date, timedelta
+from itertools import groupby
+
+from app import streak_runs
+
+
+def sql_recount(dates):
+    """What save_mood_entry's backfill recount computes: consecutive dates share
+    date - ROW_NUMBER() OVER (ORDER BY entry_date), each group is a run, the longest
+    run is MAX(run_length) and the current one is the run with the latest end"""
+    numbered = [(day - timedelta(days=row_number), day) for row_number, day in enumerate(sorted(dates), start=1)]
+    runs = [(len(days), days[-1]) for days in
+            ([day for _, day in group] for _, group in groupby(numbered, key=lambda item: item[0]))]
+    if not runs:
+        return 0, 0
+    current = max(runs, key=lambda run: run[1])[0]
+    return current, max(length for length, _ in runs)
+
+
+def test_empty_history():
+    assert streak_runs([]) == (0, 0)
+
+
+def test_single_day():
+    assert streak_runs([date(2024, 1, 1)]) == (1, 1)
+
+
+def test_current_run_is_the_one_ending_last():
+    days = [date(2024, 1, d) for d in (1, 2, 3, 4, 10, 11)]
+    assert streak_runs(days) == (2, 4)
+
+
+def test_gap_resets_the_current_run():
+    days = [date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 4)]
+    assert streak_runs(days) == (1, 2)
+
+
+def test_runs_cross_month_and_year_boundaries():
+    days = [date(2023, 12, 30), date(2023, 12, 31), date(2024, 1, 1), date(2024, 1, 2)]
+    assert streak_runs(days) == (4, 4)
+
+
+def test_matches_the_procedure_recount():
+    rng = random.Random(7)
+    start = date(2023, 1, 1)
+    for _ in range(200):
+        dates = sorted({start + timedelta(days=rng.randrange(120)) for _ in range(rng.randrange(1, 80))})
+        assert streak_runs(dates) == sql_recount(dates)